@@ -13,10 +13,7 @@ class RandomCardAgent(PlayerAgent):
     """
 
     def play_card(self, cards_in_hand: Iterable[Card], cards_in_trick: List[Card], game_mode: GameMode):
-        # Shuffles the agent's cards and picks the first one that is allowed.
+        # Picks one of the allowed cards at random.
 
-        cards_in_hand = list(cards_in_hand)
-        np.random.shuffle(cards_in_hand)
-
-        return next(c for c in cards_in_hand
-                    if game_mode.is_play_allowed(c, cards_in_hand=cards_in_hand, cards_in_trick=cards_in_trick))
+        valid_cards = list(game_mode.legal_moves(cards_in_hand, cards_in_trick))
+        return valid_cards[np.random.randint(len(valid_cards))]
@@ -0,0 +1,64 @@
+"""
+Registry of all agents by name, used by the entry points (GUI, training and evaluation scripts) to create agents.
+
+The module of an agent is only imported when the agent is first used. In particular, TensorFlow is only loaded when a DQNAgent
+is created, so scripts that only use the other agents start quickly.
+"""
+
+import functools
+import importlib
+from typing import Callable, List, Type
+
+from simulator.player_agent import PlayerAgent
+
+# Agent name -> "module:class".
+_AGENTS = {
+    "random": "agents.dummy.random_card_agent:RandomCardAgent",
+    "static": "agents.dummy.static_policy_agent:StaticPolicyAgent",
+    "rule": "agents.rule_based.rule_based_agent:RuleBasedAgent",
+    "pimc": "agents.search.pimc_agent:PIMCAgent",
+    "ismcts": "agents.search.ismcts_agent:ISMCTSAgent",
+    "dqn": "agents.reinforcment_learning.dqn_agent:DQNAgent",
+    "dqn-inference": "agents.reinforcment_learning.inference_dqn_agent:InferenceDQNAgent",
+    "user": "gui.gui_agent:GUIAgent",
+}
+
+# The class names can be used as well (e.g. in the player_agents of an experiment config).
+_ALIASES = {path.split(":")[1]: name for name, path in _AGENTS.items()}
+
+
+def agent_names() -> List[str]:
+    """
+    The names of all registered agents.
+    """
+    return list(_AGENTS)
+
+
+def agent_class(name: str) -> Type[PlayerAgent]:
+    """
+    Returns the class of an agent, importing its module if necessary.
+    :param name: an agent name (see agent_names()) or the name of the agent class.
+    """
+    path = _AGENTS.get(_ALIASES.get(name, name))
+    if path is None:
+        raise ValueError(f'Unknown agent type: "{name}"')
+    module_name, class_name = path.split(":")
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+def create_agent(name: str, player_id: int, **kwargs) -> PlayerAgent:
+    """
+    Creates an agent.
+    :param name: an agent name (see agent_names()) or the name of the agent class.
+    :param player_id: the player id.
+    :param kwargs: further arguments of the agent's constructor.
+    """
+    return agent_class(name)(player_id, **kwargs)
+
+
+def agent_factory(name: str, **kwargs) -> Callable[[int], PlayerAgent]:
+    """
+    Returns a picklable factory that creates an agent given its player id (e.g. for eval_agent()).
+    The agent's module is only imported by whoever calls the factory.
+    """
+    return functools.partial(create_agent, name, **kwargs)
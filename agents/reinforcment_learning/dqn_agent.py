@@ -1,12 +1,14 @@
 import numpy as np
-from collections import deque
 from typing import Iterable, List, Dict, Optional
 
+import tensorflow as tf
 from overrides import overrides
 from tensorflow.keras import Sequential, Input
 from tensorflow.keras.layers import Dense
 from tensorflow.keras.optimizers import Adam
 
+from agents.reinforcment_learning.replay_buffer import ReplayBuffer
+from agents.reinforcment_learning.state_encoder import StateEncoder
 from simulator.player_agent import PlayerAgent
 from simulator.card_defs import Card, new_deck
 from simulator.game_mode import GameMode
@@ -38,13 +40,10 @@ class DQNAgent(PlayerAgent):
         self._id2card = new_deck()
         self._card2id = {card: i for i, card in enumerate(self._id2card)}
 
-        # Determine length of state vector.
-        state_lens = {
-            "cards_in_hand": 32,
-            "cards_in_trick": 3*32,
-            "cards_already_played": 32
-        }
-        self._state_size = sum(state_lens[x] for x in config["state_contents"])
+        # The state vector (see StateEncoder). It also contains the agent's memory of the cards played so far - this is basically
+        # feature engineering, it would be more interesting to have the agent learn these with an RNN or so!
+        self._state_encoder = StateEncoder(config["state_contents"])
+        self._state_size = self._state_encoder.state_size
 
         # Action space: One action for every card.
         # Naturally, most actions will be invalid because the agent doesn't have the card or is not allowed to play it.
@@ -66,8 +65,12 @@ class DQNAgent(PlayerAgent):
         self._gamma = config["gamma"]
         self._epsilon = config["epsilon"]
 
+        # Double DQN: the Q network selects the best action in the next state, the target network evaluates it.
+        # Reduces the overestimation of Q values that comes from taking the max over noisy estimates.
+        self._double_dqn = config.get("double_dqn", False)
+
         # Experience replay buffer for minibatch learning
-        self.experience_buffer = deque(maxlen=config["experience_buffer_len"])
+        self.experience_buffer = ReplayBuffer(config["experience_buffer_len"], self._state_size, self._action_size)
 
         # Remember the state and action (card) played in the previous trick, so we can can judge it once we receive feedback.
         # Also remember which actions were valid at that time.
@@ -77,8 +80,9 @@ class DQNAgent(PlayerAgent):
         self._in_terminal_state = False
 
         # Create Q network (current state) and Target network (successor state). The networks are synced after every episode (game).
+        # The target network is only needed for training.
         self.q_network = self._build_model()
-        self.target_network = self._build_model()
+        self.target_network = self._build_model() if training else None
         self._align_target_model()
         self._batch_size = config["batch_size"]
 
@@ -89,10 +93,6 @@ class DQNAgent(PlayerAgent):
         self._retrain_every_n = config["retrain_every"]
         self._experiences_since_last_retrain = 0
 
-        # Memory: here are some things the agent remembers between moves. This is basically feature engineering,
-        # it would be more interesting to have the agent learn these with an RNN or so!
-        self._mem_cards_already_played = set()
-
         # For display in the GUI
         self._current_q_vals = None
 
@@ -113,62 +113,14 @@ class DQNAgent(PlayerAgent):
         return model
 
     def _align_target_model(self):
-        self.target_network.set_weights(self.q_network.get_weights())
-
-    def _encode_state(self, cards_in_hand: Iterable[Card], cards_in_trick: List[Card]) -> np.ndarray:
-        # A state contains:
-        # - Cards that the player has in hand (unordered, directly observed)
-        # - Cards that are in the current trick (ordered, directly observed)
-        # - All cards that have been played so far (unordered, engineered feature)
-        #
-        # Future possibilities for features:
-        # - Number of the current trick: not necessary, can be implied from len of cards_in_hand
-        # - Mapping player IDs to cards to GameMode (knowing who is declaring, and then knowing THEY played a specific card)
-        #   - Partially contained in the order of cards_in_trick, but needs initial info about player IDs
-        # - LSTM based memory of played cards, perhaps together with player IDs
-        # - Player scores, or actually a memory of all cards in all previous tricks, mapped to player IDs
-
-        assert len(self._mem_cards_already_played) == 4 * (8-len(list(cards_in_hand)))
-
-        state = np.zeros(shape=self._state_size, dtype=np.int32)
-        offset = 0
-
-        for comp in self.config["state_contents"]:
-            if comp == "cards_in_hand":
-                # 32 bools: cards in own hand (order does not matter)
-                for card in cards_in_hand:
-                    state[offset + self._card2id[card]] = 1
-                offset += 32
-
-            elif comp == "cards_in_trick":
-                # 3x32 bools: cards in current trick before the one to be played by the agent (order is important)
-                for i, card in enumerate(cards_in_trick):
-                    state[offset + i * 32 + self._card2id[card]] = 1
-                offset += 3*32
-
-            elif comp == "cards_already_played":
-                # 1x32 bools: cards that have already been played.
-                # This is an engineered feature which could also be learned by the agent if it had some memory.
-                for card in self._mem_cards_already_played:
-                    state[offset + self._card2id[card]] = 1
-                offset += 32
-
-            else:
-                raise ValueError(r'Unknown state component name: "{x}"')
-
-        assert offset == self._state_size
-        return state
+        if self.target_network is not None:
+            self.target_network.set_weights(self.q_network.get_weights())
 
-    def _encode_action(self, card: Card):
-        action = np.zeros(self._action_size, dtype=np.int32)
-        action[self._card2id[card]] = 1
-        return action
-
-    def _receive_experience(self, state, action, reward, next_state, terminated, available_actions):
+    def _receive_experience(self, state, action_id, reward, next_state, terminated, available_actions):
         # Store the experience into the buffer and retrain the network.
 
         assert self.training is True
-        self.experience_buffer.append((state, action, reward, next_state, terminated, available_actions))
+        self.experience_buffer.append(state, action_id, reward, next_state, terminated, available_actions)
 
         # Only train every n experiences (speed up training)
         self._experiences_since_last_retrain += 1
@@ -177,61 +129,62 @@ class DQNAgent(PlayerAgent):
 
         self._experiences_since_last_retrain = 0
 
-        # Extract one minibatch from the experience replay buffer.
-        indices = np.random.choice(len(self.experience_buffer), size=self._batch_size)
-
-        state_batch = np.empty(shape=(self._batch_size, self._state_size), dtype=np.int32)
-        action_id_batch = np.empty(shape=self._batch_size, dtype=np.int32)
-        reward_batch = np.empty(shape=self._batch_size, dtype=np.float32)
-        next_state_batch = np.empty(shape=(self._batch_size, self._state_size), dtype=np.int32)
-        terminated_batch = np.empty(shape=self._batch_size, dtype=np.bool)
-        available_actions_batch = np.empty(shape=(self._batch_size, self._action_size), dtype=np.bool)
-        for i, index in enumerate(indices):
-            state, action, reward, next_state, terminated, available_actions = self.experience_buffer[index]
-            state_batch[i, :] = state
-            action_id_batch[i] = np.argmax(action)
-            reward_batch[i] = reward
-            next_state_batch[i, :] = next_state
-            terminated_batch[i] = terminated
-            available_actions_batch[i, :] = available_actions
-
-        q_curr = np.array(self.q_network.predict_on_batch(state_batch))
-        q_next = np.array(self.target_network.predict_on_batch(next_state_batch))
+        # Extract one minibatch from the experience replay buffer and train on it.
+        self._train_step(*self.experience_buffer.sample(self._batch_size))
+
+    @tf.function
+    def _train_step(self, state_batch, action_id_batch, reward_batch, next_state_batch, terminated_batch, available_actions_batch):
+        # A single training step on a minibatch, compiled into one graph: computes the targets and applies the gradients.
+        # Returns the loss.
+        state_batch = tf.cast(state_batch, tf.float32)
+        next_state_batch = tf.cast(next_state_batch, tf.float32)
+        action_mask = tf.one_hot(tf.cast(action_id_batch, tf.int32), self._action_size)
 
         # Terminal state: The cumulative future reward is exactly the observation - there are no future steps.
         # Nonterminal state: The expected cumulative future reward is the observation
         #                     + expected reward from the next state under the policy.
-        #                    The amax() means that we expect the policy to pick the best action in the future.
-        nonterminal_filter = (terminated_batch == 0)
-        cumul_reward = reward_batch.copy()
-        cumul_reward[nonterminal_filter] += self._gamma * np.amax(q_next, axis=1)[nonterminal_filter]
-
-        # Update the Q-value for the actions that were experienced. Leave the rest the same.
-        q_target = q_curr.copy()
-        if self._zero_q_for_invalid_actions:            # Except, of course, for when this option is set.
-            q_target *= available_actions_batch
-        q_target[np.arange(self._batch_size), action_id_batch] = cumul_reward
-
-        self.q_network.train_on_batch(state_batch, q_target)
+        #                    The max means that we expect the policy to pick the best action in the future.
+        q_next = self.target_network(next_state_batch, training=False)
+        if self._double_dqn:
+            best_next = tf.argmax(self.q_network(next_state_batch, training=False), axis=1)
+            q_next_best = tf.reduce_sum(q_next * tf.one_hot(best_next, self._action_size), axis=1)
+        else:
+            q_next_best = tf.reduce_max(q_next, axis=1)
+        nonterminal = 1. - tf.cast(terminated_batch, tf.float32)
+        cumul_reward = reward_batch + self._gamma * nonterminal * q_next_best
+
+        with tf.GradientTape() as tape:
+            q_curr = self.q_network(state_batch, training=True)
+
+            # Update the Q-value for the actions that were experienced. Leave the rest the same.
+            q_target = tf.stop_gradient(q_curr)
+            if self._zero_q_for_invalid_actions:            # Except, of course, for when this option is set.
+                q_target *= tf.cast(available_actions_batch, tf.float32)
+            q_target = q_target * (1. - action_mask) + tf.stop_gradient(cumul_reward)[:, tf.newaxis] * action_mask
+
+            loss = tf.reduce_mean(tf.square(q_target - q_curr))
+
+        gradients = tape.gradient(loss, self.q_network.trainable_variables)
+        self.q_network.optimizer.apply_gradients(zip(gradients, self.q_network.trainable_variables))
+        return loss
 
     def play_card(self, cards_in_hand: Iterable[Card], cards_in_trick: List[Card], game_mode: GameMode):
         if self._in_terminal_state:
             raise ValueError("Agent is in terminal state. Did you start a new game? Need to call notify_new_game() first.")
 
         # Encode the current state.
-        state = self._encode_state(cards_in_hand=cards_in_hand, cards_in_trick=cards_in_trick)
+        state = self._state_encoder.encode(cards_in_hand=cards_in_hand, cards_in_trick=cards_in_trick)
 
         # Did a previous action lead to this state? Save experience for training.
         if self.training and self._prev_action is not None:
             # Reward=0: We reward only the terminal state.
-            self._receive_experience(state=self._prev_state, action=self._prev_action, reward=0, next_state=state,
+            self._receive_experience(state=self._prev_state, action_id=self._prev_action, reward=0, next_state=state,
                                      terminated=False, available_actions=self._prev_available_actions)
 
         # Create a mask of available actions.
         available_actions = np.zeros(self._action_size, dtype=np.bool)
-        for card in cards_in_hand:
-            if game_mode.is_play_allowed(card, cards_in_hand=cards_in_hand, cards_in_trick=cards_in_trick):
-                available_actions[self._card2id[card]] = True
+        for card in game_mode.legal_moves(cards_in_hand, cards_in_trick):
+            available_actions[self._card2id[card]] = True
 
         # Pick an action (a card).
         selected_card = None
@@ -257,7 +210,7 @@ class DQNAgent(PlayerAgent):
                     if not available_actions[best_action_ids[0]]:
                         # Did we pick an invalid move? Time for punishment!
                         # Experience: we stay in the same state, but get a negative reward.
-                        self._receive_experience(state=state, action=self._encode_action(selected_card),
+                        self._receive_experience(state=state, action_id=self._card2id[selected_card],
                                                  reward=self._invalid_action_reward,
                                                  next_state=state,
                                                  terminated=False, available_actions=available_actions)
@@ -268,12 +221,11 @@ class DQNAgent(PlayerAgent):
 
         # Store the state and chosen action until the next call (in which we will receive feedback)
         self._prev_state = state
-        self._prev_action = self._encode_action(selected_card)
+        self._prev_action = self._card2id[selected_card]
         self._prev_available_actions = available_actions
 
         # Memory: remember cards that were played.
-        self._mem_cards_already_played.update(cards_in_trick)
-        self._mem_cards_already_played.add(selected_card)
+        self._state_encoder.observe_card(selected_card)
 
         return selected_card
 
@@ -282,7 +234,7 @@ class DQNAgent(PlayerAgent):
         # No aux reward for individual tricks right now.
         # But we do want to remember what players who came after us played!
         # In the future, we may also want to remember the scores of others and ourselves.
-        self._mem_cards_already_played.update(cards_in_trick)
+        self._state_encoder.observe_trick(cards_in_trick)
 
     @overrides
     def notify_game_result(self, won: bool, own_score: int, partner_score: int = None):
@@ -291,7 +243,7 @@ class DQNAgent(PlayerAgent):
         assert self._prev_action is not None and self._prev_state is not None
         if self.training:
             # In the terminal state, there are no cards
-            state = self._encode_state(cards_in_hand=[], cards_in_trick=[])
+            state = self._state_encoder.encode(cards_in_hand=[], cards_in_trick=[])
 
             # Reward is 1.0 for a game won and 0 otherwise.
             # TODO: we may want to increase reward based on total score in the future.
@@ -299,7 +251,7 @@ class DQNAgent(PlayerAgent):
             self._in_terminal_state = True
 
             # Add feedback, sync
-            self._receive_experience(state=self._prev_state, action=self._prev_action, reward=reward, next_state=state,
+            self._receive_experience(state=self._prev_state, action_id=self._prev_action, reward=reward, next_state=state,
                                      terminated=True, available_actions=self._prev_available_actions)
             self._align_target_model()          # The episode is over, sync the models.
 
@@ -314,7 +266,7 @@ class DQNAgent(PlayerAgent):
         self._prev_available_actions = None
         self._in_terminal_state = False
 
-        self._mem_cards_already_played.clear()
+        self._state_encoder.reset()
 
     @overrides
     def internal_card_values(self) -> Optional[Dict[Card, float]]:
@@ -325,6 +277,14 @@ class DQNAgent(PlayerAgent):
         self.logger.info(f'Saving weights to "{filepath}"...')
         self.q_network.save_weights(filepath, overwrite=overwrite)
 
+    def export_weights(self, filepath):
+        # Exports the weights of the Q network to a .npz file, for InferenceDQNAgent (which doesn't need TensorFlow).
+        self.logger.info(f'Exporting weights to "{filepath}"...')
+        arrays = {}
+        for i, layer in enumerate(self.q_network.layers):
+            arrays[f"kernel_{i}"], arrays[f"bias_{i}"] = layer.get_weights()
+        np.savez(filepath, state_contents=np.array(self.config["state_contents"]), **arrays)
+
     def load_weights(self, filepath):
         self.logger.info(f'Loading weights from "{filepath}"...')
         self.q_network.load_weights(filepath)
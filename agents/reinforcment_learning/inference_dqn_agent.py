@@ -0,0 +1,82 @@
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+from overrides import overrides
+
+from agents.reinforcment_learning.state_encoder import StateEncoder
+from simulator.card_defs import Card, new_deck
+from simulator.game_mode import GameMode
+from simulator.player_agent import PlayerAgent
+from utils.log_util import get_class_logger
+
+
+class InferenceDQNAgent(PlayerAgent):
+    """
+    Plays like a trained DQNAgent with training=False (always the valid card with the highest Q value), but without TensorFlow:
+    the forward pass of the Q network is computed with NumPy, in preallocated buffers.
+
+    The weights are exported from a DQNAgent with DQNAgent.export_weights() (see export_dqn_weights.py). The file also contains
+    the state_contents, so no config is needed.
+    """
+
+    def __init__(self, player_id: int, weights_path: str):
+        """
+        :param player_id: The unique id of the player (0-3).
+        :param weights_path: the .npz file written by DQNAgent.export_weights().
+        """
+        super().__init__(player_id)
+        self.logger = get_class_logger(self)
+        self.logger.info(f'Loading weights from "{weights_path}"...')
+
+        with np.load(weights_path) as data:
+            state_contents = [str(x) for x in data["state_contents"]]
+            n_layers = sum(1 for key in data.files if key.startswith("kernel_"))
+            self._kernels = [np.ascontiguousarray(data[f"kernel_{i}"], dtype=np.float32) for i in range(n_layers)]
+            self._biases = [np.ascontiguousarray(data[f"bias_{i}"], dtype=np.float32) for i in range(n_layers)]
+
+        self._state_encoder = StateEncoder(state_contents, dtype=np.float32)
+        assert self._kernels[0].shape[0] == self._state_encoder.state_size, "The weights don't match the state_contents."
+        self._id2card = new_deck()
+
+        # Output buffers of each layer. Hidden layers use ReLU, the output layer (Q values) is linear.
+        self._activations = [np.zeros(kernel.shape[1], dtype=np.float32) for kernel in self._kernels]
+
+        # For display in the GUI
+        self._current_q_vals = None
+
+    def _q_values(self, state: np.ndarray) -> np.ndarray:
+        # Forward pass of the Q network. Returns the buffer of the output layer (overwritten by the next call).
+        x = state
+        for i, (kernel, bias, out) in enumerate(zip(self._kernels, self._biases, self._activations)):
+            np.dot(x, kernel, out=out)
+            out += bias
+            if i < len(self._kernels) - 1:
+                np.maximum(out, 0., out=out)
+            x = out
+        return x
+
+    @overrides
+    def play_card(self, cards_in_hand: Iterable[Card], cards_in_trick: List[Card], game_mode: GameMode) -> Card:
+        state = self._state_encoder.encode(cards_in_hand=cards_in_hand, cards_in_trick=cards_in_trick)
+        q_values = self._q_values(state)
+        self._current_q_vals = q_values.copy()
+
+        # Pick the "best" action that is allowed.
+        selected_card = max(game_mode.legal_moves(cards_in_hand, cards_in_trick), key=lambda c: q_values[c.id])
+        self._state_encoder.observe_card(selected_card)
+        return selected_card
+
+    @overrides
+    def notify_trick_result(self, cards_in_trick: List[Card], rel_taker_id: int):
+        self._state_encoder.observe_trick(cards_in_trick)
+
+    @overrides
+    def notify_new_game(self):
+        self._state_encoder.reset()
+
+    @overrides
+    def internal_card_values(self) -> Optional[Dict[Card, float]]:
+        # Report q-value per card for display / debugging.
+        if self._current_q_vals is None:
+            return None
+        return {c: self._current_q_vals[i] for i, c in enumerate(self._id2card)}
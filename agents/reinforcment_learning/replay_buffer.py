@@ -0,0 +1,75 @@
+from typing import Tuple
+
+import numpy as np
+
+
+class ReplayBuffer:
+    """
+    Experience replay buffer with preallocated, circular NumPy storage. Once the buffer is full, new experiences overwrite
+    the oldest ones.
+
+    States and masks of available actions are binary vectors, they are stored bit-packed (8 entries per byte). Actions are
+    stored as ids. An experience needs about 2 * state_size / 8 + action_size / 8 + 6 bytes, e.g. 66 bytes for a state of
+    224 entries - a buffer of 10 million experiences fits into less than 700 MB.
+    """
+
+    def __init__(self, capacity: int, state_size: int, action_size: int):
+        """
+        :param capacity: maximum number of experiences.
+        :param state_size: length of the state vectors.
+        :param action_size: number of actions.
+        """
+        self.capacity = capacity
+        self.state_size = state_size
+        self.action_size = action_size
+
+        assert action_size <= 256, "Action ids are stored as uint8."
+        n_state_bytes = (state_size + 7) // 8
+        n_action_bytes = (action_size + 7) // 8
+        self._states = np.zeros((capacity, n_state_bytes), dtype=np.uint8)
+        self._next_states = np.zeros((capacity, n_state_bytes), dtype=np.uint8)
+        self._actions = np.zeros(capacity, dtype=np.uint8)
+        self._rewards = np.zeros(capacity, dtype=np.float32)
+        self._terminated = np.zeros(capacity, dtype=bool)
+        self._available_actions = np.zeros((capacity, n_action_bytes), dtype=np.uint8)
+
+        self._next_index = 0
+        self._len = 0
+
+    def __len__(self):
+        return self._len
+
+    def append(self, state: np.ndarray, action_id: int, reward: float, next_state: np.ndarray, terminated: bool,
+               available_actions: np.ndarray):
+        """
+        Adds a single experience.
+        :param state: binary vector (state_size).
+        :param action_id: the action that was taken in state.
+        :param reward: the reward that was received.
+        :param next_state: binary vector (state_size): the state after the action.
+        :param terminated: True if next_state is a terminal state.
+        :param available_actions: bool vector (action_size): the actions that were valid in state.
+        """
+        i = self._next_index
+        self._states[i] = np.packbits(state)
+        self._next_states[i] = np.packbits(next_state)
+        self._actions[i] = action_id
+        self._rewards[i] = reward
+        self._terminated[i] = terminated
+        self._available_actions[i] = np.packbits(available_actions)
+
+        self._next_index = (i + 1) % self.capacity
+        self._len = min(self._len + 1, self.capacity)
+
+    def sample(self, batch_size: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Draws a random minibatch of experiences (with replacement).
+        :return: tuple of arrays (states, action_ids, rewards, next_states, terminated, available_actions), each with
+                 batch_size rows. States are uint8 (0/1), available_actions are bool.
+        """
+        assert self._len > 0, "The buffer is empty."
+        indices = np.random.randint(self._len, size=batch_size)
+        states = np.unpackbits(self._states[indices], axis=1, count=self.state_size)
+        next_states = np.unpackbits(self._next_states[indices], axis=1, count=self.state_size)
+        available_actions = np.unpackbits(self._available_actions[indices], axis=1, count=self.action_size).astype(bool)
+        return states, self._actions[indices], self._rewards[indices], next_states, self._terminated[indices], available_actions
@@ -0,0 +1,196 @@
+from typing import Dict, Iterable, List, Type
+
+import numpy as np
+
+from simulator.card_defs import Card, CardSet, popcount
+
+
+# All state components by name (the names are used in the state_contents of the DQNAgent config).
+STATE_COMPONENTS: Dict[str, Type["StateComponent"]] = {}
+
+
+def register_state_component(name: str):
+    """
+    Class decorator: makes a StateComponent available under a name.
+    """
+    def register(cls):
+        assert name not in STATE_COMPONENTS, f'Duplicate state component name: "{name}"'
+        STATE_COMPONENTS[name] = cls
+        return cls
+    return register
+
+
+class StateComponent:
+    """
+    A part of the state vector, of a fixed size. Components keep their part up to date incrementally: they are told about
+    every card that the agent sees being played, and only change the entries that are affected.
+    """
+
+    # Number of entries in the state vector.
+    size = 0
+
+    def __init__(self, state: np.ndarray, offset: int):
+        """
+        :param state: the state vector (shared by all components).
+        :param offset: the index of the first entry of this component.
+        """
+        self.state = state
+        self.offset = offset
+
+    def reset(self):
+        # A new game starts.
+        self.state[self.offset:self.offset + self.size] = 0
+
+    def observe_turn(self, hand_mask: int, cards_in_trick: List[Card]):
+        # It's the agent's turn (hand_mask: the cards in hand, see CardSet).
+        pass
+
+    def observe_card(self, card: Card):
+        # The agent has played a card.
+        pass
+
+    def observe_trick(self, cards_in_trick: List[Card]):
+        # A trick has been completed.
+        pass
+
+
+@register_state_component("cards_in_hand")
+class CardsInHand(StateComponent):
+    """
+    32 bools: cards in own hand (order does not matter).
+    """
+    size = 32
+
+    def __init__(self, state: np.ndarray, offset: int):
+        super().__init__(state, offset)
+        self._mask = 0
+
+    def reset(self):
+        super().reset()
+        self._mask = 0
+
+    def observe_turn(self, hand_mask: int, cards_in_trick: List[Card]):
+        # Usually, only the card played in the last turn has changed.
+        changed = hand_mask ^ self._mask
+        while changed:
+            low = changed & -changed
+            changed ^= low
+            self.state[self.offset + low.bit_length() - 1] = 1 if hand_mask & low else 0
+        self._mask = hand_mask
+
+
+@register_state_component("cards_in_trick")
+class CardsInTrick(StateComponent):
+    """
+    3x32 bools: cards in current trick before the one to be played by the agent (order is important).
+    """
+    size = 3 * 32
+
+    def __init__(self, state: np.ndarray, offset: int):
+        super().__init__(state, offset)
+        self._indices = []              # Entries that are currently set.
+
+    def reset(self):
+        super().reset()
+        self._indices = []
+
+    def observe_turn(self, hand_mask: int, cards_in_trick: List[Card]):
+        for i in self._indices:
+            self.state[i] = 0
+        self._indices = [self.offset + i * 32 + card.id for i, card in enumerate(cards_in_trick)]
+        for i in self._indices:
+            self.state[i] = 1
+
+
+@register_state_component("cards_already_played")
+class CardsAlreadyPlayed(StateComponent):
+    """
+    1x32 bools: cards that have already been played.
+    This is an engineered feature which could also be learned by the agent if it had some memory.
+    """
+    size = 32
+
+    def __init__(self, state: np.ndarray, offset: int):
+        super().__init__(state, offset)
+        self._mask = 0
+
+    def reset(self):
+        super().reset()
+        self._mask = 0
+
+    def observe_turn(self, hand_mask: int, cards_in_trick: List[Card]):
+        # The cards of the current trick are added once it's complete, so these are exactly the cards of the completed tricks.
+        assert popcount(self._mask) == 4 * (8 - popcount(hand_mask))
+
+    def observe_trick(self, cards_in_trick: List[Card]):
+        for card in cards_in_trick:
+            self._mask |= 1 << card.id
+            self.state[self.offset + card.id] = 1
+
+
+class StateEncoder:
+    """
+    Encodes the game state, as observed by one player, into the state vector of the DQNAgent.
+    The vector consists of the components in state_contents (see STATE_COMPONENTS), in this order.
+
+    The vector is kept up to date incrementally, encode() only needs to apply the latest changes and copy it.
+    Call reset() when a new game starts, and report the cards that are played with observe_card() and observe_trick().
+
+    Future possibilities for features:
+    - Number of the current trick: not necessary, can be implied from the number of cards in hand
+    - Mapping player IDs to cards to GameMode (knowing who is declaring, and then knowing THEY played a specific card)
+      - Partially contained in the order of cards_in_trick, but needs initial info about player IDs
+    - LSTM based memory of played cards, perhaps together with player IDs
+    - Player scores, or actually a memory of all cards in all previous tricks, mapped to player IDs
+    """
+
+    def __init__(self, state_contents: Iterable[str], dtype=np.int32):
+        """
+        :param state_contents: names of the state components (see STATE_COMPONENTS).
+        :param dtype: dtype of the state vector.
+        """
+        state_contents = list(state_contents)
+        for comp in state_contents:
+            if comp not in STATE_COMPONENTS:
+                raise ValueError(f'Unknown state component name: "{comp}"')
+        self.state_size = sum(STATE_COMPONENTS[comp].size for comp in state_contents)
+        self.state = np.zeros(self.state_size, dtype=dtype)
+
+        self._components = []
+        offset = 0
+        for comp in state_contents:
+            self._components.append(STATE_COMPONENTS[comp](self.state, offset))
+            offset += STATE_COMPONENTS[comp].size
+
+    def reset(self):
+        """
+        Clears the state at the start of a new game.
+        """
+        for component in self._components:
+            component.reset()
+
+    def encode(self, cards_in_hand: Iterable[Card], cards_in_trick: List[Card]) -> np.ndarray:
+        """
+        Encodes the state at the start of the agent's turn.
+        :param cards_in_hand: the agent's cards.
+        :param cards_in_trick: the cards in the current trick, played before the agent's turn.
+        :return: the state vector (a copy).
+        """
+        hand_mask = cards_in_hand.mask if isinstance(cards_in_hand, CardSet) else CardSet(cards_in_hand).mask
+        for component in self._components:
+            component.observe_turn(hand_mask, cards_in_trick)
+        return self.state.copy()
+
+    def observe_card(self, card: Card):
+        """
+        The agent has played a card.
+        """
+        for component in self._components:
+            component.observe_card(card)
+
+    def observe_trick(self, cards_in_trick: List[Card]):
+        """
+        A trick has been completed (all 4 cards).
+        """
+        for component in self._components:
+            component.observe_trick(cards_in_trick)
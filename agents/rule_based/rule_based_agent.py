@@ -1,9 +1,10 @@
-from typing import List, Iterable
+from typing import List, Iterable, Optional
 import numpy as np
 
 from simulator.player_agent import PlayerAgent
-from simulator.card_defs import Card, Suit, Pip, PIP_SCORES
+from simulator.card_defs import Card, CardSet, Suit, Pip, PIP_SCORES
 from simulator.game_mode import GameMode, GameContract
+from simulator.hand_evaluator import HandEvaluator
 from utils.log_util import get_class_logger
 
 
@@ -17,10 +18,18 @@ class RuleBasedAgent(PlayerAgent):
     CC is probably over 9000, sorry for creating an abomination. Maybe we should call it IfElseAgent :)
 
     The agent can play any Suit-Solo, both as declaring and non-declaring player.
+    With a HandEvaluator, it also declares a Suit-Solo or Wenz in the bidding phase if its hand is good enough.
     """
 
-    def __init__(self, player_id: int):
+    def __init__(self, player_id: int, hand_evaluator: HandEvaluator = None, min_win_probability: float = 0.6):
+        """
+        :param player_id: the player id.
+        :param hand_evaluator: Optional - used for declaring games. Without it, the agent always passes.
+        :param min_win_probability: the agent declares the best game for its hand if the estimated win probability is at least this.
+        """
         super().__init__(player_id)
+        self.hand_evaluator = hand_evaluator
+        self.min_win_probability = min_win_probability
 
         self.logger = get_class_logger(self)
 
@@ -29,6 +38,13 @@ class RuleBasedAgent(PlayerAgent):
         self._suit_power = {Suit.eichel: 40, Suit.gras: 30, Suit.herz: 20, Suit.schellen: 10}
         self._pip_power = {Pip.sau: 8, Pip.zehn: 7, Pip.koenig: 6, Pip.ober: 5, Pip.unter: 4, Pip.neun: 3, Pip.acht: 2, Pip.sieben: 1}
 
+    def declare_game(self, cards_in_hand: Iterable[Card]) -> Optional[GameMode]:
+        if self.hand_evaluator is None:
+            return None
+        game_mode, win_probability = self.hand_evaluator.best_game(cards_in_hand, self.player_id)
+        self.logger.debug("Best game: {} with estimated win probability {:.2f}".format(game_mode, win_probability))
+        return game_mode if win_probability >= self.min_win_probability else None
+
     def play_card(self, cards_in_hand: Iterable[Card], cards_in_trick: List[Card], game_mode: GameMode) -> Card:
         # For now, this function is a dispatcher that invokes individual behaviors based on the game mode.
         # The (almost hardcoded) behavior in these functions is highly redundant, but keeping it this way
@@ -56,7 +72,7 @@ class RuleBasedAgent(PlayerAgent):
         # These action definitions could also be shared across behaviors, so this could remove some of the redundancy
         #  we get when duplicating behavior for different game modes.
 
-        valid_cards = [c for c in cards_in_hand if game_mode.is_play_allowed(c, cards_in_hand, cards_in_trick)]
+        valid_cards = list(game_mode.legal_moves(cards_in_hand, cards_in_trick))
         own_trumps = self._trumps_by_power(in_cards=valid_cards, game_mode=game_mode)
 
         if len(cards_in_trick) == 0:
@@ -138,9 +154,9 @@ class RuleBasedAgent(PlayerAgent):
 
     def _play_card_solo_not_declaring(self, cards_in_hand: Iterable[Card], cards_in_trick: List[Card], game_mode: GameMode) -> Card:
         # When a solo is being played and the declaring player is the enemy.
-        valid_cards = [c for c in cards_in_hand if game_mode.is_play_allowed(c, cards_in_hand, cards_in_trick)]
+        valid_cards = list(game_mode.legal_moves(cards_in_hand, cards_in_trick))
         own_trumps = self._trumps_by_power(in_cards=valid_cards, game_mode=game_mode)
-        non_trumps = set(valid_cards).difference(own_trumps)
+        non_trumps = CardSet(valid_cards) - own_trumps
 
         if len(cards_in_trick) == 0:
             # We are leading.
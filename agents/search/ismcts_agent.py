@@ -0,0 +1,271 @@
+import math
+import time
+from array import array
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+from overrides import overrides
+
+from agents.dummy.static_policy_agent import StaticPolicyAgent
+from agents.rule_based.rule_based_agent import RuleBasedAgent
+from simulator.hidden_hands import CardTracker
+from simulator.card_defs import Card, CardSet, PIP_SCORES, new_deck
+from simulator.game_mode import GameMode, GameContract
+from simulator.player_agent import PlayerAgent
+from utils.log_util import get_class_logger
+
+
+class _SearchTree:
+    """
+    The nodes of the search tree, stored as parallel arrays (one entry per node). A node stands for a card played after the
+    sequence of cards of its parent; the children of a node form a linked list (first_child, next_sibling).
+    """
+
+    def __init__(self):
+        self.card = array("b")              # The card played in this node.
+        self.player = array("b")            # The player who played it.
+        self.first_child = array("i")
+        self.next_sibling = array("i")
+        self.visits = array("i")
+        self.avail = array("i")             # How often the card was a legal move when the parent was visited.
+        self.reward = array("d")            # Sum of the rewards of the player, over all visits.
+        self.clear()
+
+    def clear(self):
+        for a in (self.card, self.player, self.first_child, self.next_sibling, self.visits, self.avail, self.reward):
+            del a[:]
+        self.add_node(-1, -1, -1)           # The root.
+
+    def __len__(self):
+        return len(self.card)
+
+    def add_node(self, parent: int, card_id: int, player: int) -> int:
+        i_node = len(self.card)
+        self.card.append(card_id)
+        self.player.append(player)
+        self.first_child.append(-1)
+        self.next_sibling.append(self.first_child[parent] if parent >= 0 else -1)
+        self.visits.append(0)
+        self.avail.append(0)
+        self.reward.append(0.)
+        if parent >= 0:
+            self.first_child[parent] = i_node
+        return i_node
+
+    def find_child(self, parent: int, card_id: int) -> int:
+        child = self.first_child[parent]
+        while child >= 0 and self.card[child] != card_id:
+            child = self.next_sibling[child]
+        return child
+
+
+class ISMCTSAgent(PlayerAgent):
+    """
+    Information Set Monte Carlo Tree Search (single observer): every iteration deals the hidden cards randomly (consistent with
+    the game so far), walks down the tree along the cards that are legal in this deal (UCB, counting how often each card was
+    available), adds one node and plays the game to the end with a fast rollout policy. The reward is 1 for the players who win
+    the game, 0 for the others.
+
+    The search is anytime: it stops after max_iterations or after time_limit seconds, whichever comes first.
+    The tree is reused for the next play_card() in the same game by following the cards that have been played in between.
+
+    Rollout policies:
+    - "random": random legal cards.
+    - "static": the card order of StaticPolicyAgent.
+    - "rule": RuleBasedAgent (only Suit-solo and Wenz, random cards otherwise). Much slower than the others.
+    """
+
+    def __init__(self, player_id: int, rollout_policy: str = "random", max_iterations: Optional[int] = 2000,
+                 time_limit: Optional[float] = None, exploration: float = 0.7):
+        """
+        :param player_id: the player id.
+        :param rollout_policy: "random", "static" or "rule", see above.
+        :param max_iterations: Optional - maximum number of iterations per move.
+        :param time_limit: Optional - maximum time per move in seconds.
+        :param exploration: exploration constant of UCB.
+        """
+        super().__init__(player_id)
+        if rollout_policy not in ("random", "static", "rule"):
+            raise ValueError(f'Unknown rollout policy: "{rollout_policy}"')
+        assert max_iterations is not None or time_limit is not None, "Need a limit for the search."
+        self.logger = get_class_logger(self)
+        self.rollout_policy = rollout_policy
+        self.max_iterations = max_iterations
+        self.time_limit = time_limit
+        self.exploration = exploration
+
+        self._deck = new_deck()
+        self._points = [PIP_SCORES[c.pip] for c in self._deck]
+        self._static_order = [c.id for c in StaticPolicyAgent(player_id).static_policy]
+        self._rule_agents = [RuleBasedAgent(i) for i in range(4)]
+
+        self._tracker = CardTracker(player_id)
+        self._tree = _SearchTree()
+        self._root = 0
+        self._history = []                  # All cards of the completed tricks (in order).
+        self._root_history = None           # The cards that had been played when the root was searched.
+        self._card_values = None            # Average rewards of the cards in the last play_card(), for display.
+
+    @overrides
+    def play_card(self, cards_in_hand: Iterable[Card], cards_in_trick: List[Card], game_mode: GameMode) -> Card:
+        self._tracker.observe_turn(cards_in_hand, cards_in_trick, game_mode)
+        self._card_values = None
+        valid_cards = list(game_mode.legal_moves(cards_in_hand, cards_in_trick))
+        if len(valid_cards) == 1:
+            return valid_cards[0]
+
+        self._move_root(self._history + [c.id for c in cards_in_trick])
+        n_visits_reused = self._tree.visits[self._root]
+
+        # Search until one of the limits is reached.
+        t_end = time.monotonic() + self.time_limit if self.time_limit is not None else None
+        partner_id = self._tracker.partner_id(cards_in_trick) if game_mode.contract == GameContract.rufspiel else None
+        deals = []
+        n_iterations = 0
+        while (self.max_iterations is None or n_iterations < self.max_iterations) \
+                and (t_end is None or time.monotonic() < t_end):
+            if not deals:
+                deals = self._tracker.sample_hands(cards_in_hand, cards_in_trick, 64)
+            self._iterate(deals.pop(), cards_in_trick, game_mode, partner_id)
+            n_iterations += 1
+
+        # Play the card that was visited most often.
+        tree = self._tree
+        stats = {}
+        child = tree.first_child[self._root]
+        while child >= 0:
+            stats[self._deck[tree.card[child]]] = (tree.visits[child], tree.reward[child] / max(tree.visits[child], 1))
+            child = tree.next_sibling[child]
+        selected_card = max(valid_cards, key=lambda c: stats.get(c, (0, 0.)))
+        self._card_values = {c: stats[c][1] for c in valid_cards if c in stats}
+        self.logger.debug("{} iterations ({} visits reused), {} nodes. Playing {} (visits {}, avg. reward {:.2f}).".format(
+            n_iterations, n_visits_reused, len(tree), selected_card, *stats.get(selected_card, (0, 0.))))
+        return selected_card
+
+    def _move_root(self, history: List[int]):
+        # Moves the root of the tree along the cards played since the last search, or starts a new tree.
+        tree = self._tree
+        node = -1
+        if self._root_history is not None and history[:len(self._root_history)] == self._root_history:
+            node = self._root
+            for card_id in history[len(self._root_history):]:
+                node = tree.find_child(node, card_id)
+                if node < 0:
+                    break
+        if node < 0:
+            tree.clear()
+            node = 0
+        self._root = node
+        self._root_history = history
+
+    def _iterate(self, hands: List[int], cards_in_trick: List[Card], game_mode: GameMode, partner_id: Optional[int]):
+        # One iteration of the search on a deal of the hidden cards (hands are bit masks, see CardSet).
+        tree = self._tree
+        points = self._points
+        power = game_mode._card_power
+        taking_masks = game_mode._trick_taking_masks
+        legal_moves_mask = game_mode.legal_moves_mask
+
+        # Who plays together in this deal?
+        decl = game_mode.declaring_player_id
+        if game_mode.contract == GameContract.rufspiel and partner_id is None:
+            partner_id = next(i for i in range(4) if (hands[i] >> game_mode._rufsau_id) & 1)
+        is_decl = [i == decl or i == partner_id for i in range(4)]
+        decl_points = sum(self._tracker.scored_points[i] for i in range(4) if is_decl[i])
+
+        # The state of the current trick.
+        leader = self._tracker.trick_leader
+        trick = []
+        win_id, winner = -1, -1
+        i_p = leader
+
+        def play(card_id: int):
+            nonlocal i_p, leader, win_id, winner, decl_points
+            hands[i_p] ^= 1 << card_id
+            if not trick or ((taking_masks[trick[0]] >> card_id) & 1 and power[card_id] > power[win_id]):
+                win_id, winner = card_id, i_p
+            trick.append(card_id)
+            if len(trick) == 4:
+                if is_decl[winner]:
+                    decl_points += sum(points[c] for c in trick)
+                trick.clear()
+                leader = i_p = winner
+            else:
+                i_p = (i_p + 1) % 4
+
+        for card in cards_in_trick:
+            hands[i_p] |= 1 << card.id          # The card is removed again by play().
+            play(card.id)
+
+        # Selection and expansion.
+        node = self._root
+        path = [node]
+        while hands[i_p]:
+            legal = legal_moves_mask(hands[i_p], trick[0] if trick else -1)
+            untried = legal
+            best_child, best_score = -1, -1.
+            child = tree.first_child[node]
+            while child >= 0:
+                card_id = tree.card[child]
+                if (legal >> card_id) & 1:
+                    untried &= ~(1 << card_id)
+                    tree.avail[child] += 1
+                    visits = tree.visits[child]
+                    score = tree.reward[child] / visits + self.exploration * math.sqrt(math.log(tree.avail[child]) / visits)
+                    if score > best_score:
+                        best_child, best_score = child, score
+                child = tree.next_sibling[child]
+
+            if untried:
+                # Expand a random untried card.
+                card_ids = [c for c in range(32) if (untried >> c) & 1]
+                card_id = card_ids[np.random.randint(len(card_ids))]
+                node = tree.add_node(node, card_id, i_p)
+                tree.avail[node] += 1
+                path.append(node)
+                play(card_id)
+                break
+            node = best_child
+            path.append(node)
+            play(tree.card[node])
+
+        # Rollout.
+        while hands[i_p]:
+            play(self._rollout_card(i_p, hands[i_p], trick, game_mode))
+
+        # Backpropagation.
+        decl_won = decl_points > 60
+        for node in path:
+            tree.visits[node] += 1
+            if node != path[0] and is_decl[tree.player[node]] == decl_won:
+                tree.reward[node] += 1.
+
+    def _rollout_card(self, i_p: int, hand: int, trick: List[int], game_mode: GameMode) -> int:
+        # Selects a card for a player with the rollout policy.
+        legal = game_mode.legal_moves_mask(hand, trick[0] if trick else -1)
+        if self.rollout_policy == "static":
+            return next(c for c in self._static_order if (legal >> c) & 1)
+        if self.rollout_policy == "rule" and game_mode.contract != GameContract.rufspiel:
+            card = self._rule_agents[i_p].play_card(CardSet.from_mask(hand), [self._deck[c] for c in trick], game_mode)
+            return card.id
+        card_ids = [c for c in range(32) if (legal >> c) & 1]
+        return card_ids[np.random.randint(len(card_ids))]
+
+    @overrides
+    def notify_trick_result(self, cards_in_trick: List[Card], rel_taker_id: int):
+        self._tracker.observe_trick(cards_in_trick, rel_taker_id)
+        self._history.extend(c.id for c in cards_in_trick)
+
+    @overrides
+    def notify_new_game(self):
+        self._tracker.reset()
+        self._tree.clear()
+        self._root = 0
+        self._history = []
+        self._root_history = None
+        self._card_values = None
+
+    @overrides
+    def internal_card_values(self) -> Optional[Dict[Card, float]]:
+        # Report the average reward per card (i.e. the estimated win rate) for display.
+        return self._card_values
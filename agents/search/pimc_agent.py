@@ -0,0 +1,164 @@
+import multiprocessing
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from overrides import overrides
+
+from agents.dummy.static_policy_agent import StaticPolicyAgent
+from agents.rule_based.rule_based_agent import RuleBasedAgent
+from simulator.hidden_hands import CardTracker
+from simulator.card_defs import Card, CardSet
+from simulator.game_mode import GameMode, GameContract
+from simulator.player_agent import PlayerAgent
+from simulator.solver.double_dummy import DoubleDummySolver, SolverTimeout
+from utils.log_util import get_class_logger
+
+
+# The solvers of the current process (one per game mode), see _solve_sample().
+_solvers = {}
+
+
+def _solve_sample(task: Tuple) -> Optional[Tuple[List[int], Dict[int, int]]]:
+    # Solves all moves of one sampled deal (runs in a worker process, or in the agent's process).
+    # Returns the declaring side and the points that it takes from now on for each card id, or None if the deadline has passed.
+    # Unless exact is set, the points are only bounds that tell whether the declaring side wins the game (see
+    # DoubleDummySolver.solve(), target).
+    game_mode, hands, leading_player, cards_in_trick, partner_id, scored_points, exact, deadline = task
+    key = (game_mode.contract, game_mode.trump_suit, game_mode.ruf_suit, game_mode.declaring_player_id)
+    solver = _solvers.get(key)
+    if solver is None:
+        solver = _solvers[key] = DoubleDummySolver(game_mode)
+
+    if time.monotonic() > deadline:
+        return None
+    hands = [CardSet.from_mask(m) for m in hands]
+    declaring_side = solver.declaring_side(hands, partner_id=partner_id)
+    target = None if exact else 61 - sum(scored_points[i_p] for i_p in declaring_side)
+    try:
+        values = solver.solve_moves(hands, leading_player, cards_in_trick, declaring_side=declaring_side, deadline=deadline,
+                                    target=target)
+    except SolverTimeout:
+        return None
+    return declaring_side, {card.id: v for card, v in values.items()}
+
+
+class PIMCAgent(PlayerAgent):
+    """
+    Perfect Information Monte Carlo agent: samples hands of the other players that are consistent with the game so far,
+    solves each of these deals with the DoubleDummySolver, and plays the card that wins in most samples (ties are broken by
+    the average points).
+
+    Every move has a time budget. The samples are solved until the budget runs out, optionally in a pool of worker processes
+    (n_workers > 1, e.g. for play_with_gui.py), in two passes: first, the solver only decides for each move whether it wins
+    the game (a single null-window search per move, which is much cheaper than the exact points). With the remaining time, the
+    exact points are computed for as many samples as possible, for breaking the ties. So only the number of samples shrinks
+    if the budget is tight (e.g. in the first trick). If not even one sample can be solved in time, the move is played by the
+    fallback: a RuleBasedAgent, or a StaticPolicyAgent in a Rufspiel (which the RuleBasedAgent can't play).
+
+    The worker processes are started on the first move. Call close() (or use the agent as a context manager) to shut them down.
+
+    NOTE: Worker processes can't start their own pools, so use n_workers=1 inside the workers of eval_agent().
+    """
+
+    def __init__(self, player_id: int, n_samples: int = 32, time_budget: float = 1.0, n_workers: int = 1):
+        """
+        :param player_id: the player id.
+        :param n_samples: number of sampled deals per move (at most).
+        :param time_budget: time per move in seconds.
+        :param n_workers: number of worker processes for solving the samples. If 1, they are solved in this process.
+        """
+        super().__init__(player_id)
+        self.logger = get_class_logger(self)
+        self.n_samples = n_samples
+        self.time_budget = time_budget
+        self.n_workers = n_workers
+
+        self._tracker = CardTracker(player_id)
+        self._rule_based_agent = RuleBasedAgent(player_id)
+        self._static_policy_agent = StaticPolicyAgent(player_id)
+        self._pool = None
+        self._card_values = None            # Win rates of the cards in the last play_card(), for display.
+
+    @overrides
+    def close(self):
+        # Shuts down the worker processes (if any).
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @overrides
+    def play_card(self, cards_in_hand: Iterable[Card], cards_in_trick: List[Card], game_mode: GameMode) -> Card:
+        self._tracker.observe_turn(cards_in_hand, cards_in_trick, game_mode)
+        self._card_values = None
+        valid_cards = list(game_mode.legal_moves(cards_in_hand, cards_in_trick))
+        if len(valid_cards) == 1:
+            return valid_cards[0]
+
+        if self.n_workers > 1 and self._pool is None:
+            self._pool = multiprocessing.get_context("spawn").Pool(self.n_workers)
+
+        # Sample and solve deals until the time is up: first whether each move wins, then the exact points.
+        deadline = time.monotonic() + self.time_budget
+        samples = self._tracker.sample_hands(cards_in_hand, cards_in_trick, self.n_samples)
+        partner_id = self._tracker.partner_id(cards_in_trick) if game_mode.contract == GameContract.rufspiel else None
+        task_args = (game_mode, self._tracker.trick_leader, list(cards_in_trick), partner_id, self._tracker.scored_points)
+        win_results = self._solve_samples(samples, task_args, False, deadline)
+        if len(win_results) == 0:
+            self.logger.debug("No sample solved within the time budget, using the fallback.")
+            if game_mode.contract == GameContract.rufspiel:
+                return self._static_policy_agent.play_card(cards_in_hand, cards_in_trick, game_mode)
+            return self._rule_based_agent.play_card(cards_in_hand, cards_in_trick, game_mode)
+        point_results = self._solve_samples(samples, task_args, True, deadline)
+
+        # Aggregate: in how many samples does our side win with each card, and how many points does it take on average?
+        n_wins = {c: 0 for c in valid_cards}
+        own_points = {c: 0. for c in valid_cards}
+        for results, aggregate in ((win_results, n_wins), (point_results, own_points)):
+            for declaring_side, values in results:
+                scored = sum(self._tracker.scored_points[i_p] for i_p in declaring_side)
+                is_declaring = self.player_id in declaring_side
+                for c in valid_cards:
+                    points = scored + values[c.id]
+                    if aggregate is n_wins:
+                        n_wins[c] += (points > 60) == is_declaring
+                    else:
+                        own_points[c] += (points if is_declaring else 120 - points) / len(point_results)
+        selected_card = max(valid_cards, key=lambda c: (n_wins[c], own_points[c]))
+        self._card_values = {c: n_wins[c] / len(win_results) for c in valid_cards}
+        self.logger.debug("Solved {} samples ({} exactly), playing {} (win rate {:.2f}, avg. points {:.1f}).".format(
+            len(win_results), len(point_results), selected_card, self._card_values[selected_card], own_points[selected_card]))
+        return selected_card
+
+    def _solve_samples(self, samples: List[List[int]], task_args: Tuple, exact: bool, deadline: float) -> List[Tuple]:
+        # Solves the samples (see _solve_sample()) until the deadline. Returns the results of the samples that were solved.
+        if time.monotonic() > deadline:
+            return []
+        game_mode, leading_player, cards_in_trick, partner_id, scored_points = task_args
+        tasks = [(game_mode, hands, leading_player, cards_in_trick, partner_id, scored_points, exact, deadline)
+                 for hands in samples]
+        if self._pool is not None:
+            results = self._pool.map(_solve_sample, tasks)
+        else:
+            results = [_solve_sample(task) for task in tasks]
+        return [r for r in results if r is not None]
+
+    @overrides
+    def notify_trick_result(self, cards_in_trick: List[Card], rel_taker_id: int):
+        self._tracker.observe_trick(cards_in_trick, rel_taker_id)
+
+    @overrides
+    def notify_new_game(self):
+        self._tracker.reset()
+        self._card_values = None
+
+    @overrides
+    def internal_card_values(self) -> Optional[Dict[Card, float]]:
+        # Report the win rate per card (over the solved samples) for display.
+        return self._card_values
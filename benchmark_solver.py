@@ -0,0 +1,88 @@
+"""
+Measures the speed of the DoubleDummySolver on full deals (all 8 tricks, before the first card is played).
+
+For each game mode, the deals come from two dealers: random deals, and deals in which the declaring player has a hand that is
+good enough for the game (DealWinnableHand - these are the games that are actually played, and they take longer to solve:
+the declaring side takes around half of the points, so both sides have to be refuted). Rufspiel deals are random deals in
+which the declaring player can call the Rufsau.
+
+The first solver call compiles the search (or loads it from Numba's cache), it is not part of the measured times.
+"""
+
+import argparse
+import os
+import time
+from typing import Iterable, List
+
+import numpy as np
+
+from simulator.card_defs import Card, Pip, Suit
+from simulator.controller.dealing_behavior import DealFairly, DealWinnableHand, DealingBehavior
+from simulator.game_mode import GameMode, GameContract
+from simulator.solver.double_dummy import DoubleDummySolver
+from utils.log_util import init_logging, get_named_logger
+
+
+class DealRufspiel(DealingBehavior):
+    """
+    Random deals in which the declaring player has a card of the ruf suit, but not the Rufsau.
+    """
+
+    def __init__(self, game_mode: GameMode):
+        """
+        :param game_mode: the Rufspiel.
+        """
+        assert game_mode.contract == GameContract.rufspiel
+        self._game_mode = game_mode
+        self._rufsau = Card(game_mode.ruf_suit, Pip.sau)
+        self._dealer = DealFairly()
+
+    def deal_hands(self) -> List[Iterable[Card]]:
+        while True:
+            hands = self._dealer.deal_hands()
+            hand = hands[self._game_mode.declaring_player_id]
+            if self._rufsau not in hand and any(c.suit == self._game_mode.ruf_suit and not self._game_mode.is_trump(c)
+                                                for c in hand):
+                return hands
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n-deals", help="Number of deals per game mode and dealer.", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    init_logging()
+    logger = get_named_logger("{}.main".format(os.path.splitext(os.path.basename(__file__))[0]))
+
+    np.random.seed(args.seed)
+    game_modes = {
+        "herz-solo": GameMode(GameContract.suit_solo, declaring_player_id=0, trump_suit=Suit.herz),
+        "wenz": GameMode(GameContract.wenz, declaring_player_id=0),
+        "eichel-rufspiel": GameMode(GameContract.rufspiel, declaring_player_id=0, ruf_suit=Suit.eichel),
+    }
+
+    # Warm-up: compiles the search.
+    t_start = time.perf_counter()
+    DoubleDummySolver(game_modes["wenz"]).solve(DealFairly().deal_hands(), leading_player=1)
+    logger.info("First solver call (compiling or loading the search): {:.2f} s.".format(time.perf_counter() - t_start))
+
+    for name, game_mode in game_modes.items():
+        if game_mode.contract == GameContract.rufspiel:
+            dealers = {"rufspiel": DealRufspiel(game_mode)}
+        else:
+            dealers = {"random": DealFairly(), "winnable": DealWinnableHand(game_mode)}
+        for dealer_name, dealer in dealers.items():
+            solver = DoubleDummySolver(game_mode)
+            times = []
+            for _ in range(args.n_deals):
+                hands = dealer.deal_hands()
+                t_start = time.perf_counter()
+                solver.solve(hands, leading_player=1)
+                times.append(time.perf_counter() - t_start)
+            logger.info("{:16} {:9} mean {:.3f} s, median {:.3f} s, max {:.3f} s per deal ({:.0f} nodes per deal).".format(
+                name, dealer_name, np.mean(times), np.median(times), np.max(times), solver.n_nodes / args.n_deals))
+
+
+if __name__ == '__main__':
+    main()
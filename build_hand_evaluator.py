@@ -0,0 +1,81 @@
+"""
+Builds the lookup table of the HandEvaluator (see simulator/hand_evaluator.py) by simulating many games.
+
+Player 0 declares a suit solo (random trump suit) or a Wenz and all 4 players are RuleBasedAgents. For each game, the result is
+counted under the canonical key of Player 0's hand. Part of the deals come from DealWinnableHand, so that strong hands (which
+are rare in fair deals) are covered as well - this doesn't bias the win rate of a key, since the other hands are still random.
+"""
+
+import argparse
+import logging
+import os
+
+import numpy as np
+
+from agents.rule_based.rule_based_agent import RuleBasedAgent
+from simulator.card_defs import Suit
+from simulator.controller.dealing_behavior import DealFairly, DealWinnableHand, DealExactly
+from simulator.controller.game_controller import GameController
+from simulator.game_mode import GameMode, GameContract
+from simulator.game_state import Player
+from simulator.hand_evaluator import N_SOLO_KEYS, N_WENZ_KEYS, solo_key, wenz_key
+from utils.log_util import init_logging, get_class_logger, get_named_logger
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--out", help="The .npz file to write.", required=True)
+    parser.add_argument("--n-games", help="Number of games to simulate (half of them solos, half Wenz).", type=int, default=200000)
+    parser.add_argument("--winnable-fraction", help="Fraction of the deals that come from DealWinnableHand.", type=float, default=0.5)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    init_logging()
+    logger = get_named_logger("{}.main".format(os.path.splitext(os.path.basename(__file__))[0]))
+    get_class_logger(GameController).setLevel(logging.INFO)     # Don't log specifics of a single game
+    get_class_logger(RuleBasedAgent).setLevel(logging.INFO)
+
+    np.random.seed(args.seed)
+    game_modes = [GameMode(GameContract.suit_solo, trump_suit=suit, declaring_player_id=0) for suit in Suit]
+    game_modes.append(GameMode(GameContract.wenz, declaring_player_id=0))
+    fair_dealer = DealFairly()
+    winnable_dealers = [DealWinnableHand(game_mode) for game_mode in game_modes]
+
+    players = [Player(f"{i}-Hans", agent=RuleBasedAgent(i)) for i in range(4)]
+    controller = GameController(players, fast=True)
+
+    solo_wins, solo_games = np.zeros(N_SOLO_KEYS, dtype=np.int64), np.zeros(N_SOLO_KEYS, dtype=np.int64)
+    wenz_wins, wenz_games = np.zeros(N_WENZ_KEYS, dtype=np.int64), np.zeros(N_WENZ_KEYS, dtype=np.int64)
+    logger.info(f"Simulating {args.n_games} games...")
+    for i_game in range(args.n_games):
+        # Every other game is a Wenz.
+        i_mode = len(Suit) if i_game % 2 == 1 else np.random.randint(len(Suit))
+        game_mode = game_modes[i_mode]
+        dealer = winnable_dealers[i_mode] if np.random.random() < args.winnable_fraction else fair_dealer
+        hands = dealer.deal_hands()
+
+        controller.dealing_behavior = DealExactly(hands)
+        controller.forced_game_mode = game_mode
+        won = controller.run_game()[0]
+
+        hand_mask = hands[0].mask
+        if game_mode.contract == GameContract.wenz:
+            key = wenz_key(hand_mask)
+            wenz_wins[key] += won
+            wenz_games[key] += 1
+        else:
+            key = solo_key(hand_mask, game_mode.trump_suit)
+            solo_wins[key] += won
+            solo_games[key] += 1
+
+        if (i_game + 1) % 10000 == 0:
+            logger.info("Simulated {} games. Win rate: solo {:.3f}, Wenz {:.3f}".format(
+                i_game + 1, solo_wins.sum() / max(solo_games.sum(), 1), wenz_wins.sum() / max(wenz_games.sum(), 1)))
+
+    np.savez(args.out, solo_wins=solo_wins, solo_games=solo_games, wenz_wins=wenz_wins, wenz_games=wenz_games)
+    logger.info("Covered {} solo keys and {} Wenz keys.".format(np.count_nonzero(solo_games), np.count_nonzero(wenz_games)))
+    logger.info(f'Wrote "{args.out}".')
+
+
+if __name__ == '__main__':
+    main()
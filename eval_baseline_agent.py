@@ -8,8 +8,7 @@ import argparse
 import logging
 import os
 
-from agents.dummy.random_card_agent import RandomCardAgent
-from agents.dummy.static_policy_agent import StaticPolicyAgent
+from agents.registry import agent_class, agent_factory
 from agents.rule_based.rule_based_agent import RuleBasedAgent
 from simulator.controller.game_controller import GameController
 from evaluation import eval_agent
@@ -18,7 +17,13 @@ from utils.log_util import init_logging, get_class_logger, get_named_logger
 
 def main():
     parser = argparse.ArgumentParser()
-    parser.add_argument("--p0-agent", type=str, choices=['static', 'rule', 'random'], required=True)
+    parser.add_argument("--p0-agent", type=str, choices=['static', 'rule', 'random', 'pimc', 'ismcts'], required=True)
+    parser.add_argument("--pimc-time-budget", help="Time per move in seconds, if --p0-agent=pimc.", type=float, default=1.0)
+    parser.add_argument("--workers", help="Number of worker processes.", type=int, default=1)
+    parser.add_argument("--seed", help="Seed of the evaluation (for reproducible results).", type=int, default=None)
+    parser.add_argument("--deal-corpus", help="Evaluate on the deals of this corpus (see generate_deal_corpus.py).", default=None)
+    parser.add_argument("--paired", help="If set, every deal is also played by a RuleBasedAgent, and the difference is reported.",
+                        action="store_true")
     args = parser.parse_args()
     agent_choice = args.p0_agent
 
@@ -27,16 +32,16 @@ def main():
     logger = get_named_logger("{}.main".format(os.path.splitext(os.path.basename(__file__))[0]))
     get_class_logger(GameController).setLevel(logging.INFO)     # Don't log specifics of a single game
 
-    # Create the agent for Player 0.
-    if agent_choice == "rule":
-        agent = RuleBasedAgent(0)
-    elif agent_choice == "static":
-        agent = StaticPolicyAgent(0)
+    # The factory for Player 0's agent (the workers create their own agents).
+    if agent_choice == "pimc":
+        # Solves its samples in the evaluation worker (no pool of its own).
+        factory = agent_factory(agent_choice, time_budget=args.pimc_time_budget)
     else:
-        agent = RandomCardAgent(0)
+        factory = agent_factory(agent_choice)
 
-    logger.info(f'Evaluating agent "{agent.__class__.__name__}"')
-    perf = eval_agent(agent)
+    logger.info(f'Evaluating agent "{agent_class(agent_choice).__name__}"')
+    perf = eval_agent(factory, n_workers=args.workers, seed=args.seed, reference_factory=RuleBasedAgent if args.paired else None,
+                      deal_corpus=args.deal_corpus)
 
 
 if __name__ == '__main__':
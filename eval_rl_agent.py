@@ -2,9 +2,8 @@
 Evaluates the winrate of RL agents that are specified in the training section of a config file.
 
 - This script runs in an endless loop, looking for new checkpoints in the experiment dir.
-- As the evaluation is not parallelized at all (sorry), it can take some time.
-- For this reason, you can run multiple instances in parallel, each evaluating on a single CPU core.
-    Or GPU, if you like, but the network is way too small :)
+- The games of an evaluation are distributed over a pool of worker processes (--workers), each running on a single CPU core.
+- You can also run multiple instances in parallel, e.g. on different machines.
 """
 
 import glob
@@ -15,18 +14,38 @@ import argparse
 import logging
 import os
 
-from agents.reinforcment_learning.dqn_agent import DQNAgent
+from agents.registry import agent_factory, create_agent
+from agents.rule_based.rule_based_agent import RuleBasedAgent
 from simulator.controller.game_controller import GameController
-from evaluation import eval_agent
+from evaluation import eval_agent, SequentialTest
 from utils.log_util import init_logging, get_class_logger, get_named_logger
 from utils.config_util import load_config
 
 
+def export_checkpoint(config, checkpoint_path: str) -> str:
+    # Exports a checkpoint for InferenceDQNAgent, returns the path of the .npz file.
+    # Only this imports TensorFlow (through the agent registry), the workers play with the exported weights.
+    weights_path = f"{os.path.splitext(checkpoint_path)[0]}.npz"
+    agent = create_agent("dqn", 0, config=config, training=False)
+    agent.load_weights(checkpoint_path)
+    agent.export_weights(weights_path)
+    return weights_path
+
+
 def main():
 
     parser = argparse.ArgumentParser()
     parser.add_argument("--config", help="A yaml config file. Must always be specified.", required=True)
     parser.add_argument("--loop", help="If set, then runs in an endless loop.", required=False, action="store_true")
+    parser.add_argument("--workers", help="Number of worker processes per evaluation.", type=int, default=1)
+    parser.add_argument("--seed", help="Seed of the evaluations (default: a different one for each).", type=int, default=None)
+    parser.add_argument("--sequential", help="If set, stops an evaluation as soon as it is clear whether the checkpoint beats the "
+                                             "best one so far (sequential probability ratio test).", action="store_true")
+    parser.add_argument("--sprt-delta", help="Win rates within +-delta of the best checkpoint are considered equal.",
+                        type=float, default=0.01)
+    parser.add_argument("--deal-corpus", help="Evaluate on the deals of this corpus (see generate_deal_corpus.py).", default=None)
+    parser.add_argument("--paired", help="If set, every deal is also played by a RuleBasedAgent, and the difference is reported.",
+                        action="store_true")
     args = parser.parse_args()
     do_loop = args.loop is True
 
@@ -62,19 +81,11 @@ def main():
                     os.rename(checkpoint_path_in, checkpoint_path_tmp)
                     logger.info('Found a new checkpoint, evaluating...')
 
-                    # Create agent
                     agent_type = config["training"]["player_agents"][i_agent]
-                    if agent_type == "DQNAgent":
-                        alphasheep_agent = DQNAgent(0, config=config, training=False)
-                    else:
+                    if agent_type != "DQNAgent":
                         raise ValueError(f"Unknown agent type specified: {agent_type}")
-                    alphasheep_agent.load_weights(checkpoint_path_tmp)
-
-                    # Eval agent
-                    current_perf = eval_agent(alphasheep_agent)
 
-                    # Now we know the performance. Find best-performing previous checkpoint that exists on disk
-                    logger.info("Comparing performance to previous checkpoints...")
+                    # Find best-performing previous checkpoint that exists on disk
                     splitext = os.path.splitext(cp_path)
                     checkpoints = glob.glob("{}-*{}".format(splitext[0], splitext[1]))
                     best_perf = 0.
@@ -90,7 +101,32 @@ def main():
                     else:
                         logger.info("Did not find any previous results.")
 
-                    if current_perf > best_perf:
+                    # Agent factory (every eval worker creates its own agent and loads the exported weights)
+                    weights_path = export_checkpoint(config, checkpoint_path_tmp)
+                    try:
+                        factory = agent_factory("dqn-inference", weights_path=weights_path)
+                        eval_args = dict(n_workers=args.workers, reference_factory=RuleBasedAgent if args.paired else None,
+                                         deal_corpus=args.deal_corpus)
+
+                        # Eval agent. In sequential mode, stop as soon as we know whether it beats the best checkpoint.
+                        sequential_test = None
+                        if args.sequential and best_perf > 0:
+                            sequential_test = SequentialTest(best_perf, delta=args.sprt_delta)
+                        result = eval_agent(factory, seed=args.seed, sequential_test=sequential_test, **eval_args)
+                        is_new_best = result.verdict if result.verdict is not None else result.mean_win_rate > best_perf
+                        if is_new_best and result.verdict is not None:
+                            # The win rate of a test that stopped early is biased (it stopped because the games went well),
+                            # so it must not become the reference for the next checkpoints. Play all games (with the same
+                            # seed, the games that were played already are replayed exactly).
+                            logger.info("Completing the evaluation of the new best checkpoint...")
+                            result = eval_agent(factory, seed=result.seed, **eval_args)
+                    finally:
+                        os.remove(weights_path)
+                    current_perf = result.mean_win_rate
+                    logger.info("Performance: {:.4f} (95% CI: {:.4f}-{:.4f}) after {} games.".format(
+                        current_perf, result.ci_low, result.ci_high, result.n_games))
+
+                    if is_new_best:
                         best_perf = current_perf
                         logger.info("Found new best-performing checkpoint!")
                         cp_best = "{}-{}{}".format(splitext[0], str(best_perf), splitext[1])
@@ -1,10 +1,14 @@
+import math
+import multiprocessing
 import numpy as np
 import os
 from timeit import default_timer as timer
+from statistics import NormalDist
+from typing import Callable, NamedTuple, Optional, Tuple
 
 from simulator.player_agent import PlayerAgent
 from agents.rule_based.rule_based_agent import RuleBasedAgent
-from simulator.controller.dealing_behavior import DealWinnableHand, DealExactly
+from simulator.controller.dealing_behavior import DealWinnableHand, DealExactly, DealFromCorpus
 from simulator.controller.game_controller import GameController
 from simulator.card_defs import Suit
 from simulator.game_mode import GameMode, GameContract
@@ -12,67 +16,274 @@ from simulator.game_state import Player
 from utils.log_util import get_named_logger
 
 
-def eval_agent(agent: PlayerAgent) -> float:
+# Number of games per shard. The games are always split into the same shards (with the same seeds), no matter how many
+# worker processes are used - so the results only depend on the seed.
+SHARD_SIZE = 500
+
+
+class EvalResult(NamedTuple):
+    """ Result of eval_agent(). """
+    mean_win_rate: float                # Mean win rate of the agent over all games.
+    n_games: int                        # Number of games that were played (fewer than requested if stopped early).
+    shard_win_rates: np.ndarray         # Mean win rate per shard.
+    seed: int                           # Seed of the evaluation. Pass it to eval_agent() to reproduce the result.
+    ci_low: float                       # Confidence interval of the win rate (Wilson score interval).
+    ci_high: float
+    verdict: Optional[bool] = None      # Result of the SequentialTest (if any): True if better than the reference,
+                                        # False if not, None if undecided after all games.
+    paired_diff: Optional[float] = None         # Paired evaluation only: mean difference in win rate to the reference agent
+    paired_ci_low: Optional[float] = None       # (on the same deals), and its confidence interval.
+    paired_ci_high: Optional[float] = None
+
+
+def wilson_interval(n_won: float, n_games: int, confidence: float = 0.95) -> Tuple[float, float]:
     """
-    Evaluates an agent by playing a large number of games against 3 RuleBasedAgents.
+    Returns the Wilson score interval of a win rate.
+    :param n_won: number of games won.
+    :param n_games: number of games played.
+    :param confidence: the confidence level.
+    """
+    if n_games == 0:
+        return 0., 1.
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    p = n_won / n_games
+    denom = 1 + z**2 / n_games
+    center = (p + z**2 / (2 * n_games)) / denom
+    half_width = z * math.sqrt(p * (1 - p) / n_games + z**2 / (4 * n_games**2)) / denom
+    return max(0., center - half_width), min(1., center + half_width)
 
-    :param agent: The agent to evaluate.
-    :return: The mean win rate of the agent.
+
+class SequentialTest:
+    """
+    Sequential probability ratio test (SPRT) whether an agent's win rate is better than a reference win rate
+    (e.g. the best checkpoint so far). Tests p = reference + delta against p = reference - delta, so that the verdict
+    is reached quickly when the agent is clearly better or worse, and only win rates within +-delta of the reference need many games.
     """
 
-    logger = get_named_logger("{}.eval_agent".format(os.path.splitext(os.path.basename(__file__))[0]))
-    # logger.setLevel(logging.DEBUG)
+    def __init__(self, reference_win_rate: float, delta: float = 0.01, alpha: float = 0.05, beta: float = 0.05):
+        """
+        :param reference_win_rate: the win rate to compare against.
+        :param delta: half-width of the indifference region around the reference.
+        :param alpha: probability of wrongly deciding "better".
+        :param beta: probability of wrongly deciding "not better".
+        """
+        p0 = min(max(reference_win_rate - delta, 1e-6), 1 - 1e-6)
+        p1 = min(max(reference_win_rate + delta, 1e-6), 1 - 1e-6)
+        self.reference_win_rate = reference_win_rate
+        self._llr_win = math.log(p1 / p0)
+        self._llr_loss = math.log((1 - p1) / (1 - p0))
+        self._upper = math.log((1 - beta) / alpha)
+        self._lower = math.log(beta / (1 - alpha))
+
+    def verdict(self, n_won: float, n_games: int) -> Optional[bool]:
+        """
+        Evaluates the test after n_games games (in total).
+        :return: True if the agent is better than the reference, False if not, None if more games are needed.
+        """
+        llr = n_won * self._llr_win + (n_games - n_won) * self._llr_loss
+        if llr >= self._upper:
+            return True
+        if llr <= self._lower:
+            return False
+        return None
 
-    # Main set of players
-    players = [
-        Player("0-agent", agent=agent),
+
+# The agents of the current worker process, see _init_worker().
+_worker_agent = None
+_worker_reference_agent = None
+
+
+def _eval_game_mode() -> GameMode:
+    # Rig the game so Player 0 has the cards to play a Herz-Solo.
+    return GameMode(GameContract.suit_solo, trump_suit=Suit.herz, declaring_player_id=0)
+
+
+def _init_worker(agent_factory: Callable[[int], PlayerAgent], reference_factory: Optional[Callable[[int], PlayerAgent]]):
+    global _worker_agent, _worker_reference_agent
+    _worker_agent = agent_factory(0)
+    _worker_reference_agent = reference_factory(0) if reference_factory is not None else None
+
+
+def _eval_shard(shard_args) -> Tuple[float, float, float]:
+    # Plays a single shard of games with the agent of this process.
+    # Returns the mean win rate, and in paired mode the sum and the sum of squares of the per-deal differences to the reference.
+    i_first_game, n_games, seed_seq, deal_corpus = shard_args
+    np.random.seed(seed_seq.generate_state(4))
+
+    # Main set of players (opponents are shared with the reference agent, which plays the same deals from the same seat)
+    opponents = [
         Player("1-Zenzi", agent=RuleBasedAgent(1)),
         Player("2-Franz", agent=RuleBasedAgent(2)),
         Player("3-Andal", agent=RuleBasedAgent(3))
     ]
+    players = [Player("0-agent", agent=_worker_agent)] + opponents
+    if _worker_reference_agent is not None:
+        reference_players = [Player("0-reference", agent=_worker_reference_agent)] + opponents
 
-    # Rig the game so Player 0 has the cards to play a Herz-Solo.
-    game_mode = GameMode(GameContract.suit_solo, trump_suit=Suit.herz, declaring_player_id=0)
-    rng_dealer = DealWinnableHand(game_mode)
+    game_mode = _eval_game_mode()
+    # With a deal corpus, game i of the evaluation is always deal i of the corpus.
+    if deal_corpus is None:
+        rng_dealer = DealWinnableHand(game_mode)
+    else:
+        rng_dealer = DealFromCorpus(deal_corpus, game_mode, start=i_first_game)
 
-    # Run 20k different games. Each game can be replicated (via DealExactly) and sampled multiple times.
+    # Each game can be replicated (via DealExactly) and sampled multiple times.
     # Right now, our baseline (RuleBasedAgent) is almost deterministic, so it's ok to sample each game only once.
-    n_games = 20000
     n_agent_samples = 1
     perf_record = np.empty(n_games, dtype=np.float32)
+    diff_record = np.zeros(n_games, dtype=np.float32)
 
-    time_start = timer()
-    for i_game in range(n_games):
-        if i_game > 0 and i_game % 100 == 0:
-            s_elapsed = timer() - time_start
-            mean_perf = np.mean(perf_record[:i_game])
-            logger.info("Ran {} games. Mean agent winrate={:.3f}. "
-                        "Speed is {:.1f} games/second.".format(i_game, mean_perf, i_game/s_elapsed))
-
+    for i in range(n_games):
         # Deal a single random hand and then create a dealer that will replicate this hand,
         # so we can take multiple samples of this game.
         player_hands = rng_dealer.deal_hands()
         replicating_dealer = DealExactly(player_hands)
-        i_player_dealer = i_game % 4
+        i_player_dealer = (i_first_game + i) % 4
 
         def sample_games(sample_players, n_samples):
             n_samples_won = 0
             for i_sample in range(n_samples):
                 controller = GameController(sample_players, i_player_dealer=i_player_dealer,
-                                            dealing_behavior=replicating_dealer, forced_game_mode=game_mode)
+                                            dealing_behavior=replicating_dealer, forced_game_mode=game_mode, fast=True)
                 winners = controller.run_game()
                 if winners[0] is True:
                     n_samples_won += 1
             return n_samples_won / n_samples
 
-        agent_win_rate = sample_games(players, n_agent_samples)
-        logger.debug("Agent win rate: {:.1%}.".format(agent_win_rate))
+        rng_state = np.random.get_state()
+        perf_record[i] = sample_games(players, n_agent_samples)
+        if _worker_reference_agent is not None:
+            # Duplicate game: the reference agent sees exactly the same random events. Afterwards, continue as if it
+            # never played, so the agent's results are the same as in an unpaired evaluation.
+            rng_state_after = np.random.get_state()
+            np.random.set_state(rng_state)
+            diff_record[i] = perf_record[i] - sample_games(reference_players, n_agent_samples)
+            np.random.set_state(rng_state_after)
+
+    return np.mean(perf_record).item(), np.sum(diff_record).item(), np.sum(np.square(diff_record)).item()
+
+
+def eval_agent(agent_factory: Callable[[int], PlayerAgent], n_games: int = 20000, n_workers: int = 1,
+               seed: Optional[int] = None, sequential_test: Optional[SequentialTest] = None,
+               max_ci_half_width: Optional[float] = None,
+               reference_factory: Optional[Callable[[int], PlayerAgent]] = None,
+               deal_corpus: Optional[str] = None) -> EvalResult:
+    """
+    Evaluates an agent by playing a large number of games against 3 RuleBasedAgents.
 
-        perf_record[i_game] = agent_win_rate
+    The games are split into shards of SHARD_SIZE games, which are played by a pool of worker processes. Each shard has its own
+    seed (derived from the main seed), so the result is reproducible and does not depend on n_workers.
+    Optionally, the evaluation stops early (after a shard) as soon as the verdict of a SequentialTest is settled, or the
+    confidence interval is narrow enough. Since the shards are evaluated in order, this is reproducible as well.
+
+    Paired (duplicate) evaluation: if a reference agent is given, every deal is also played by the reference agent, from the same
+    seat against the same opponents. The per-deal differences cancel most of the luck of the deal, so differences between agents
+    are resolved with far fewer games than by comparing two win rates.
+
+    :param agent_factory: Creates the agent to evaluate, given its player id (e.g. an agent class, or a functools.partial that
+                          also loads a checkpoint). Must be picklable if n_workers > 1; every worker creates its own agent.
+    :param n_games: (Maximum) number of games to play.
+    :param n_workers: Number of worker processes. If 1, all games are played in this process.
+    :param seed: Optional - seed of the evaluation. If None, a random seed is chosen (and returned in the result).
+    :param sequential_test: Optional - stop as soon as this test reaches a verdict.
+    :param max_ci_half_width: Optional - stop as soon as the 95% confidence interval is at most +-max_ci_half_width.
+    :param reference_factory: Optional - creates the reference agent for a paired evaluation (e.g. RuleBasedAgent).
+    :param deal_corpus: Optional - deal corpus file (see generate_deal_corpus.py) with Herz-Solo deals for player 0
+                        (checked against the metadata of the corpus).
+                        If given, the first n_games deals of the corpus are played (a fixed benchmark set).
+    :return: The mean win rate of the agent, along with the confidence interval and per-shard stats.
+    """
+
+    logger = get_named_logger("{}.eval_agent".format(os.path.splitext(os.path.basename(__file__))[0]))
+    # logger.setLevel(logging.DEBUG)
+
+    if deal_corpus is not None:
+        # Raises a ValueError right away if the corpus is not for the Herz-Solo of player 0.
+        corpus = DealFromCorpus(deal_corpus, _eval_game_mode())
+        if corpus.dealer != "winnable":
+            logger.warning('The deals of the corpus are not winnable hands (dealer: "{}"), the win rate is not comparable '
+                           'to an evaluation without a corpus.'.format(corpus.dealer))
+        corpus_len = len(corpus)
+        if n_games > corpus_len:
+            logger.warning("The deal corpus only has {} deals, evaluating on these.".format(corpus_len))
+            n_games = corpus_len
+
+    seed_seq = np.random.SeedSequence(seed)
+    seed = seed_seq.entropy
+    n_shards = (n_games + SHARD_SIZE - 1) // SHARD_SIZE
+    shards = [(i * SHARD_SIZE, min(SHARD_SIZE, n_games - i * SHARD_SIZE), s, deal_corpus)
+              for i, s in enumerate(seed_seq.spawn(n_shards))]
+    logger.info("Evaluating {} games in {} shards with {} worker(s), seed={}.".format(n_games, n_shards, n_workers, seed))
+
+    shard_win_rates = np.empty(n_shards, dtype=np.float64)
+    shard_lens = [s[1] for s in shards]
+    n_shards_done = 0
+    n_games_done = 0
+    n_won = 0.
+    diff_sum = 0.
+    diff_sq_sum = 0.
+    verdict = None
+
+    def paired_interval():
+        # Mean of the paired differences, and its 95% confidence interval (normal approximation).
+        mean_diff = diff_sum / n_games_done
+        var = max(diff_sq_sum / n_games_done - mean_diff**2, 0.) * n_games_done / max(n_games_done - 1, 1)
+        half_width = NormalDist().inv_cdf(0.975) * math.sqrt(var / n_games_done)
+        return mean_diff, mean_diff - half_width, mean_diff + half_width
+
+    def process_shard_result(i_shard, shard_result) -> bool:
+        # Returns True if we can stop.
+        nonlocal n_shards_done, n_games_done, n_won, diff_sum, diff_sq_sum, verdict
+        win_rate, shard_diff_sum, shard_diff_sq_sum = shard_result
+        shard_win_rates[i_shard] = win_rate
+        n_shards_done = i_shard + 1
+        n_games_done += shard_lens[i_shard]
+        n_won += win_rate * shard_lens[i_shard]
+        diff_sum += shard_diff_sum
+        diff_sq_sum += shard_diff_sq_sum
+        ci_low, ci_high = wilson_interval(n_won, n_games_done)
+        logger.info("Ran {} games. Mean agent winrate={:.3f} (95% CI: {:.3f}-{:.3f}). "
+                    "Speed is {:.1f} games/second.".format(n_games_done, n_won / n_games_done, ci_low, ci_high,
+                                                          n_games_done / (timer() - time_start)))
+        if reference_factory is not None:
+            logger.info("Paired difference to reference agent={:+.3f} (95% CI: {:+.3f}-{:+.3f}).".format(*paired_interval()))
+
+        if sequential_test is not None:
+            verdict = sequential_test.verdict(n_won, n_games_done)
+            if verdict is not None:
+                logger.info("Sequential test: agent is {} than the reference ({:.3f}).".format(
+                    "better" if verdict else "not better", sequential_test.reference_win_rate))
+                return True
+        return max_ci_half_width is not None and (ci_high - ci_low) / 2 <= max_ci_half_width
+
+    time_start = timer()
+    if n_workers <= 1:
+        # The shards seed the global RNG. Restore the caller's state afterwards (e.g. evaluations during training).
+        rng_state = np.random.get_state()
+        try:
+            _init_worker(agent_factory, reference_factory)
+            for i_shard, shard in enumerate(shards):
+                if process_shard_result(i_shard, _eval_shard(shard)):
+                    break
+        finally:
+            np.random.set_state(rng_state)
+    else:
+        # Spawn (instead of fork), so that the workers can safely initialize libraries like TensorFlow.
+        # When stopping early, leaving the with-block terminates the remaining shards.
+        ctx = multiprocessing.get_context("spawn")
+        with ctx.Pool(n_workers, initializer=_init_worker, initargs=(agent_factory, reference_factory)) as pool:
+            for i_shard, shard_result in enumerate(pool.imap(_eval_shard, shards)):
+                if process_shard_result(i_shard, shard_result):
+                    break
 
     s_elapsed = timer() - time_start
-    mean_perf = np.mean(perf_record).item()
-    logger.info("Finished evaluation. Took {:.0f} seconds.".format(s_elapsed))
-    logger.info("Mean agent winrate={:.3f}.".format(mean_perf))
+    mean_perf = n_won / n_games_done
+    ci_low, ci_high = wilson_interval(n_won, n_games_done)
+    logger.info("Finished evaluation after {} games. Took {:.0f} seconds.".format(n_games_done, s_elapsed))
+    logger.info("Mean agent winrate={:.3f} (95% CI: {:.3f}-{:.3f}).".format(mean_perf, ci_low, ci_high))
+
+    paired_diff, paired_ci_low, paired_ci_high = paired_interval() if reference_factory is not None else (None, None, None)
 
-    return mean_perf
+    return EvalResult(mean_win_rate=mean_perf, n_games=int(n_games_done), shard_win_rates=shard_win_rates[:n_shards_done],
+                      seed=seed, ci_low=ci_low, ci_high=ci_high, verdict=verdict,
+                      paired_diff=paired_diff, paired_ci_low=paired_ci_low, paired_ci_high=paired_ci_high)
@@ -0,0 +1,31 @@
+"""
+Exports a DQNAgent checkpoint (.h5) to a .npz file, which can be played by InferenceDQNAgent without TensorFlow.
+"""
+
+import argparse
+import os
+
+from agents.reinforcment_learning.dqn_agent import DQNAgent
+from utils.config_util import load_config
+from utils.log_util import init_logging, get_named_logger
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--config", help="The yaml config file of the agent.", required=True)
+    parser.add_argument("--checkpoint", help="The checkpoint (.h5) to export.", required=True)
+    parser.add_argument("--out", help="The .npz file to write (default: next to the checkpoint).", default=None)
+    args = parser.parse_args()
+
+    init_logging()
+    logger = get_named_logger("{}.main".format(os.path.splitext(os.path.basename(__file__))[0]))
+
+    out_path = args.out or os.path.splitext(args.checkpoint)[0] + ".npz"
+    agent = DQNAgent(0, config=load_config(args.config), training=False)
+    agent.load_weights(args.checkpoint)
+    agent.export_weights(out_path)
+    logger.info(f'Wrote "{out_path}".')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""
+Pre-generates a corpus of deals for a game mode, for use with DealFromCorpus.
+
+The corpus is a .npy file of shape (N, 32) with card ids (uint8): the first 8 are the hand of player 0, the next 8 of player 1, etc.
+The game mode, the declaring player and the dealer are written to a metadata file next to it (e.g. deals.yaml for deals.npy).
+Since it is memory-mapped when loading, dealing from it costs nothing, and every run plays exactly the same deals.
+"""
+
+import argparse
+import os
+
+import numpy as np
+
+from simulator.card_defs import Suit
+from simulator.controller.dealing_behavior import DealFairly, DealWinnableHand, save_corpus_metadata
+from simulator.game_mode import GameMode, GameContract
+from utils.log_util import init_logging, get_named_logger
+
+
+def parse_game_mode(name: str, declaring_player_id: int) -> GameMode:
+    """ Creates a game mode from a name like "herz-solo" or "wenz". """
+    if name == "wenz":
+        return GameMode(GameContract.wenz, declaring_player_id=declaring_player_id)
+    suit_name, contract_name = name.split("-")
+    if contract_name != "solo":
+        raise ValueError(f'Unknown game mode: "{name}"')
+    return GameMode(GameContract.suit_solo, trump_suit=Suit[suit_name], declaring_player_id=declaring_player_id)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--out", help="The .npy file to write.", required=True)
+    parser.add_argument("--n-deals", help="Number of deals to generate.", type=int, required=True)
+    parser.add_argument("--game-mode", type=str, default="herz-solo",
+                        choices=[f"{s.name}-solo" for s in Suit] + ["wenz"])
+    parser.add_argument("--declaring-player", type=int, default=0)
+    parser.add_argument("--dealer", help="fair: deal randomly. winnable: the declaring player can always play the game mode.",
+                        type=str, choices=["fair", "winnable"], default="winnable")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    init_logging()
+    logger = get_named_logger("{}.main".format(os.path.splitext(os.path.basename(__file__))[0]))
+
+    np.random.seed(args.seed)
+    game_mode = parse_game_mode(args.game_mode, args.declaring_player)
+    dealer = DealWinnableHand(game_mode) if args.dealer == "winnable" else DealFairly()
+    logger.info(f"Generating {args.n_deals} deals for {game_mode} (declaring player {args.declaring_player}, dealer: {args.dealer})...")
+
+    deals = np.lib.format.open_memmap(args.out, mode="w+", dtype=np.uint8, shape=(args.n_deals, 32))
+    chunk_size = 100000
+    for i_start in range(0, args.n_deals, chunk_size):
+        n = min(chunk_size, args.n_deals - i_start)
+        hands = dealer.deal_hands_batch(n)
+        # The 8 card ids of each hand, in ascending order.
+        card_ids = np.argsort(~hands, axis=2, kind="stable")[:, :, :8]
+        deals[i_start:i_start + n] = card_ids.reshape(n, 32)
+        logger.info(f"Generated {i_start + n} deals.")
+    deals.flush()
+    save_corpus_metadata(args.out, game_mode, args.dealer, args.n_deals)
+
+    if args.dealer == "winnable":
+        logger.info("Acceptance rate of the winnable hand dealer: {:.2%}".format(dealer.acceptance_rate))
+    logger.info(f'Wrote "{args.out}".')
+
+
+if __name__ == '__main__':
+    main()
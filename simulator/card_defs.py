@@ -7,6 +7,7 @@ saved model checkpoints.
 """
 
 from enum import IntEnum
+from typing import Iterable, Iterator, Set
 
 
 class Suit(IntEnum):
@@ -34,25 +35,41 @@ class Pip(IntEnum):
 
 
 class Card:
-    def __init__(self, suit: Suit, pip: Pip):
-        self.suit = suit
-        self.pip = pip
-        # in line as it is set only once, instead of self._get_code()
-        self.code = SUIT_CODE[self.suit] + PIP_CODE[self.pip]
+    """
+    There are only 32 Card instances, which are created once when this module is loaded (see _DECK).
+    Card(suit, pip) does not create a new object, but returns the canonical instance. Therefore, cards are compared by identity.
+    """
+
+    __slots__ = ("suit", "pip", "code", "id")
+
+    def __new__(cls, suit: Suit, pip: Pip):
+        if not (0 <= suit <= 3 and 1 <= pip <= 8):
+            raise ValueError("Invalid card: suit={}, pip={}".format(suit, pip))
+        return _DECK[suit * 8 + pip - 1]
 
-        # There are some performance problems doing enum lookups, apparently Python implements them in a bit of a convoluted way.
-        # We often use Card as a dict key, so this has turned out to be a bit problematic. It turns out to be much faster
-        # to just precalc a unique card ID instead of comparing suits and pips (Python 3.5).
-        self._unique_hash = hash(Card) * 23 + self.suit.value * 23 + self.pip.value
+    @classmethod
+    def _create(cls, suit: Suit, pip: Pip) -> "Card":
+        # Only used for creating the canonical instances.
+        card = object.__new__(cls)
+        card.suit = suit
+        card.pip = pip
+        # in line as it is set only once, instead of self._get_code()
+        card.code = SUIT_CODE[suit] + PIP_CODE[pip]
+        # Index of the card in new_deck(). This is also the bit index of the card in a CardSet.
+        card.id = suit.value * 8 + pip.value - 1
+        return card
 
     def __str__(self):
         return "({} {})".format(self.suit.name, self.pip.name)
 
-    def __eq__(self, other):
-        return isinstance(other, Card) and self._unique_hash == other._unique_hash
-
+    # Equality is identity (object default). Hashing by id is as cheap, and makes the iteration order of sets and dicts
+    # of Cards the same in every process, which keeps seeded runs reproducible.
     def __hash__(self):
-        return self._unique_hash
+        return self.id
+
+    def __reduce__(self):
+        # Unpickling (e.g. in worker processes) and copying also return the canonical instance.
+        return Card, (self.suit, self.pip)
 
     # def _get_code(self) -> str:
     #     """ Returns a 2 chars short name for pip and suit. 
@@ -96,6 +113,146 @@ SUIT_CODE = {
 #     """
 #     return card.suit.name[:1] + PIP_CODE[card.pip]
 
+# The canonical Card instances, in deck order. This is also the lookup table for converting card ids back into cards.
+_DECK = tuple(Card._create(suit, pip) for suit in Suit for pip in Pip)
+
+
 def new_deck():
-    """ Returns an ordered deck. """
-    return [Card(suit, pip) for suit in Suit for pip in Pip]
+    """ Returns an ordered deck. The tuple is shared, copy it (e.g. list(new_deck())) before shuffling. """
+    return _DECK
+
+
+def popcount(mask: int) -> int:
+    """ Returns the number of set bits in a card mask. """
+    return bin(mask).count("1")
+
+
+class CardSet:
+    """
+    Compact set of cards, stored as a 32-bit mask. Bit i is set if the card with id i (= index in new_deck()) is contained.
+
+    Supports the parts of the set API that are used by the simulator and agents (membership, iteration, add/remove, set
+    operations), so it can be used as a drop-in replacement for a set of Cards. Iteration is always in new_deck() order.
+    Operations between CardSets are plain integer operations, which is much faster than hashing Cards.
+    """
+
+    __slots__ = ("mask",)
+
+    def __init__(self, cards: Iterable[Card] = ()):
+        mask = 0
+        for card in cards:
+            mask |= 1 << card.id
+        self.mask = mask
+
+    @staticmethod
+    def from_mask(mask: int) -> "CardSet":
+        """ Creates a CardSet directly from a mask (no copy or validation). """
+        card_set = CardSet.__new__(CardSet)
+        card_set.mask = mask
+        return card_set
+
+    @staticmethod
+    def _mask_of(cards) -> int:
+        # Mask of another CardSet or any iterable of Cards.
+        if isinstance(cards, CardSet):
+            return cards.mask
+        mask = 0
+        for card in cards:
+            mask |= 1 << card.id
+        return mask
+
+    def to_set(self) -> Set[Card]:
+        """ Converts to a regular set of Cards. """
+        return set(self)
+
+    def copy(self) -> "CardSet":
+        return CardSet.from_mask(self.mask)
+
+    def __contains__(self, card) -> bool:
+        return isinstance(card, Card) and (self.mask >> card.id) & 1 == 1
+
+    def __iter__(self) -> Iterator[Card]:
+        mask = self.mask
+        while mask:
+            low_bit = mask & -mask
+            yield _DECK[low_bit.bit_length() - 1]
+            mask ^= low_bit
+
+    def __len__(self) -> int:
+        return popcount(self.mask)
+
+    def __bool__(self) -> bool:
+        return self.mask != 0
+
+    def __eq__(self, other):
+        if isinstance(other, CardSet):
+            return self.mask == other.mask
+        if isinstance(other, (set, frozenset)):
+            return self.to_set() == other
+        return NotImplemented
+
+    __hash__ = None                 # Mutable, just like set.
+
+    def __str__(self):
+        return "{" + ", ".join(str(c) for c in self) + "}"
+
+    def __repr__(self):
+        return "CardSet({:#010x})".format(self.mask)
+
+    # Set operations. The other operand can be a CardSet or any iterable of Cards.
+
+    def __or__(self, other) -> "CardSet":
+        return CardSet.from_mask(self.mask | CardSet._mask_of(other))
+
+    def __and__(self, other) -> "CardSet":
+        return CardSet.from_mask(self.mask & CardSet._mask_of(other))
+
+    def __sub__(self, other) -> "CardSet":
+        return CardSet.from_mask(self.mask & ~CardSet._mask_of(other))
+
+    def __xor__(self, other) -> "CardSet":
+        return CardSet.from_mask(self.mask ^ CardSet._mask_of(other))
+
+    def __ior__(self, other) -> "CardSet":
+        self.mask |= CardSet._mask_of(other)
+        return self
+
+    def __iand__(self, other) -> "CardSet":
+        self.mask &= CardSet._mask_of(other)
+        return self
+
+    def __isub__(self, other) -> "CardSet":
+        self.mask &= ~CardSet._mask_of(other)
+        return self
+
+    union = __or__
+    intersection = __and__
+    difference = __sub__
+
+    def update(self, cards: Iterable[Card]):
+        self.mask |= CardSet._mask_of(cards)
+
+    def difference_update(self, cards: Iterable[Card]):
+        self.mask &= ~CardSet._mask_of(cards)
+
+    def issubset(self, other) -> bool:
+        return self.mask & ~CardSet._mask_of(other) == 0
+
+    def isdisjoint(self, other) -> bool:
+        return self.mask & CardSet._mask_of(other) == 0
+
+    # Mutation of single cards.
+
+    def add(self, card: Card):
+        self.mask |= 1 << card.id
+
+    def remove(self, card: Card):
+        if card not in self:
+            raise KeyError(card)
+        self.mask &= ~(1 << card.id)
+
+    def discard(self, card: Card):
+        self.mask &= ~(1 << card.id)
+
+    def clear(self):
+        self.mask = 0
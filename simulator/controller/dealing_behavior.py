@@ -1,14 +1,36 @@
+import os
 from abc import ABC, abstractmethod
-from typing import Iterable, List
+from typing import Iterable, List, Tuple
 
 import numpy as np
 import yaml
 
-from simulator.card_defs import new_deck, Card, Suit, Pip
+from simulator.card_defs import new_deck, Card, CardSet, Suit, Pip
 from simulator.game_mode import GameMode, GameContract
 from utils.log_util import get_class_logger
 from utils.file_util import load_deck_from_yaml
 
+def shuffle_decks(n_deals: int) -> np.ndarray:
+    """
+    Shuffles many decks at once.
+    :return: int array (n_deals, 32): a random permutation of the card ids per deal. The first 8 cards are the hand of player 0,
+             the next 8 of player 1, etc.
+    """
+    return np.argsort(np.random.random((n_deals, 32)), axis=1)
+
+
+def hands_from_decks(decks: np.ndarray) -> np.ndarray:
+    """
+    Deals shuffled decks (see shuffle_decks()).
+    :return: bool array (n_deals, 4, 32), see VectorGameEnv.reset().
+    """
+    hands = np.zeros((len(decks), 4, 32), dtype=bool)
+    rows = np.arange(len(decks))[:, np.newaxis]
+    for i_p in range(4):
+        hands[rows, i_p, decks[:, i_p * 8:(i_p + 1) * 8]] = True
+    return hands
+
+
 class DealingBehavior(ABC):
     """
     Base class for various kinds of (possibly biased) dealers.
@@ -36,137 +58,120 @@ class DealFairly(DealingBehavior):
     """
 
     def deal_hands(self) -> List[Iterable[Card]]:
-        deck = new_deck()
+        deck = list(new_deck())
         np.random.shuffle(deck)
 
-        player_hands = [set(deck[i*8:(i+1)*8]) for i in range(4)]
+        player_hands = [CardSet(deck[i*8:(i+1)*8]) for i in range(4)]
         return player_hands
 
+    def deal_hands_batch(self, n_deals: int) -> np.ndarray:
+        """
+        Deals many games at once (e.g. for VectorGameEnv).
+        :return: bool array (n_deals, 4, 32), see VectorGameEnv.reset().
+        """
+        return hands_from_decks(shuffle_decks(n_deals))
+
 
 class DealWinnableHand(DealingBehavior):
     """
     This dealer is cheating - they always make sure that player X can play a specific game!
+
+    Candidate deals are shuffled in batches and filtered with vectorized tests of the declarer's hand. This is plain rejection
+    sampling (every accepted deal is uniformly random among all suitable deals), just many candidates at once.
+    Accepted deals that are not needed yet are kept for the next calls.
     """
 
-    def __init__(self, game_mode: GameMode):
+    def __init__(self, game_mode: GameMode, batch_size: int = 256):
+        """
+        :param game_mode: the game that the declaring player must be able to play.
+        :param batch_size: number of candidate deals that are shuffled and tested at once.
+        """
         assert game_mode.declaring_player_id is not None
+        if game_mode.contract != GameContract.suit_solo and game_mode.contract != GameContract.wenz:
+            raise NotImplementedError("Only Suit-solo and Wenz is implemented at this time.")
         self._game_mode = game_mode
+        self._batch_size = batch_size
         self.logger = get_class_logger(self)
         self.logger.debug("Initializing deal winnable hand with game: " + str(game_mode))
 
-    def deal_hands(self) -> List[Iterable[Card]]:
-        deck = new_deck()
+        self._deck = new_deck()
+        self._trump_bools = np.array([game_mode.is_trump(c) for c in self._deck])
+        self._accepted = np.zeros((0, 32), dtype=np.int64)         # Accepted deals (as permutations of card ids) not yet dealt.
 
-        # Repeat random shuffles until the player's cards are good enough.
-        i = 0
-        while True:
-            np.random.shuffle(deck)
-            player_hands = [set(deck[i * 8:(i + 1) * 8]) for i in range(4)]
-            if self._are_cards_suitable(player_hands[self._game_mode.declaring_player_id], self._game_mode):
-                return player_hands
-            i += 1
-            assert i < 2000
-
-    def _are_cards_suitable(self, cards_in_hand, game_mode: GameMode):
-        # Quick and dirty heuristic for deciding whether to play a solo.
+        # Statistics
+        self.n_candidates = 0
+        self.n_accepted = 0
 
-        #if game_mode.contract != GameContract.suit_solo:
-        #   raise NotImplementedError("Only Suit-solo is implemented at this time.")
+    @property
+    def acceptance_rate(self) -> float:
+        """ Fraction of candidate deals that were suitable so far. """
+        return self.n_accepted / self.n_candidates if self.n_candidates > 0 else 0.
 
-        if game_mode.contract != GameContract.suit_solo and game_mode.contract != GameContract.wenz:
-            raise NotImplementedError("Only Suit-solo and Wenz is implemented at this time.")
+    def deal_hands(self) -> List[Iterable[Card]]:
+        # Repeat random shuffles until the player's cards are good enough.
+        n_tried = 0
+        while len(self._accepted) == 0:
+            self._draw_batch()
+            n_tried += self._batch_size
+            assert n_tried < 100000
 
-        if game_mode.contract == GameContract.suit_solo:
-            # Needs 6 trumps and either good Obers or lots of Unters.
-            if sum(1 for c in cards_in_hand if game_mode.is_trump(c)) >= 6:
-                if sum(1 for c in cards_in_hand if c.pip == Pip.ober) >= 2:
-                    return True
-                elif sum(1 for c in cards_in_hand if c.pip == Pip.unter) >= 3:
-                    return True
-                elif Card(Suit.eichel, Pip.ober) in cards_in_hand:
-                    return True
-            return False
-
-        if game_mode.contract == GameContract.wenz:
-            unters = sum(1 for c in cards_in_hand if game_mode.is_trump(c))
-            # With 4 Unters:
-            if unters >= 4:
-                #self.logger.debug("unters count: " + str(unters))
-                #self.logger.debug("missing suits: " + str(self._missing_suits(cards_in_hand, game_mode)))
-                # 2 missing suits
-                if self._missing_suits(cards_in_hand, game_mode) >= 2:
-                    # Is Sau doppelt besetzt, 2 weitere derselben Farbe
-                    if self._count_suits_along_pip(cards_in_hand, game_mode, Pip.sau) >= 3:
-                        return True
-                    # at least king and 10
-                    if self._are_pips_in_a_suit(cards_in_hand, Pip.koenig, Pip.zehn):
-                        return True
-            # With 3 Unters:
-            if unters >= 3:
-                # 2 missing suits
-                #self.logger.debug("unters count: " + str(unters))
-                #self.logger.debug("missing suits: " + str(self._missing_suits(cards_in_hand, game_mode)))
-                if self._are_pips_in_a_suit(cards_in_hand, Pip.ober, Pip.ober):
-                    return True
-                if self._missing_suits(cards_in_hand, game_mode) >= 2:
-                    # Is Sau doppelt besetzt, 2 weitere derselben Farbe
-                    if self._count_suits_along_pip(cards_in_hand, game_mode, Pip.sau) >= 3:
-                        return False
-                    # at least king and 10
-                    if self._are_pips_in_a_suit(cards_in_hand, Pip.koenig, Pip.zehn):
-                        return False
-            # With 2 Unters:
-            if unters >= 2:
-                pass
-            return False
-
-        if game_mode.contract == GameContract.geier:
-            pass
-        if game_mode.contract == GameContract.farbwenz:
-            pass
-        if game_mode.contract == GameContract.farbgeier:
-            pass
-        if game_mode.contract == GameContract.bettel:
-            raise NotImplementedError("Sorry, can only deal for a Suit-solo or Wenz right now.")
-        return False
-
-    def _missing_suits(self, cards_in_hand, game_mode: GameMode) -> int:
-        """
-        Return the number of missing suits (Fehlfarben)
-        """
-        #return [Card(suit, pip) for suit in Suit for pip in Pip]
-        i = 0
-        for suit in Suit:
-            if sum(1 for c in cards_in_hand if c.suit == suit and not game_mode.is_trump(c)) <= 0:
-                i += 1
-        return i
-
-    def _are_pips_in_a_suit(self, cards_in_hand, pip1, pip2) -> bool:
-        """
-        Check wether pip1 and pip2 are together in a suit in the hand
-        """
-        for suit in Suit:
-            if Card(suit, pip1) in cards_in_hand:
-                if Card(suit, pip2) in cards_in_hand:
-                    return True
-        return False
-    
-    def _count_suits_along_pip(self, cards_in_hand, game_mode: GameMode, pip) -> int:
+        perm, self._accepted = self._accepted[0], self._accepted[1:]
+        return [CardSet(self._deck[i] for i in perm[i_p * 8:(i_p + 1) * 8]) for i_p in range(4)]
+
+    def deal_hands_batch(self, n_deals: int) -> np.ndarray:
         """
-        Return the number of non-trump cards of the same suit along with the card specified.
+        Deals many games at once (e.g. for VectorGameEnv).
+        :return: bool array (n_deals, 4, 32), see VectorGameEnv.reset().
         """
-        count = 0
-        count_max = 0
-        for suit in Suit:
-            if Card(suit, pip) in cards_in_hand:
-                count = sum(1 for c in cards_in_hand if c.suit == suit and not game_mode.is_trump(c))
-                # too many Spatz in a suit ?
-                if count > 2:
-                    if sum(1 for c in cards_in_hand if c.suit == suit and c.pip == 0) > (count - 2):
-                        count = 0
-            count_max = count if count > count_max else count_max
-            # one with pip
-        return count_max
+        while len(self._accepted) < n_deals:
+            self._draw_batch(max(self._batch_size, 2 * (n_deals - len(self._accepted))))
+
+        perms, self._accepted = self._accepted[:n_deals], self._accepted[n_deals:]
+        return hands_from_decks(perms)
+
+    def _draw_batch(self, batch_size: int = None):
+        # Shuffles a batch of candidate deals and keeps the suitable ones.
+        batch_size = batch_size or self._batch_size
+        perms = shuffle_decks(batch_size)
+        i_decl = self._game_mode.declaring_player_id
+        hands = np.zeros((batch_size, 32), dtype=bool)
+        hands[np.arange(batch_size)[:, np.newaxis], perms[:, i_decl * 8:(i_decl + 1) * 8]] = True
+
+        suitable = self._are_cards_suitable(hands)
+        self._accepted = np.concatenate([self._accepted, perms[suitable]])
+        self.n_candidates += batch_size
+        self.n_accepted += np.count_nonzero(suitable)
+        self.logger.debug("Acceptance rate of candidate deals: {:.2%}".format(self.acceptance_rate))
+
+    def _are_cards_suitable(self, hands: np.ndarray) -> np.ndarray:
+        # Quick and dirty heuristic for deciding whether to play a solo.
+        # hands: bool array (N, 32) of the declaring player's cards. Returns a bool array (N,).
+        # The cards of a hand as (N, suit, pip-1):
+        by_suit = hands.reshape(-1, 4, 8)
+        n_trumps = np.count_nonzero(hands & self._trump_bools, axis=1)
+        i_unter, i_ober, i_koenig, i_zehn, i_sau = Pip.unter - 1, Pip.ober - 1, Pip.koenig - 1, Pip.zehn - 1, Pip.sau - 1
+
+        if self._game_mode.contract == GameContract.suit_solo:
+            # Needs 6 trumps and either good Obers or lots of Unters.
+            n_obers = np.count_nonzero(by_suit[:, :, i_ober], axis=1)
+            n_unters = np.count_nonzero(by_suit[:, :, i_unter], axis=1)
+            return (n_trumps >= 6) & ((n_obers >= 2) | (n_unters >= 3) | by_suit[:, Suit.eichel, i_ober])
+
+        # Wenz: the trumps are the Unters.
+        # Number of non-trump cards per suit, and the number of missing suits (Fehlfarben).
+        n_per_suit = np.count_nonzero((hands & ~self._trump_bools).reshape(-1, 4, 8), axis=2)
+        n_missing_suits = np.count_nonzero(n_per_suit == 0, axis=1)
+        # Is Sau doppelt besetzt, 2 weitere derselben Farbe (cards of the longest suit with a Sau)
+        n_along_sau = np.max(np.where(by_suit[:, :, i_sau], n_per_suit, 0), axis=1)
+        # at least king and 10
+        koenig_zehn = np.any(by_suit[:, :, i_koenig] & by_suit[:, :, i_zehn], axis=1)
+        any_ober = np.any(by_suit[:, :, i_ober], axis=1)
+
+        # With 4 Unters: 2 missing suits and a strong suit.
+        with_4 = (n_trumps >= 4) & (n_missing_suits >= 2) & ((n_along_sau >= 3) | koenig_zehn)
+        # With 3 Unters: at least one Ober.
+        with_3 = (n_trumps >= 3) & any_ober
+        return with_4 | with_3
 
 
 class DealExactly(DealingBehavior):
@@ -179,7 +184,7 @@ class DealExactly(DealingBehavior):
 
     def deal_hands(self) -> List[Iterable[Card]]:
         # Create new list/sets to prevent modification
-        return [set(cards) for cards in self.player_hands]
+        return [CardSet(cards) for cards in self.player_hands]
 
 
 class DealExactlyFromYAMLFile(DealingBehavior):
@@ -192,8 +197,104 @@ class DealExactlyFromYAMLFile(DealingBehavior):
         self.logger.debug(
             "Initializing deal exactly with data from YAML file: " + str(filename))
         deck = load_deck_from_yaml(filename)
-        self.player_hands = [set(deck[i * 8:(i + 1) * 8]) for i in range(4)]
+        self.player_hands = [CardSet(deck[i * 8:(i + 1) * 8]) for i in range(4)]
 
     def deal_hands(self) -> List[Iterable[Card]]:
         # Create new list/sets to prevent modification
-        return [set(cards) for cards in self.player_hands]
+        return [CardSet(cards) for cards in self.player_hands]
+
+
+def corpus_metadata_filename(filename: str) -> str:
+    """ The metadata file of a deal corpus: the YAML file next to the .npy file, e.g. "deals.yaml" for "deals.npy". """
+    return os.path.splitext(filename)[0] + ".yaml"
+
+
+def save_corpus_metadata(filename: str, game_mode: GameMode, dealer: str, n_deals: int):
+    """
+    Writes the metadata file of a deal corpus (see DealFromCorpus).
+    :param filename: the corpus (.npy file).
+    :param game_mode: the game mode the deals were generated for (including the declaring player).
+    :param dealer: the dealer that generated the deals ("fair" or "winnable").
+    :param n_deals: number of deals in the corpus.
+    """
+    metadata = {
+        "contract": game_mode.contract.name,
+        "trump_suit": None if game_mode.trump_suit is None else game_mode.trump_suit.name,
+        "ruf_suit": None if game_mode.ruf_suit is None else game_mode.ruf_suit.name,
+        "declaring_player": game_mode.declaring_player_id,
+        "dealer": dealer,
+        "n_deals": n_deals,
+    }
+    with open(corpus_metadata_filename(filename), "w") as f:
+        yaml.safe_dump(metadata, f, sort_keys=False)
+
+
+def load_corpus_metadata(filename: str) -> Tuple[GameMode, str]:
+    """
+    Reads the metadata file of a deal corpus (see save_corpus_metadata()).
+    :return: the game mode the deals were generated for, and the dealer that generated them.
+    """
+    metadata_filename = corpus_metadata_filename(filename)
+    if not os.path.exists(metadata_filename):
+        raise ValueError(f'The deal corpus "{filename}" has no metadata file "{metadata_filename}". '
+                         f'Generate it again with generate_deal_corpus.py.')
+    with open(metadata_filename, "r") as f:
+        metadata = yaml.safe_load(f)
+    game_mode = GameMode(GameContract[metadata["contract"]], declaring_player_id=metadata["declaring_player"],
+                         trump_suit=None if metadata["trump_suit"] is None else Suit[metadata["trump_suit"]],
+                         ruf_suit=None if metadata["ruf_suit"] is None else Suit[metadata["ruf_suit"]])
+    return game_mode, metadata["dealer"]
+
+
+class DealFromCorpus(DealingBehavior):
+    """
+    Deals pre-generated games from a deal corpus (see generate_deal_corpus.py), which is memory-mapped - dealing is just an array read.
+    A corpus is a .npy file of shape (N, 32) with card ids: the first 8 are the hand of player 0, the next 8 of player 1, etc.
+    The game mode and the declaring player that the deals were generated for are stored in a metadata file next to it
+    (see save_corpus_metadata()), and must match the game that is played.
+
+    Order of the deals:
+    - "sequential": deals start, start+stride, start+2*stride, ... (wrapping around at the end of the corpus).
+                    Use start=i_worker and stride=n_workers so that parallel workers play disjoint deals.
+    - "random": deals a random game from the corpus every time.
+    """
+
+    def __init__(self, filename: str, game_mode: GameMode, mode: str = "sequential", start: int = 0, stride: int = 1):
+        """
+        :param filename: the corpus (.npy file).
+        :param game_mode: the game mode that is played with the deals. Raises a ValueError if the corpus was generated for a
+                          different game mode or declaring player.
+        :param mode: order of the deals, "sequential" or "random".
+        :param start: first deal (sequential mode).
+        :param stride: step between deals (sequential mode).
+        """
+        if mode not in ("sequential", "random"):
+            raise ValueError(f'Unknown mode: "{mode}"')
+        self.logger = get_class_logger(self)
+        self.game_mode, self.dealer = load_corpus_metadata(filename)
+        if (self.game_mode.contract, self.game_mode.trump_suit, self.game_mode.ruf_suit, self.game_mode.declaring_player_id) != \
+                (game_mode.contract, game_mode.trump_suit, game_mode.ruf_suit, game_mode.declaring_player_id):
+            raise ValueError(f'The deal corpus "{filename}" has deals for {self.game_mode} with declaring player '
+                             f'{self.game_mode.declaring_player_id}, not for {game_mode} with declaring player '
+                             f'{game_mode.declaring_player_id}.')
+        self.deals = np.load(filename, mmap_mode="r")
+        assert self.deals.ndim == 2 and self.deals.shape[1] == 32, "Not a deal corpus: " + str(filename)
+        self.logger.debug("Loaded deal corpus with {} deals for {} from {}".format(len(self.deals), self.game_mode, filename))
+
+        self._deck = new_deck()
+        self._mode = mode
+        self._next = start
+        self._stride = stride
+
+    def __len__(self):
+        return len(self.deals)
+
+    def deal_hands(self) -> List[Iterable[Card]]:
+        if self._mode == "random":
+            i_deal = np.random.randint(len(self.deals))
+        else:
+            i_deal = self._next % len(self.deals)
+            self._next += self._stride
+
+        deal = self.deals[i_deal]
+        return [CardSet(self._deck[i] for i in deal[i_p * 8:(i_p + 1) * 8]) for i_p in range(4)]
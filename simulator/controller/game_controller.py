@@ -1,27 +1,38 @@
-from typing import List
+import logging
+from typing import List, Optional
 
 import numpy as np
 
 from simulator.controller.dealing_behavior import DealFairly, DealingBehavior
-from simulator.card_defs import Suit, PIP_SCORES
+from simulator.card_defs import Card, Suit, PIP_SCORES
 from simulator.game_mode import GameMode, GameContract
+from simulator.game_record import GameRecordWriter
 from simulator.game_state import Player, GameState, GamePhase
 from utils.log_util import get_class_logger
 
 
+# Games that players can declare in the bidding phase, and their rank (higher beats lower).
+_CONTRACT_RANKS = {GameContract.wenz: 1, GameContract.suit_solo: 2}
+
+
 class GameController:
     """
     Main controller of the simulator. It reads and modifies the GameState while asking the agents for their moves.
     """
 
     def __init__(self, players: List[Player], i_player_dealer=0,
-                 dealing_behavior: DealingBehavior = DealFairly(), forced_game_mode: GameMode = None):
+                 dealing_behavior: DealingBehavior = DealFairly(), forced_game_mode: GameMode = None, fast: bool = False,
+                 game_recorder: GameRecordWriter = None):
         """
         Creates a GameController and, together with it, a GameState. Should be reused - run run_game() in order to simulate a single game.
         :param players: the players, along with their agents.
         :param i_player_dealer: The player who is the dealer at start (i+1 is the player who will lead in the first game).
         :param dealing_behavior: Optional - the dealing behaviour. Default = fair
         :param forced_game_mode: Optional - if not None, players cannot bid, but every game is always the provided mode.
+        :param fast: Optional - headless mode for training and evaluation. Does not fire game_state.ev_changed (so it can't be used
+                     with the GUI), does not log and skips the integrity checks (cards are assumed to be played by well-behaved agents).
+                     Since none of this affects the game, the outcome is the same as with fast=False (for the same random seed).
+        :param game_recorder: Optional - if not None, every finished game is written to this GameRecordWriter.
         """
         assert len(players) == 4
 
@@ -34,6 +45,11 @@ class GameController:
         self.game_state = GameState(players, i_player_dealer=i_player_dealer)
         self.dealing_behavior = dealing_behavior
         self.forced_game_mode = forced_game_mode
+        self.fast = fast
+        self._verbose = False           # Determined per game (the log level can be changed at any time).
+        self.game_recorder = game_recorder
+        self._record_hands = None       # Only used with a game_recorder: the hands as dealt, and all cards in order of playing.
+        self._record_plays = []
         assert forced_game_mode is None or forced_game_mode.declaring_player_id is not None, "Must provide a specific player."
 
     def run_game(self) -> List[bool]:
@@ -42,136 +58,207 @@ class GameController:
         :returns a list of 4 bools, indicating which player(s) won the game.
         """
 
-        def log_phase():
+        self.start_game()
+        self._playing_phase()
+        return self.finish_game()
+
+    def _log_phase(self):
+        if self._verbose:
             self.logger.debug("===== Entering Phase: {} =====".format(self.game_state.game_phase))
 
+    def start_game(self):
+        """
+        First part of run_game(): deals the cards and determines the game mode. Afterwards, the game is ready for the first card.
+        Use start_game(), play_card() and finish_game() for running a game step by step (instead of asking the agents).
+        """
+
         assert self.game_state.game_phase == GamePhase.pre_deal
+        self._verbose = not self.fast and self.logger.isEnabledFor(logging.DEBUG)
 
         for p in self.game_state.players:
             p.agent.notify_new_game()
 
         # DEALING PHASE
         self.game_state.game_phase = GamePhase.dealing
-        log_phase()
-        self.logger.debug("Player {} is dealing.".format(self.game_state.players[self.game_state.i_player_dealer]))
+        self._log_phase()
+        if self._verbose:
+            self.logger.debug("Player {} is dealing.".format(self.game_state.players[self.game_state.i_player_dealer]))
         hands = self.dealing_behavior.deal_hands()
         for i, p in enumerate(self.game_state.players):
             p.cards_in_hand = hands[i]
-        self.game_state.ev_changed.notify()
+        if self.game_recorder is not None:
+            self._record_hands = [h.copy() for h in hands]
+            self._record_plays.clear()
+        if not self.fast:
+            self.game_state.ev_changed.notify()
 
         # BIDDING PHASE
         # Choose the game mode and declaring player.
         self.game_state.game_phase = GamePhase.bidding
-        log_phase()
+        self._log_phase()
         if self.forced_game_mode is not None:
             # We have been instructed to only play this game.
             game_mode = self.forced_game_mode
         else:
-            # Free choice - for now, randomly select somebody to play a Herz Solo.
-            # TODO: allow agents to bid & declare on their own
-            game_mode = GameMode(GameContract.suit_solo, trump_suit=Suit.herz, declaring_player_id=np.random.randint(4))
-        i_decl = game_mode.declaring_player_id
-        self.logger.debug("Game Variant: Player {} is declaring a {}!".format(self.game_state.players[i_decl], game_mode))
+            # Free choice - the agents can declare a game.
+            game_mode = self._bidding()
+            if game_mode is None:
+                # Nobody wants to play - for now, randomly select somebody to play a Herz Solo.
+                game_mode = GameMode(GameContract.suit_solo, trump_suit=Suit.herz, declaring_player_id=np.random.randint(4))
+        if self._verbose:
+            self.logger.debug("Game Variant: Player {} is declaring a {}!".format(
+                self.game_state.players[game_mode.declaring_player_id], game_mode))
         self.game_state.game_mode = game_mode
-        self.game_state.ev_changed.notify()
+        if not self.fast:
+            self.game_state.ev_changed.notify()
 
         # PLAYING PHASE
         self.game_state.game_phase = GamePhase.playing
-        log_phase()
-        self._playing_phase()
+        self._log_phase()
+
+        # Left of dealer leads the first trick.
+        i_p_leader = (self.game_state.i_player_dealer + 1) % 4
+        self.game_state.leading_player = self.game_state.players[i_p_leader]
+        self.game_state.current_player_index = i_p_leader
+
+    def _bidding(self) -> Optional[GameMode]:
+        # Asks every player once (starting left of the dealer) whether they want to declare a game.
+        # The highest game wins (a suit solo beats a Wenz); among equal games, the first player to declare it.
+        game_mode = None
+        for i in range(1, 5):
+            i_p = (self.game_state.i_player_dealer + i) % 4
+            player = self.game_state.players[i_p]
+            declared = player.agent.declare_game(player.cards_in_hand)
+            if declared is None:
+                continue
+            if declared.declaring_player_id != i_p or declared.contract not in _CONTRACT_RANKS:
+                raise ValueError("Player {} tried to declare {} (declaring player {}), but it's not allowed!".format(
+                    player, declared, declared.declaring_player_id))
+            if self._verbose:
+                self.logger.debug("Player {} wants to play a {}.".format(player, declared))
+            if game_mode is None or _CONTRACT_RANKS[declared.contract] > _CONTRACT_RANKS[game_mode.contract]:
+                game_mode = declared
+        return game_mode
+
+    def _playing_phase(self):
+        # Main phase of the game (trick taking). Asks the agents for their cards until all 8 tricks are played.
+
+        game_state = self.game_state
+        while game_state.current_player_index >= 0:
+            player = game_state.players[game_state.current_player_index]
+            if self._verbose:
+                if len(game_state.current_trick_cards) == 0:
+                    self.logger.debug("-- Trick {} --".format(8 - len(player.cards_in_hand) + 1))
+                self.logger.debug(f"Player {player} is playing.")
+            selected_card = player.agent.play_card(player.cards_in_hand,
+                                                   cards_in_trick=game_state.current_trick_cards,
+                                                   game_mode=game_state.game_mode)
+            self.play_card(selected_card)
+
+    def play_card(self, selected_card: Card):
+        """
+        The current player (game_state.current_player_index) plays a card.
+        If this completes the trick, it is scored and the winner becomes the next player. After the last trick, current_player_index is -1.
+        """
+
+        game_state = self.game_state
+        game_mode = game_state.game_mode
+        i_p = game_state.current_player_index
+        player = game_state.players[i_p]
+
+        if not self.fast:
+            # CHECK 1: Does the player have that card?
+            # This check is only for data integrity. More sophisticated logic (trying to play cards that are not available...)
+            #  should be handled by the players themselves. The controller will only accept cards that exist.
+            assert selected_card in player.cards_in_hand, f"{player} does not have {selected_card}!"
+
+            # CHECK 2: Do the rules allow the player to play that card?
+            if selected_card not in game_mode.legal_moves(player.cards_in_hand, game_state.current_trick_cards):
+                raise ValueError("Player {} tried to play {}, but it's not allowed!".format(player, selected_card))
+
+        if self._verbose:
+            self.logger.debug("Player {} is playing {}.".format(player, selected_card))
+        player.cards_in_hand.remove(selected_card)
+        game_state.current_trick_cards.append(selected_card)
+        if self.game_recorder is not None:
+            self._record_plays.append(selected_card)
+        if len(game_state.current_trick_cards) == 4:
+            game_state.current_player_index = -1
+        else:
+            game_state.current_player_index = (i_p + 1) % 4
+        if not self.fast:
+            game_state.ev_changed.notify()
+
+        if len(game_state.current_trick_cards) == 4:
+            self._finish_trick()
+
+    def _finish_trick(self):
+        # Determine winner of trick.
+        game_state = self.game_state
+        i_p_leader = game_state.players.index(game_state.leading_player)
+        i_win_card = game_state.game_mode.get_trick_winner(game_state.current_trick_cards)
+        i_win_player = (i_p_leader + i_win_card) % 4
+        win_player = game_state.players[i_win_player]
+        if self._verbose:
+            self.logger.debug("Player {} wins the trick with card {}.".format(win_player, game_state.current_trick_cards[i_win_card]))
+        for i, p in enumerate(game_state.players):
+            p.agent.notify_trick_result(game_state.current_trick_cards, rel_taker_id=i-i_win_player)
+
+        # Move the trick to the scored cards of the winner.
+        win_player.cards_in_scored_tricks.extend(game_state.current_trick_cards)
+        game_state.current_trick_cards.clear()
+        game_state.leading_player = win_player
+        if len(win_player.cards_in_hand) > 0:
+            game_state.current_player_index = i_win_player
+        else:
+            # That was the last trick.
+            assert self.fast or sum(len(p.cards_in_scored_tricks) for p in game_state.players) == 32
+            game_state.current_player_index = -1
+        if not self.fast:
+            game_state.ev_changed.notify()
+
+    def finish_game(self) -> List[bool]:
+        """
+        Last part of run_game(), after all tricks have been played: scores the game and prepares for the next one.
+        :returns a list of 4 bools, indicating which player(s) won the game.
+        """
 
         # POST-GAME PHASE
         # Count score and determine winner.
         # TODO: For now, always scoring a solo.
+        game_mode = self.game_state.game_mode
+        i_decl = game_mode.declaring_player_id
         self.game_state.game_phase = GamePhase.post_play
-        log_phase()
+        self._log_phase()
 
         player_scores = [sum(PIP_SCORES[c.pip] for c in p.cards_in_scored_tricks) for p in self.game_state.players]
-        for i, p in enumerate(self.game_state.players):
-            self.logger.debug("Player {} has score {}.".format(p, player_scores[i]))
         if player_scores[i_decl] > 60:
             player_win = [i == i_decl for i in range(4)]
         else:
             player_win = [i != i_decl for i in range(4)]
-        self.logger.debug("=> Player {} {} the {}!".format(self.game_state.players[i_decl], "wins" if player_win[i_decl] else "loses",
-                                                           game_mode))
+        if self._verbose:
+            for i, p in enumerate(self.game_state.players):
+                self.logger.debug("Player {} has score {}.".format(p, player_scores[i]))
+            self.logger.debug("=> Player {} {} the {}!".format(self.game_state.players[i_decl],
+                                                               "wins" if player_win[i_decl] else "loses", game_mode))
+            self.logger.debug("Summary:")
+            for i, p in enumerate(self.game_state.players):
+                self.logger.debug("Player {} {}.".format(p, "wins" if player_win[i] else "loses"))
 
-        self.logger.debug("Summary:")
         for i, p in enumerate(self.game_state.players):
-            self.logger.debug("Player {} {}.".format(p, "wins" if player_win[i] else "loses"))
             p.agent.notify_game_result(player_win[i], own_score=player_scores[i])
-        self.game_state.ev_changed.notify()
+        if self.game_recorder is not None:
+            self.game_recorder.write_game(self._record_hands, game_mode, self.game_state.i_player_dealer,
+                                          self._record_plays, player_scores, player_win)
+        if not self.fast:
+            self.game_state.ev_changed.notify()
 
         # Reset to PRE-DEAL PHASE.
         self.game_state.game_phase = GamePhase.pre_deal
-        log_phase()
+        self._log_phase()
         self.game_state.clear_after_game()
         self.game_state.i_player_dealer = (self.game_state.i_player_dealer + 1) % 4
-        self.game_state.ev_changed.notify()
+        if not self.fast:
+            self.game_state.ev_changed.notify()
 
         return player_win
-
-    def _playing_phase(self):
-        # Main phase of the game (trick taking).
-
-        # Some shortcuts
-        game_state = self.game_state
-        game_mode = self.game_state.game_mode
-
-        # Left of dealer leads the first trick.
-        i_p_leader = (game_state.i_player_dealer + 1) % 4
-        game_state.leading_player = game_state.players[i_p_leader]
-
-        # Playing 8 tricks
-        for i_trick in range(8):
-            self.logger.debug("-- Trick {} --".format(i_trick + 1))
-
-            # Players are playing in ascending order, starting with the leader.
-            for i_p in (np.arange(4) + i_p_leader) % 4:
-
-                # Get next card from player agent.
-                game_state.current_player_index = i_p
-                player = game_state.players[i_p]
-                self.logger.debug(f"Player {player} is playing.")
-                selected_card = player.agent.play_card(player.cards_in_hand,
-                                                       cards_in_trick=game_state.current_trick_cards,
-                                                       game_mode=game_mode)
-
-                # CHECK 1: Does the player have that card?
-                # This check is only for data integrity. More sophisticated logic (trying to play cards that are not available...)
-                #  should be handled by the players themselves. The controller will only accept cards that exist.
-                assert selected_card in player.cards_in_hand, f"{player} does not have {selected_card}!"
-
-                # CHECK 2: Do the rules allow the player to play that card?
-                if not game_mode.is_play_allowed(selected_card,
-                                                 cards_in_hand=player.cards_in_hand,
-                                                 cards_in_trick=game_state.current_trick_cards):
-                    raise ValueError("Player {} tried to play {}, but it's not allowed!".format(player, selected_card))
-
-                self.logger.debug("Player {} is playing {}.".format(player, selected_card))
-                player.cards_in_hand.remove(selected_card)
-                game_state.current_trick_cards.append(selected_card)
-                if len(game_state.current_trick_cards) == 4:
-                    game_state.current_player_index = -1
-                else:
-                    game_state.current_player_index = (i_p + 1) % 4
-                game_state.ev_changed.notify()
-
-            # Determine winner of trick.
-            i_win_card = game_mode.get_trick_winner(game_state.current_trick_cards)
-            i_win_player = (i_p_leader + i_win_card) % 4
-            win_card = game_state.current_trick_cards[i_win_card]
-            win_player = game_state.players[i_win_player]
-            self.logger.debug("Player {} wins the trick with card {}.".format(win_player, win_card))
-            for i, p in enumerate(self.game_state.players):
-                p.agent.notify_trick_result(game_state.current_trick_cards, rel_taker_id=i-i_win_player)
-
-            # Move the trick to the scored cards of the winner.
-            i_p_leader = i_win_player
-            game_state.current_player_index = i_p_leader
-            game_state.leading_player = game_state.players[i_p_leader]
-            win_player.cards_in_scored_tricks.extend(game_state.current_trick_cards)
-            game_state.current_trick_cards.clear()
-            game_state.ev_changed.notify()
-
-        assert sum(len(p.cards_in_scored_tricks) for p in game_state.players) == 32
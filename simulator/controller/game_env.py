@@ -0,0 +1,183 @@
+from typing import List, Optional, Tuple, Dict
+
+import numpy as np
+
+from simulator.card_defs import Card, new_deck, PIP_SCORES
+from simulator.controller.dealing_behavior import DealingBehavior, DealFairly
+from simulator.controller.game_controller import GameController
+from simulator.game_mode import GameMode
+from simulator.game_state import Player, GamePhase
+from simulator.player_agent import PlayerAgent
+
+
+class _EnvSeatAgent(PlayerAgent):
+    """
+    Placeholder agent for the learning seat of a GameEnv. Its cards are chosen by whoever calls GameEnv.step().
+    """
+
+    def play_card(self, cards_in_hand, cards_in_trick, game_mode):
+        raise ValueError("The learning seat is controlled through GameEnv.step().")
+
+
+class GameEnv:
+    """
+    Gym-style reset()/step() environment around GameController, for a single learning seat.
+    The other three seats are played by regular PlayerAgents, and the game runs exactly like in GameController.run_game().
+
+    Observations are written into a preallocated buffer, which is returned directly (no copy!). It is overwritten by the next
+    call to reset() or step(), so copy it if you need to keep it. The same goes for the mask of legal actions.
+    An action is the id of a card (see Card.id); the observation layout is that of DQNAgent (see state_contents).
+    """
+
+    # Length of each observation component.
+    STATE_LENS = {
+        "cards_in_hand": 32,
+        "cards_in_trick": 3*32,
+        "cards_already_played": 32
+    }
+
+    def __init__(self, agents: List[Optional[PlayerAgent]], i_player_dealer=0, dealing_behavior: DealingBehavior = DealFairly(),
+                 forced_game_mode: GameMode = None, fast: bool = False,
+                 state_contents=("cards_in_hand", "cards_in_trick", "cards_already_played"), obs_dtype=np.int32):
+        """
+        Creates the environment (along with a GameController).
+        :param agents: list(4). Exactly one entry must be None: this is the learning seat. The others are the agents of the other players.
+        :param i_player_dealer: The player who is the dealer at start.
+        :param dealing_behavior: Optional - the dealing behaviour. Default = fair
+        :param forced_game_mode: Optional - if not None, every game is always the provided mode.
+        :param fast: Optional - run the GameController in headless mode (see GameController).
+        :param state_contents: the observation components, in order (same names as in the DQNAgent config).
+        :param obs_dtype: dtype of the observation buffer.
+        """
+        assert len(agents) == 4 and sum(1 for a in agents if a is None) == 1, "Need exactly one learning seat."
+
+        self.player_id = agents.index(None)
+        players = [Player(f"{i}-env" if a is None else f"{i}-{a.__class__.__name__}", agent=a or _EnvSeatAgent(i))
+                   for i, a in enumerate(agents)]
+        self.controller = GameController(players, i_player_dealer=i_player_dealer, dealing_behavior=dealing_behavior,
+                                         forced_game_mode=forced_game_mode, fast=fast)
+        self.game_state = self.controller.game_state
+        self._player = players[self.player_id]
+
+        # Offsets of the observation components in the buffer.
+        self._offsets = {}
+        offset = 0
+        for comp in state_contents:
+            if comp not in GameEnv.STATE_LENS:
+                raise ValueError(f'Unknown state component name: "{comp}"')
+            self._offsets[comp] = offset
+            offset += GameEnv.STATE_LENS[comp]
+        self.observation_size = offset
+        self.action_size = 32
+
+        # Preallocated output buffers.
+        self.observation = np.zeros(self.observation_size, dtype=obs_dtype)
+        self.legal_actions = np.zeros(self.action_size, dtype=bool)
+        self._trick_obs_indices = []            # Bits currently set in the cards_in_trick component.
+
+        self._deck = new_deck()
+        self._done = True
+
+    def reset(self) -> np.ndarray:
+        """
+        Starts a new game and plays the other seats until it's the learning seat's turn.
+        :return: the observation buffer.
+        """
+
+        if self.game_state.game_phase != GamePhase.pre_deal:
+            raise ValueError("The previous game is still running. Need to play it until done before calling reset().")
+
+        self.controller.start_game()
+        self._done = False
+        self.observation[:] = 0
+        self._trick_obs_indices.clear()
+        self._set_cards("cards_in_hand", self._player.cards_in_hand)
+
+        self._play_other_seats()
+        self._update_observation()
+        return self.observation
+
+    def step(self, action: int) -> Tuple[np.ndarray, float, bool, Dict]:
+        """
+        Plays a card for the learning seat, and then for the other seats until it's the learning seat's turn again (or the game is over).
+        :param action: id of the card to play. Must be a legal action (see legal_actions).
+        :return: (observation, reward, done, info).
+                 The reward is 1.0 for a game won and 0 otherwise, and is only given at the end of the game.
+                 info contains the legal action mask, and once the game is over, the players' wins and scores.
+        """
+
+        if self._done:
+            raise ValueError("Game is over. Need to call reset() first.")
+        if not self.legal_actions[action]:
+            raise ValueError("Action {} ({}) is not allowed!".format(action, self._deck[action]))
+
+        card = self._deck[action]
+        self._play(card)
+        self._clear_bit("cards_in_hand", card)
+        self._play_other_seats()
+
+        info = {"legal_actions": self.legal_actions}
+        reward = 0.
+        if self.game_state.current_player_index < 0:
+            # All tricks have been played.
+            player_scores = [sum(PIP_SCORES[c.pip] for c in p.cards_in_scored_tricks) for p in self.game_state.players]
+            player_win = self.controller.finish_game()
+            info["player_win"] = player_win
+            info["player_scores"] = player_scores
+            reward = 1. if player_win[self.player_id] else 0.
+            self._done = True
+
+        self._update_observation()
+        return self.observation, reward, self._done, info
+
+    def _play_other_seats(self):
+        # Lets the agents play until it's the learning seat's turn or the game is over.
+        game_state = self.game_state
+        while 0 <= game_state.current_player_index != self.player_id:
+            player = game_state.players[game_state.current_player_index]
+            selected_card = player.agent.play_card(player.cards_in_hand,
+                                                   cards_in_trick=game_state.current_trick_cards,
+                                                   game_mode=game_state.game_mode)
+            self._play(selected_card)
+
+    def _play(self, card: Card):
+        # Plays a card through the controller, keeping track of the completed tricks.
+        completes_trick = len(self.game_state.current_trick_cards) == 3
+        self.controller.play_card(card)
+        if completes_trick:
+            # The trick has been moved to the winner (who is now the leading player).
+            for c in self.game_state.leading_player.cards_in_scored_tricks[-4:]:
+                self._set_bit("cards_already_played", c)
+
+    def _update_observation(self):
+        # Only the current trick and the legal actions need to be rewritten, the rest is updated incrementally.
+        for i in self._trick_obs_indices:
+            self.observation[i] = 0
+        self._trick_obs_indices.clear()
+        self.legal_actions[:] = False
+        if self._done:
+            return
+
+        cards_in_trick = self.game_state.current_trick_cards
+        if "cards_in_trick" in self._offsets:
+            offset = self._offsets["cards_in_trick"]
+            for i, card in enumerate(cards_in_trick):
+                self._trick_obs_indices.append(offset + i*32 + card.id)
+            for i in self._trick_obs_indices:
+                self.observation[i] = 1
+
+        legal = self.game_state.game_mode.legal_moves(self._player.cards_in_hand, cards_in_trick)
+        for card in legal:
+            self.legal_actions[card.id] = True
+
+    def _set_cards(self, comp: str, cards):
+        for card in cards:
+            self._set_bit(comp, card)
+
+    def _set_bit(self, comp: str, card: Card):
+        if comp in self._offsets:
+            self.observation[self._offsets[comp] + card.id] = 1
+
+    def _clear_bit(self, comp: str, card: Card):
+        if comp in self._offsets:
+            self.observation[self._offsets[comp] + card.id] = 0
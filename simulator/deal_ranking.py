@@ -0,0 +1,163 @@
+"""
+Combinatorial ranking of deals: every deal (4 hands of 8 cards) maps to a unique integer in [0, N_DEALS), and back.
+N_DEALS = 32! / (8!)^4, about 9.96e16, so a deal fits into a uint64 - e.g. as a key for deal corpora, result caches or
+deduplication.
+
+The rank is the colex rank of Player 0's hand among all 32 cards, followed by the rank of Player 1's hand among the 24 cards
+that are left, and of Player 2's hand among the remaining 16 cards (Player 3 gets the rest).
+
+The functions on arrays (rank_deals(), unrank_deals()) are vectorized over many deals; rank_deal() and unrank_deal() compute
+the same for a single deal.
+"""
+
+from math import comb
+from typing import Iterable, List, Sequence
+
+import numpy as np
+
+from simulator.card_defs import Card, CardSet, popcount
+
+# Binomial coefficients C(n, k) for n <= 32, k <= 8.
+_COMB = np.array([[comb(n, k) for k in range(9)] for n in range(33)], dtype=np.uint64)
+
+# Number of remaining cards when dealing to Player 0, 1, 2, and the number of possible hands for each of them.
+_N_REMAINING = (32, 24, 16)
+_N_HANDS = tuple(comb(n, 8) for n in _N_REMAINING)
+
+N_DEALS = _N_HANDS[0] * _N_HANDS[1] * _N_HANDS[2]
+
+_J = np.arange(1, 9)
+
+
+def _unpack(masks: np.ndarray) -> np.ndarray:
+    # uint32 card masks (..., ) -> bool array (..., 32).
+    masks = np.ascontiguousarray(masks, dtype="<u4")
+    return np.unpackbits(masks[..., np.newaxis].view(np.uint8), axis=-1, bitorder="little").astype(bool)
+
+
+def deal_masks(card_ids: np.ndarray) -> np.ndarray:
+    """
+    Converts deals given as card ids (e.g. of a deal corpus or game records) to card masks.
+    :param card_ids: int array (n_deals, 32) or (n_deals, 4, 8): the first 8 cards are the hand of player 0, etc.
+    :return: uint32 array (n_deals, 4) with the mask of each player's hand (see CardSet).
+    """
+    card_ids = np.asarray(card_ids).reshape(-1, 4, 8)
+    hands = np.zeros((len(card_ids), 4, 32), dtype=bool)
+    np.put_along_axis(hands, card_ids.astype(np.intp), True, axis=2)
+    return np.packbits(hands, axis=2, bitorder="little").view("<u4")[:, :, 0]
+
+
+def rank_deals(masks: np.ndarray) -> np.ndarray:
+    """
+    Ranks many deals at once.
+    :param masks: uint32 array (n_deals, 4) with the mask of each player's hand (see CardSet, deal_masks()).
+    :return: uint64 array (n_deals,) with the rank of each deal, in [0, N_DEALS).
+    """
+    hands = _unpack(masks)
+    assert hands.shape[1:] == (4, 32) and np.all(hands.sum(axis=2) == 8) and np.all(hands.sum(axis=1) == 1), \
+        "Not a valid deal."
+
+    n_deals = len(hands)
+    rank = np.zeros(n_deals, dtype=np.uint64)
+    remaining = np.ones((n_deals, 32), dtype=bool)
+    for i_p in range(3):
+        # Colex rank: the j-th card of the hand (j = 1..8) at position p among the remaining cards contributes C(p, j).
+        in_hand = hands[:, i_p]
+        card_ids = np.nonzero(in_hand)[1].reshape(n_deals, 8)
+        position = np.take_along_axis(np.cumsum(remaining, axis=1, dtype=np.int8), card_ids, axis=1) - 1
+        hand_rank = _COMB[position, _J].sum(axis=1, dtype=np.uint64)
+        rank = rank * np.uint64(_N_HANDS[i_p]) + hand_rank
+        remaining &= ~in_hand
+    return rank
+
+
+def unrank_deals(ranks: np.ndarray) -> np.ndarray:
+    """
+    The inverse of rank_deals().
+    :param ranks: int array (n_deals,) of ranks in [0, N_DEALS).
+    :return: uint32 array (n_deals, 4) with the mask of each player's hand (see CardSet).
+    """
+    ranks = np.asarray(ranks, dtype=np.uint64).reshape(-1)
+    assert np.all(ranks < np.uint64(N_DEALS)), "Not a valid deal rank."
+    n_deals = len(ranks)
+    rows = np.arange(n_deals)
+
+    # Split the rank into the hand ranks of Player 0, 1 and 2.
+    hand_ranks = []
+    for n_hands in reversed(_N_HANDS[1:]):
+        hand_ranks.append(ranks % np.uint64(n_hands))
+        ranks = ranks // np.uint64(n_hands)
+    hand_ranks.append(ranks)
+    hand_ranks.reverse()
+
+    hands = np.zeros((n_deals, 4, 32), dtype=bool)
+    remaining = np.ones((n_deals, 32), dtype=bool)
+    for i_p in range(3):
+        n_remaining = _N_REMAINING[i_p]
+        # Card ids of the remaining cards, ascending (each row has the same number of them).
+        remaining_ids = np.nonzero(remaining)[1].reshape(n_deals, n_remaining)
+        # Colex unranking: the j-th card is at the largest position p with C(p, j) <= the rest of the rank.
+        r = hand_ranks[i_p]
+        for j in range(8, 0, -1):
+            position = np.searchsorted(_COMB[:n_remaining, j], r, side="right") - 1
+            r = r - _COMB[position, j]
+            hands[rows, i_p, remaining_ids[rows, position]] = True
+        remaining &= ~hands[:, i_p]
+    hands[:, 3] = remaining
+    return np.packbits(hands, axis=2, bitorder="little").view("<u4")[:, :, 0]
+
+
+def rank_deal(hands: Sequence[Iterable[Card]]) -> int:
+    """
+    The rank of a single deal (same as rank_deals(), without the overhead of NumPy).
+    :param hands: the 4 hands of 8 cards (absolute player ids).
+    :return: int in [0, N_DEALS).
+    """
+    masks = [cards.mask if isinstance(cards, CardSet) else CardSet(cards).mask for cards in hands]
+    assert all(popcount(m) == 8 for m in masks) and masks[0] | masks[1] | masks[2] | masks[3] == 0xFFFFFFFF, "Not a valid deal."
+    rank = 0
+    remaining = 0xFFFFFFFF
+    for i_p in range(3):
+        hand_rank = 0
+        mask = masks[i_p]
+        j = 0
+        while mask:
+            low = mask & -mask
+            mask ^= low
+            j += 1
+            hand_rank += comb(popcount(remaining & (low - 1)), j)
+        rank = rank * _N_HANDS[i_p] + hand_rank
+        remaining &= ~masks[i_p]
+    return rank
+
+
+def unrank_deal(rank: int) -> List[CardSet]:
+    """
+    The deal with a certain rank (the inverse of rank_deal()).
+    :return: list(4) of CardSet, e.g. for DealExactly.
+    """
+    assert 0 <= rank < N_DEALS, "Not a valid deal rank."
+    hand_ranks = []
+    for n_hands in reversed(_N_HANDS[1:]):
+        rank, hand_rank = divmod(rank, n_hands)
+        hand_ranks.append(hand_rank)
+    hand_ranks.append(rank)
+    hand_ranks.reverse()
+
+    masks = []
+    remaining_ids = list(range(32))
+    for i_p in range(3):
+        r = hand_ranks[i_p]
+        positions = []
+        p = len(remaining_ids)
+        for j in range(8, 0, -1):
+            p -= 1
+            while comb(p, j) > r:
+                p -= 1
+            r -= comb(p, j)
+            positions.append(p)
+        masks.append(sum(1 << remaining_ids[p] for p in positions))
+        for p in positions:             # Descending, so the positions of the other cards don't change.
+            del remaining_ids[p]
+    masks.append(sum(1 << c for c in remaining_ids))
+    return [CardSet.from_mask(m) for m in masks]
@@ -1,7 +1,9 @@
 from enum import Enum
 from typing import Iterable, List
 
-from simulator.card_defs import Card, Pip, Suit
+import numpy as np
+
+from simulator.card_defs import Card, CardSet, Pip, Suit, new_deck, popcount
 
 
 class GameContract(Enum):
@@ -14,6 +16,10 @@ class GameContract(Enum):
         return self.name
 
 
+# Precomputed rule tables per game variant, see GameMode._build_tables().
+_RULE_TABLES = {}
+
+
 class GameMode:
     """
     The Game Mode stores all info about the variant of the game that is being played (contract, trump suit, ruf suit, ...)
@@ -23,7 +29,7 @@ class GameMode:
     def __init__(self, contract: GameContract, declaring_player_id, ruf_suit: Suit = None, trump_suit: Suit = None):
         # Here are a couple of checks that are just for data integrity.
         if contract == GameContract.rufspiel:
-            assert ruf_suit is not None
+            assert ruf_suit is not None and ruf_suit != Suit.herz, "Invalid ruf suit for Rufspiel: {}".format(ruf_suit)
             assert trump_suit is None or trump_suit == Suit.herz, "Invalid trump suit for Rufspiel: {}".format(trump_suit)
             trump_suit = Suit.herz
         else:
@@ -40,6 +46,8 @@ class GameMode:
         self.trump_suit = trump_suit
         self.ruf_suit = ruf_suit
 
+        self._build_tables()
+
     def __str__(self):
         if self.contract == GameContract.suit_solo:
             return "({} solo)".format(self.trump_suit.name)
@@ -48,6 +56,82 @@ class GameMode:
         else:
             return "({})".format(self.contract)
 
+    def _build_tables(self):
+        # The tables only depend on the variant, not on the declaring player. Build them once per variant and share them.
+        key = (self.contract, self.trump_suit, self.ruf_suit)
+        tables = _RULE_TABLES.get(key)
+        if tables is None:
+            tables = _RULE_TABLES[key] = self._compute_tables()
+        self.__dict__.update(tables)
+
+    def _compute_tables(self) -> dict:
+        # Precomputes bit masks (see CardSet) for quickly determining legal moves.
+        # As in is_play_allowed(), all trumps are moved into a special "trump suit" and do not belong to their original suit.
+        deck = new_deck()
+        trump_mask = 0
+        suit_masks = [0, 0, 0, 0]                       # Non-trump cards of each suit.
+        for card in deck:
+            if self.is_trump(card):
+                trump_mask |= 1 << card.id
+            else:
+                suit_masks[card.suit] |= 1 << card.id
+
+        # For each card: all cards of the same (true) suit, i.e. the cards that must be matched if this card is led.
+        true_suit_masks = [trump_mask if self.is_trump(card) else suit_masks[card.suit] for card in deck]
+
+        # Trick power of each card: the card with the highest power wins the trick, among the cards that are trump or match
+        # the suit of the first card (see get_trick_winner() for the values).
+        # Repeating these here because scoring should not depend on enum definitions.
+        suit_vals = {Suit.eichel: 40, Suit.gras: 30, Suit.herz: 20, Suit.schellen: 10}
+        pip_vals = {Pip.sau: 8, Pip.zehn: 7, Pip.koenig: 6, Pip.ober: 5, Pip.unter: 4, Pip.neun: 3, Pip.acht: 2, Pip.sieben: 1}
+        card_power = []
+        for card in deck:
+            if self.is_trump(card):
+                if card.pip == Pip.unter:
+                    power = 1100 + suit_vals[card.suit]
+                elif card.pip == Pip.ober:
+                    power = 1200 + suit_vals[card.suit]
+                else:
+                    power = 1000 + pip_vals[card.pip]
+            else:
+                power = pip_vals[card.pip]
+            card_power.append(power)
+
+        # For each first card of a trick: the cards that can take the trick (trumps and cards of the same true suit).
+        trick_taking_masks = [trump_mask | m for m in true_suit_masks]
+
+        # Rufspiel only: the Rufsau and the other (non-trump) cards of the ruf-suit.
+        rufsau_id = -1
+        rufsau_bit = 0
+        ruf_suit_mask = 0
+        ruf_non_sau_mask = 0
+        if self.contract == GameContract.rufspiel:
+            rufsau_id = Card(suit=self.ruf_suit, pip=Pip.sau).id
+            rufsau_bit = 1 << rufsau_id
+            ruf_suit_mask = suit_masks[self.ruf_suit]
+            ruf_non_sau_mask = ruf_suit_mask & ~rufsau_bit
+
+        def to_bools(mask: int) -> np.ndarray:
+            return np.array([(mask >> i) & 1 for i in range(32)], dtype=bool)
+
+        return {
+            "_trump_mask": trump_mask,
+            "_true_suit_masks": true_suit_masks,
+            "_card_power": card_power,
+            "_trick_taking_masks": trick_taking_masks,
+            "_rufsau_id": rufsau_id,
+            "_rufsau_bit": rufsau_bit,
+            "_ruf_suit_mask": ruf_suit_mask,
+            "_ruf_non_sau_mask": ruf_non_sau_mask,
+
+            # The same tables as arrays, for evaluating many hands or tricks at once.
+            "card_power": np.array(card_power, dtype=np.int32),
+            "trick_taking": np.stack([to_bools(m) for m in trick_taking_masks]),
+            "_true_suit_arrays": np.stack([to_bools(m) for m in true_suit_masks]),
+            "_ruf_suit_array": to_bools(ruf_suit_mask),
+            "_ruf_non_sau_array": to_bools(ruf_non_sau_mask),
+        }
+
     def is_trump(self, card: Card) -> bool:
         """
         Returns true if a card is trump in this game variant.
@@ -81,14 +165,17 @@ class GameMode:
 
         if len(cards_in_trick) == 0:
             # Player is leading.
-            if self.contract == GameContract.rufspiel and card.suit == self.ruf_suit:
-                # Player is playing ruf-suit.
+            if self.contract == GameContract.rufspiel and true_suit(card) == self.ruf_suit:
+                # Player is playing ruf-suit (Ober and Unter are trump and don't count).
                 if rufsau in cards_in_hand:
-                    # Player has the Rufsau. In that case, they are not allowed to play any card of ruf-suit unless:
-                    if len(cards_in_hand) == 1:
+                    # Player has the Rufsau. In that case, they are not allowed to play any other card of ruf-suit unless:
+                    if card == rufsau:
+                        # Leading with the Rufsau itself is always OK.
+                        return True
+                    elif len(cards_in_hand) == 1:
                         # If it's the only card left. TODO: or was it 2 instead of 1?
                         return True
-                    elif sum(c for c in cards_in_hand if true_suit(c) == true_suit(card)) >= 4:
+                    elif sum(1 for c in cards_in_hand if true_suit(c) == true_suit(card)) >= 4:
                         # They have 4 cards of the ruf-suit, which enables the "davonlaufen" maneuver.
                         # TODO: Check exact rules of Davonlaufen again. This leads to much argument in real life as well :)
                         return True
@@ -103,7 +190,7 @@ class GameMode:
 
         if true_suit(card) == true_suit(first_card):
             # Player is matching suit.
-            if self.contract == GameContract.rufspiel and card.suit == self.ruf_suit:
+            if self.contract == GameContract.rufspiel and true_suit(card) == self.ruf_suit:
                 # Player is matching the ruf-suit. If they have the ruf-sau, then they need to play it.
                 if card != rufsau and rufsau in cards_in_hand:
                     # Player has the ruf-sau but did not play it!
@@ -123,6 +210,70 @@ class GameMode:
 
         return True
 
+    def legal_moves(self, cards_in_hand: Iterable[Card], cards_in_trick: List[Card]) -> CardSet:
+        """
+        Returns all cards that a player is allowed to play. Same rules as is_play_allowed(), but for all cards at once.
+        :param cards_in_hand: all cards in the Player's hand (preferably a CardSet).
+        :param cards_in_trick: all cards in the current trick. Can be empty.
+        :return: a CardSet containing the cards that can be played under the game rules.
+        """
+        hand_mask = cards_in_hand.mask if isinstance(cards_in_hand, CardSet) else CardSet(cards_in_hand).mask
+        lead_card_id = cards_in_trick[0].id if len(cards_in_trick) > 0 else -1
+        return CardSet.from_mask(self.legal_moves_mask(hand_mask, lead_card_id))
+
+    def legal_moves_mask(self, hand_mask: int, lead_card_id: int = -1) -> int:
+        """
+        Bit mask version of legal_moves(), for callers that already work with masks (see CardSet).
+        :param hand_mask: mask of the cards in the Player's hand.
+        :param lead_card_id: id of the first card in the current trick, or -1 if the player is leading.
+        :return: mask of the cards that can be played.
+        """
+        rufsau_bit = self._rufsau_bit
+
+        if lead_card_id < 0:
+            # Player is leading. Any card is OK, except for the ruf-suit if the player has the Rufsau: then they can only
+            # play the Rufsau itself, unless they have 4 cards of that suit ("davonlaufen").
+            if hand_mask & rufsau_bit and popcount(hand_mask & self._ruf_suit_mask) < 4:
+                return hand_mask & ~self._ruf_non_sau_mask
+            return hand_mask
+
+        # Player is not leading, so they have to match the first card if they can.
+        matching = hand_mask & self._true_suit_masks[lead_card_id]
+        if matching:
+            if hand_mask & rufsau_bit:
+                # When matching the ruf-suit, the Rufsau needs to be played.
+                matching &= ~self._ruf_non_sau_mask
+            return matching
+
+        # Not matching because they can't. Not allowed to "schmier" the Rufsau if there is any other choice.
+        if hand_mask & rufsau_bit and hand_mask != rufsau_bit:
+            return hand_mask & ~rufsau_bit
+        return hand_mask
+
+    def legal_moves_batch(self, hands: np.ndarray, lead_card_ids: np.ndarray) -> np.ndarray:
+        """
+        Vectorized version of legal_moves(), for determining the legal moves in many games at once.
+        :param hands: bool array of shape (N, 32), the cards in each Player's hand (indexed by Card.id).
+        :param lead_card_ids: int array of shape (N,), the id of the first card in the current trick, or -1 if the player is leading.
+        :return: bool array of shape (N, 32), the cards that can be played.
+        """
+
+        leading = lead_card_ids < 0
+        matching = hands & self._true_suit_arrays[lead_card_ids]     # Rows of leading players are discarded below.
+        has_match = matching.any(axis=1)
+        legal = np.where((leading | ~has_match)[:, np.newaxis], hands, matching)
+
+        if self._rufsau_id >= 0:
+            # Rufspiel rules, see legal_moves_mask().
+            has_rufsau = hands[:, self._rufsau_id]
+            n_ruf_suit = (hands & self._ruf_suit_array).sum(axis=1)
+            must_play_rufsau = has_rufsau & ((leading & (n_ruf_suit < 4)) | (~leading & has_match))
+            legal &= ~(self._ruf_non_sau_array[np.newaxis, :] & must_play_rufsau[:, np.newaxis])
+            cant_schmier = ~leading & ~has_match & has_rufsau & (hands.sum(axis=1) > 1)
+            legal[cant_schmier, self._rufsau_id] = False
+
+        return legal
+
     def get_trick_winner(self, cards_in_trick: List[Card]) -> int:
         """
         Determines the index of the winning card in a trick.
@@ -132,40 +283,31 @@ class GameMode:
 
         assert len(cards_in_trick) == 4
 
-        # Assign values to all cards, and then pick the highest.
+        # Look up the power of all cards (precalculated in _build_tables()), and then pick the highest.
         # Ober:             1210 - 1240
         # Unter:            1110 - 1140
         # Trump suit:       1001 - 1008
-        # Non-trump suit:      1 -    8 (only if same suit as first card)
+        # Non-trump suit:      1 -    8 (only if same suit as first card, otherwise it can't win)
+        card_power = self._card_power
+        taking_mask = self._trick_taking_masks[cards_in_trick[0].id]
 
-        # Repeating these here because scoring should not depend on enum definitions.
-        suit_vals = {Suit.eichel: 40, Suit.gras: 30, Suit.herz: 20, Suit.schellen: 10}
-        pip_vals = {Pip.sau: 8, Pip.zehn: 7, Pip.koenig: 6, Pip.ober: 5, Pip.unter: 4, Pip.neun: 3, Pip.acht: 2, Pip.sieben: 1}
-
-        is_trump_first = self.is_trump(cards_in_trick[0])
-
-        i_highest = -1
-        val_highest = -1
-        for i_c, c in enumerate(cards_in_trick):
-            value = 0
-            if self.is_trump(c):
-                # Bonus points for being trump
-                value += 1000
-                if c.pip == Pip.unter:
-                    value += 100 + suit_vals[c.suit]                    # More bonus for being trump
-                elif c.pip == Pip.ober:
-                    value += 200 + suit_vals[c.suit]                    # Even more bonus for being trump, making Schafkopf great again (sorry)
-                else:
-                    value += pip_vals[c.pip]                            # Trump-suit cards are ranked according to pip.
-            else:
-                # Not trump = not so great :(
-                if not is_trump_first and c.suit == cards_in_trick[0].suit:
-                    # If the first card is also a non-trump suit (and this one matches it), then the higher pip wins.
-                    value += pip_vals[c.pip]
-
-            if value > val_highest:
-                val_highest = value
+        i_highest = 0
+        val_highest = card_power[cards_in_trick[0].id]
+        for i_c in range(1, 4):
+            card_id = cards_in_trick[i_c].id
+            if (taking_mask >> card_id) & 1 and card_power[card_id] > val_highest:
+                val_highest = card_power[card_id]
                 i_highest = i_c
-
-        assert i_highest >= 0
         return i_highest
+
+    def get_trick_winners(self, tricks: np.ndarray) -> np.ndarray:
+        """
+        Vectorized version of get_trick_winner(), for evaluating many tricks at once.
+        :param tricks: int array of shape (N, 4), containing the ids (see Card.id) of the cards in N complete tricks.
+        :return: int array of shape (N,), the index (0-3) of the winning card in each trick.
+        """
+
+        tricks = np.asarray(tricks)
+        assert tricks.ndim == 2 and tricks.shape[1] == 4
+        values = np.where(self.trick_taking[tricks[:, :1], tricks], self.card_power[tricks], 0)
+        return np.argmax(values, axis=1)
@@ -0,0 +1,153 @@
+"""
+Compact binary format for complete games, and a memory-mapped reader.
+
+A record file consists of a short header followed by fixed-width records (see GAME_RECORD_DTYPE). Each record holds everything
+needed to replay a game: the deal, the game mode, the dealer, all 32 cards in order of playing, and the result.
+Cards are stored by their id (see Card.id).
+
+Since the records are fixed-width, a file can be opened with load_game_records() as a NumPy memmap: millions of games are then
+available as structured arrays, without parsing or creating any Python objects.
+"""
+
+import os
+from typing import Iterable, List
+
+import numpy as np
+
+from simulator.card_defs import Card, CardSet, Suit, new_deck
+from simulator.game_mode import GameMode, GameContract
+
+_MAGIC = b"ASGR"
+_VERSION = 1
+
+GAME_RECORD_DTYPE = np.dtype([
+    ("deal", np.uint8, (4, 8)),         # Card ids in each player's hand (absolute player ids), ascending.
+    ("contract", np.uint8),             # Index into GameContract.
+    ("trump_suit", np.int8),            # -1 if None.
+    ("ruf_suit", np.int8),              # -1 if None.
+    ("declaring_player", np.uint8),
+    ("dealer", np.uint8),
+    ("plays", np.uint8, (32,)),         # Card ids in order of playing.
+    ("scores", np.uint8, (4,)),         # Points in the scored tricks of each player.
+    ("player_win", np.bool_, (4,)),
+])
+
+# Header: magic, version, record size.
+_HEADER_DTYPE = np.dtype([("magic", "S4"), ("version", "<u2"), ("record_size", "<u2")])
+
+_CONTRACTS = list(GameContract)
+
+
+def contract_code(contract: GameContract) -> int:
+    """ Returns the value stored in the "contract" field for a contract. """
+    return _CONTRACTS.index(contract)
+
+
+class GameRecordWriter:
+    """
+    Appends game records to a file. Records are buffered and written in blocks, call close() (or use as a context manager)
+    to make sure everything is written.
+    Pass it to a GameController (game_recorder=...) to record every game that is played.
+    """
+
+    def __init__(self, filename: str, buffer_size: int = 1024):
+        """
+        Opens a record file. If the file exists, new records are appended.
+        :param filename: the file to write.
+        :param buffer_size: number of records that are buffered before writing to disk.
+        """
+        exists = os.path.exists(filename) and os.path.getsize(filename) > 0
+        if exists:
+            _read_header(filename)              # Make sure we are appending to a compatible file.
+        self._file = open(filename, "ab")
+        if not exists:
+            header = np.array([(_MAGIC, _VERSION, GAME_RECORD_DTYPE.itemsize)], dtype=_HEADER_DTYPE)
+            self._file.write(header.tobytes())
+
+        self._buffer = np.zeros(buffer_size, dtype=GAME_RECORD_DTYPE)
+        self._n_buffered = 0
+
+    def write_game(self, hands: List[Iterable[Card]], game_mode: GameMode, i_player_dealer: int,
+                   played_cards: List[Card], player_scores: List[int], player_win: List[bool]):
+        """
+        Adds a single game.
+        :param hands: the 4 hands as dealt (absolute player ids).
+        :param game_mode: the game mode that was played.
+        :param i_player_dealer: the dealer of this game.
+        :param played_cards: all 32 cards in order of playing.
+        :param player_scores: the points scored by each player.
+        :param player_win: which player(s) won the game.
+        """
+
+        rec = self._buffer[self._n_buffered]
+        for i, hand in enumerate(hands):
+            rec["deal"][i] = [c.id for c in CardSet(hand)]
+        rec["contract"] = contract_code(game_mode.contract)
+        rec["trump_suit"] = -1 if game_mode.trump_suit is None else game_mode.trump_suit
+        rec["ruf_suit"] = -1 if game_mode.ruf_suit is None else game_mode.ruf_suit
+        rec["declaring_player"] = game_mode.declaring_player_id
+        rec["dealer"] = i_player_dealer
+        rec["plays"] = [c.id for c in played_cards]
+        rec["scores"] = player_scores
+        rec["player_win"] = player_win
+
+        self._n_buffered += 1
+        if self._n_buffered == len(self._buffer):
+            self.flush()
+
+    def write_records(self, records: np.ndarray):
+        """ Adds many games at once, as an array of GAME_RECORD_DTYPE (e.g. from a batched simulator). """
+        self.flush()
+        self._file.write(np.ascontiguousarray(records, dtype=GAME_RECORD_DTYPE).tobytes())
+
+    def flush(self):
+        if self._n_buffered > 0:
+            self._file.write(self._buffer[:self._n_buffered].tobytes())
+            self._n_buffered = 0
+        self._file.flush()
+
+    def close(self):
+        if not self._file.closed:
+            self.flush()
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def _read_header(filename: str) -> int:
+    # Checks the header and returns its size.
+    header = np.fromfile(filename, dtype=_HEADER_DTYPE, count=1)
+    if len(header) != 1 or header["magic"][0] != _MAGIC:
+        raise ValueError(f'"{filename}" is not a game record file.')
+    if header["version"][0] != _VERSION or header["record_size"][0] != GAME_RECORD_DTYPE.itemsize:
+        raise ValueError(f'"{filename}" has an unsupported version ({header["version"][0]}).')
+    return _HEADER_DTYPE.itemsize
+
+
+def load_game_records(filename: str) -> np.ndarray:
+    """
+    Opens a record file as a read-only memmap. Nothing is loaded until the data is accessed.
+    :return: array of GAME_RECORD_DTYPE, e.g. records["scores"] is an array of shape (N, 4).
+    """
+    offset = _read_header(filename)
+    n_records = (os.path.getsize(filename) - offset) // GAME_RECORD_DTYPE.itemsize
+    if n_records == 0:
+        return np.zeros(0, dtype=GAME_RECORD_DTYPE)
+    return np.memmap(filename, dtype=GAME_RECORD_DTYPE, mode="r", offset=offset, shape=(n_records,))
+
+
+def record_hands(record) -> List[CardSet]:
+    """ Returns the dealt hands of a single record. Use with DealExactly to replay the game. """
+    deck = new_deck()
+    return [CardSet(deck[i] for i in hand) for hand in record["deal"]]
+
+
+def record_game_mode(record) -> GameMode:
+    """ Returns the game mode of a single record. """
+    return GameMode(_CONTRACTS[record["contract"]], declaring_player_id=int(record["declaring_player"]),
+                    ruf_suit=None if record["ruf_suit"] < 0 else Suit(int(record["ruf_suit"])),
+                    trump_suit=None if record["trump_suit"] < 0 else Suit(int(record["trump_suit"])))
@@ -3,6 +3,7 @@ from enum import Enum
 import yaml
 from itertools import chain
 
+from simulator.card_defs import CardSet
 from simulator.player_agent import PlayerAgent
 from simulator.game_mode import GameMode
 from utils.event_util import Event
@@ -13,7 +14,7 @@ class Player:
         self.name = name
         self.agent = agent
 
-        self.cards_in_hand = set()              # Unordered
+        self.cards_in_hand = CardSet()          # Unordered
         self.cards_in_scored_tricks = []        # Order of playing may be important
 
     def __str__(self):
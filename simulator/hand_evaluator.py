@@ -0,0 +1,136 @@
+from typing import Iterable, Tuple
+
+import numpy as np
+
+from simulator.card_defs import Card, CardSet, Pip, Suit, popcount
+from simulator.game_mode import GameMode, GameContract
+from utils.log_util import get_class_logger
+
+
+# Number of canonical hand keys, see solo_key() and wenz_key().
+N_SOLO_KEYS = 16 * 16 * 7 * 4 * 4
+N_WENZ_KEYS = 16 * 5 * 5 * 4
+
+# Masks of the cards of each suit, the Obers, Unters and Saus (see CardSet).
+_SUIT_MASKS = [0xFF << (8 * suit) for suit in Suit]
+_OBER_MASK = sum(1 << (8 * suit + Pip.ober - 1) for suit in Suit)
+_UNTER_MASK = sum(1 << (8 * suit + Pip.unter - 1) for suit in Suit)
+_SAU_MASK = sum(1 << (8 * suit + Pip.sau - 1) for suit in Suit)
+_ZEHN_MASK = sum(1 << (8 * suit + Pip.zehn - 1) for suit in Suit)
+
+
+def _suit_bits(hand_mask: int, pip: Pip) -> int:
+    # 4 bits: which suits of a certain pip (e.g. the Obers) are in the hand. Bit i = Suit i.
+    i = pip - 1
+    return (hand_mask >> i & 1) | (hand_mask >> (i + 7) & 2) | (hand_mask >> (i + 14) & 4) | (hand_mask >> (i + 21) & 8)
+
+
+def _n_voids(mask: int) -> int:
+    # Number of suits without any card in the mask.
+    return (mask & 0xFF == 0) + (mask & 0xFF00 == 0) + (mask & 0xFF0000 == 0) + (mask & 0xFF000000 == 0)
+
+
+def solo_key(hand_mask: int, trump_suit: Suit) -> int:
+    """
+    Canonical key of a hand for a suit solo: which Obers and Unters the hand has, the number of the other trumps, the number of
+    non-trump Saus and the number of missing non-trump suits (voids). Hands with the same key are (nearly) equally strong.
+    :param hand_mask: the hand as a card mask (see CardSet).
+    :return: int in [0, N_SOLO_KEYS).
+    """
+    obers = _suit_bits(hand_mask, Pip.ober)
+    unters = _suit_bits(hand_mask, Pip.unter)
+    plain = hand_mask & ~(_OBER_MASK | _UNTER_MASK)
+    n_plain_trumps = popcount(plain & _SUIT_MASKS[trump_suit])
+    n_saus = popcount(plain & _SAU_MASK & ~_SUIT_MASKS[trump_suit])
+    n_voids = _n_voids(plain | _SUIT_MASKS[trump_suit])
+    return (((obers * 16 + unters) * 7 + n_plain_trumps) * 4 + n_saus) * 4 + n_voids
+
+
+def wenz_key(hand_mask: int) -> int:
+    """
+    Canonical key of a hand for a Wenz: which Unters the hand has, the number of Saus, the number of Zehns with the Sau of
+    the same suit, and the number of missing suits (voids).
+    :param hand_mask: the hand as a card mask (see CardSet).
+    :return: int in [0, N_WENZ_KEYS).
+    """
+    unters = _suit_bits(hand_mask, Pip.unter)
+    plain = hand_mask & ~_UNTER_MASK
+    n_saus = popcount(plain & _SAU_MASK)
+    n_zehns_with_sau = popcount(plain & _ZEHN_MASK & (plain & _SAU_MASK) >> 1)
+    n_voids = min(_n_voids(plain), 3)
+    return ((unters * 5 + n_saus) * 5 + n_zehns_with_sau) * 4 + n_voids
+
+
+def _coarse_solo_keys() -> np.ndarray:
+    # For each solo key: number of trumps * 5 + number of Obers.
+    keys = np.arange(N_SOLO_KEYS)
+    n_plain_trumps = keys // 16 % 7
+    unters = keys // (16 * 7) % 16
+    obers = keys // (16 * 7 * 16)
+    n_obers = np.array([popcount(b) for b in range(16)])[obers]
+    n_unters = np.array([popcount(b) for b in range(16)])[unters]
+    return (n_obers + n_unters + n_plain_trumps) * 5 + n_obers
+
+
+def _coarse_wenz_keys() -> np.ndarray:
+    # For each Wenz key: number of Unters * 5 + number of Saus.
+    keys = np.arange(N_WENZ_KEYS)
+    n_saus = keys // (4 * 5) % 5
+    unters = keys // (4 * 5 * 5)
+    return np.array([popcount(b) for b in range(16)])[unters] * 5 + n_saus
+
+
+class HandEvaluator:
+    """
+    Estimates the probability of winning a suit solo or Wenz with a hand, by looking up its canonical key (see solo_key() and
+    wenz_key()) in a table of simulated games (see build_hand_evaluator.py). Evaluating a hand costs a few microseconds.
+
+    Keys that were rarely simulated are shrunk towards a coarser estimate (by the number of trumps, and Obers or Saus).
+    """
+
+    def __init__(self, filename: str, prior_games: float = 10.):
+        """
+        :param filename: the .npz file written by build_hand_evaluator.py.
+        :param prior_games: weight (in games) of the coarse estimate, for keys with few simulated games.
+        """
+        self.logger = get_class_logger(self)
+        tables = np.load(filename)
+        self.logger.debug("Loaded hand evaluator tables from {} ({} solo games, {} Wenz games)".format(
+            filename, tables["solo_games"].sum(), tables["wenz_games"].sum()))
+        self._solo_probs = self._estimate(tables["solo_wins"], tables["solo_games"], _coarse_solo_keys(), prior_games).tolist()
+        self._wenz_probs = self._estimate(tables["wenz_wins"], tables["wenz_games"], _coarse_wenz_keys(), prior_games).tolist()
+
+    @staticmethod
+    def _estimate(wins: np.ndarray, games: np.ndarray, coarse_keys: np.ndarray, prior_games: float) -> np.ndarray:
+        # Win probability per key: the observed rate, shrunk towards the rate of the coarse key (which has a uniform prior).
+        coarse_wins = np.bincount(coarse_keys, weights=wins)
+        coarse_games = np.bincount(coarse_keys, weights=games)
+        coarse_probs = (coarse_wins + 1) / (coarse_games + 2)
+        return (wins + prior_games * coarse_probs[coarse_keys]) / (games + prior_games)
+
+    def win_probability(self, cards_in_hand: Iterable[Card], contract: GameContract, trump_suit: Suit = None) -> float:
+        """
+        Estimated probability that the declaring player wins a game with this hand.
+        :param cards_in_hand: the 8 cards of the declaring player.
+        :param contract: suit_solo or wenz.
+        :param trump_suit: the trump suit (suit solo only).
+        """
+        hand_mask = cards_in_hand.mask if isinstance(cards_in_hand, CardSet) else CardSet(cards_in_hand).mask
+        if contract == GameContract.suit_solo:
+            return self._solo_probs[solo_key(hand_mask, trump_suit)]
+        if contract == GameContract.wenz:
+            return self._wenz_probs[wenz_key(hand_mask)]
+        raise ValueError(f"Can't evaluate hands for {contract}.")
+
+    def best_game(self, cards_in_hand: Iterable[Card], player_id: int) -> Tuple[GameMode, float]:
+        """
+        The game mode (suit solo or Wenz) with the highest estimated win probability for a hand.
+        :return: tuple (game mode with player_id as the declaring player, win probability).
+        """
+        hand_mask = cards_in_hand.mask if isinstance(cards_in_hand, CardSet) else CardSet(cards_in_hand).mask
+        best_contract, best_suit, best_prob = GameContract.wenz, None, self._wenz_probs[wenz_key(hand_mask)]
+        for suit in Suit:
+            prob = self._solo_probs[solo_key(hand_mask, suit)]
+            if prob > best_prob:
+                best_contract, best_suit, best_prob = GameContract.suit_solo, suit, prob
+        return GameMode(best_contract, declaring_player_id=player_id, trump_suit=best_suit), best_prob
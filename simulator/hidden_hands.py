@@ -0,0 +1,215 @@
+import math
+from typing import Iterable, List, Optional, Sequence
+
+import numpy as np
+
+from simulator.card_defs import Card, CardSet, PIP_SCORES, popcount
+from simulator.game_mode import GameMode, GameContract
+
+
+class CardTracker:
+    """
+    Keeps track of what a player knows about the hidden cards during a game: which cards have been played and by whom,
+    which cards the other players can't have (because they didn't follow suit), and the points each player has taken.
+    Search agents use it for sampling the hidden hands of the other players (see HiddenHandSampler).
+
+    Usage: call reset() when a new game starts, observe_turn() at the start of each play_card(), and observe_trick() from
+    notify_trick_result().
+    """
+
+    def __init__(self, player_id: int):
+        self.player_id = player_id
+        self.reset()
+
+    def reset(self):
+        """ Forgets everything about the current game. """
+        self.game_mode = None                   # type: Optional[GameMode]
+        self.played_mask = 0                    # Cards of completed tricks.
+        self.void_masks = [0, 0, 0, 0]          # Per player: cards that the player can't have.
+        self.n_played = [0, 0, 0, 0]            # Per player: number of cards in completed tricks.
+        self.scored_points = [0, 0, 0, 0]       # Per player: points of the tricks taken so far.
+        self.trick_leader = None                # Player who leads the current trick.
+        self.rufsau_player = None               # Rufspiel only: the player who played the Rufsau (i.e. the partner).
+
+    def observe_turn(self, cards_in_hand: Iterable[Card], cards_in_trick: List[Card], game_mode: GameMode):
+        """
+        Must be called when it's the player's turn (at the start of play_card()).
+        """
+        self.game_mode = game_mode
+        self.trick_leader = (self.player_id - len(cards_in_trick)) % 4
+        # The cards of the current trick will be observed again in observe_trick(), but the voids are needed now.
+        self._observe_voids(cards_in_trick)
+
+    def observe_trick(self, cards_in_trick: List[Card], rel_taker_id: int):
+        """
+        Must be called with the result of each trick (from notify_trick_result()).
+        """
+        assert self.trick_leader is not None and len(cards_in_trick) == 4
+        self._observe_voids(cards_in_trick)
+        for i, card in enumerate(cards_in_trick):
+            i_p = (self.trick_leader + i) % 4
+            self.played_mask |= 1 << card.id
+            self.n_played[i_p] += 1
+            if self.game_mode.contract == GameContract.rufspiel and card.id == self.game_mode._rufsau_id:
+                self.rufsau_player = i_p
+
+        # The winner takes the points and leads the next trick.
+        winner = (self.player_id - rel_taker_id) % 4
+        self.scored_points[winner] += sum(PIP_SCORES[c.pip] for c in cards_in_trick)
+        self.trick_leader = winner
+
+    def _observe_voids(self, cards_in_trick: List[Card]):
+        # A player who doesn't follow the (true) suit of the first card has no more cards of that suit.
+        if len(cards_in_trick) == 0:
+            return
+        suit_mask = self.game_mode._true_suit_masks[cards_in_trick[0].id]
+        for i, card in enumerate(cards_in_trick[1:], start=1):
+            if not (suit_mask >> card.id) & 1:
+                self.void_masks[(self.trick_leader + i) % 4] |= suit_mask
+
+    def partner_id(self, cards_in_trick: List[Card]) -> Optional[int]:
+        """
+        Rufspiel only: the partner of the declaring player, if the Rufsau has already been played (possibly in the current trick).
+        """
+        if self.rufsau_player is not None:
+            return self.rufsau_player
+        for i, card in enumerate(cards_in_trick):
+            if card.id == self.game_mode._rufsau_id:
+                return (self.trick_leader + i) % 4
+        return None
+
+    def hand_sizes(self, cards_in_trick: List[Card]) -> List[int]:
+        """
+        Number of cards that each player has in hand right now.
+        """
+        sizes = [8 - n for n in self.n_played]
+        for i in range(len(cards_in_trick)):
+            sizes[(self.trick_leader + i) % 4] -= 1
+        return sizes
+
+    def hidden_mask(self, cards_in_hand: Iterable[Card], cards_in_trick: List[Card]) -> int:
+        """
+        Mask of the cards that the other players have in hand (unknown to this player).
+        """
+        hand_mask = cards_in_hand.mask if isinstance(cards_in_hand, CardSet) else CardSet(cards_in_hand).mask
+        return 0xFFFFFFFF & ~(hand_mask | self.played_mask | CardSet(cards_in_trick).mask)
+
+    def possible_masks(self, cards_in_hand: Iterable[Card], cards_in_trick: List[Card]) -> List[int]:
+        """
+        Per player: mask of the hidden cards that the player can have (0 for this player, whose hand is known).
+        """
+        hidden = self.hidden_mask(cards_in_hand, cards_in_trick)
+        return [0 if i_p == self.player_id else hidden & ~self.void_masks[i_p] for i_p in range(4)]
+
+    def sample_hands(self, cards_in_hand: Iterable[Card], cards_in_trick: List[Card], n_samples: int) -> List[List[int]]:
+        """
+        Samples hands of the other players, uniformly among all deals that are consistent with everything observed so far.
+        :return: list of n_samples deals, each a list of the 4 hands as bit masks (see CardSet). The own hand is always the real one.
+        """
+        sizes = self.hand_sizes(cards_in_trick)
+        sizes[self.player_id] = 0
+        hands = HiddenHandSampler(self.possible_masks(cards_in_hand, cards_in_trick), sizes).sample(n_samples)
+        hands[:, self.player_id] = cards_in_hand.mask if isinstance(cards_in_hand, CardSet) else CardSet(cards_in_hand).mask
+        return hands.tolist()
+
+
+class HiddenHandSampler:
+    """
+    Deals hidden cards to players who each can only have some of them (e.g. because they didn't follow suit), exactly uniformly
+    among all possible deals, without rejection.
+
+    The cards are grouped into classes by the set of players who can have them - cards of a class are interchangeable.
+    A deal is determined by how many cards of each class each player gets (an "allocation"), and by which cards these are.
+    All allocations are enumerated and weighted by their number of deals (a product of multinomial coefficients). Sampling then
+    picks allocations by weight and shuffles the cards within each class, vectorized for many samples at once.
+    """
+
+    def __init__(self, possible_masks: Sequence[int], hand_sizes: Sequence[int]):
+        """
+        :param possible_masks: per player, the mask of cards (see CardSet) that the player can have.
+                               Every hidden card must be possible for at least one player.
+        :param hand_sizes: per player, the number of cards to deal to them.
+        """
+        self.n_players = len(possible_masks)
+        hidden = 0
+        for m in possible_masks:
+            hidden |= m
+        assert popcount(hidden) == sum(hand_sizes), "Number of hidden cards doesn't match the hand sizes."
+
+        # Classes of cards, by the players who can have them.
+        classes = {}
+        for card_id in range(32):
+            if (hidden >> card_id) & 1:
+                players = tuple(i for i, m in enumerate(possible_masks) if (m >> card_id) & 1)
+                classes.setdefault(players, []).append(card_id)
+        self._classes = list(classes.items())
+
+        # Per class index: the number of cards of this and the following classes that each player can have.
+        n_available = [[0] * self.n_players for _ in range(len(self._classes) + 1)]
+        for i_class in reversed(range(len(self._classes))):
+            players, card_ids = self._classes[i_class]
+            n_available[i_class] = [n + (len(card_ids) if i in players else 0) for i, n in enumerate(n_available[i_class + 1])]
+
+        # Enumerate the allocations: per class, the player of each of its cards (in class order), and their weights.
+        allocations = []
+        weights = []
+
+        def allocate(i_class: int, capacity: List[int], seats: List[List[int]], weight: int):
+            if i_class == len(self._classes):
+                allocations.append([list(s) for s in seats])
+                weights.append(weight)
+                return
+            players, card_ids = self._classes[i_class]
+            for counts in _compositions(len(card_ids), [capacity[i] for i in players]):
+                new_capacity = list(capacity)
+                class_seats = []
+                for i, k in zip(players, counts):
+                    new_capacity[i] -= k
+                    class_seats += [i] * k
+                # Skip allocations that can't be completed by the remaining classes.
+                if any(new_capacity[i] > n_available[i_class + 1][i] for i in range(self.n_players)):
+                    continue
+                allocate(i_class + 1, new_capacity, seats + [class_seats], weight * _multinomial(counts))
+
+        allocate(0, list(hand_sizes), [], 1)
+        assert len(allocations) > 0, "There is no deal that is consistent with the constraints."
+
+        self.n_deals = sum(weights)             # The number of different consistent deals.
+        self._probs = np.array(weights, dtype=np.float64) / self.n_deals
+        # Per class: array (n_allocations, n_cards_in_class) with the player of each card.
+        self._class_seats = [np.array([a[i] for a in allocations], dtype=np.int64).reshape(len(allocations), -1)
+                             for i in range(len(self._classes))]
+
+    def sample(self, n_samples: int) -> np.ndarray:
+        """
+        Draws random deals.
+        :return: uint32 array (n_samples, n_players) with the mask of each player's hand (see CardSet).
+        """
+        i_alloc = np.random.choice(len(self._probs), size=n_samples, p=self._probs)
+        hands = np.zeros((n_samples, self.n_players, 32), dtype=bool)
+        rows = np.arange(n_samples)[:, np.newaxis]
+        for (players, card_ids), class_seats in zip(self._classes, self._class_seats):
+            seats = class_seats[i_alloc]
+            # Shuffle which card of the class goes to which of the seats.
+            perm = np.argsort(np.random.random(seats.shape), axis=1)
+            hands[rows, np.take_along_axis(seats, perm, axis=1), np.array(card_ids)] = True
+        return np.packbits(hands, axis=2, bitorder="little").view("<u4")[:, :, 0]
+
+
+def _compositions(n: int, capacities: List[int]):
+    # All ways of splitting n items into len(capacities) parts with part i <= capacities[i].
+    if len(capacities) == 1:
+        if n <= capacities[0]:
+            yield (n,)
+        return
+    for k in range(min(n, capacities[0]) + 1):
+        for rest in _compositions(n - k, capacities[1:]):
+            yield (k,) + rest
+
+
+def _multinomial(counts: Sequence[int]) -> int:
+    # Number of ways of splitting sum(counts) distinct items into groups of the given sizes.
+    result = math.factorial(sum(counts))
+    for k in counts:
+        result //= math.factorial(k)
+    return result
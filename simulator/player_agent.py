@@ -28,6 +28,14 @@ class PlayerAgent(ABC):
         """
         pass                # Must be implemented by all agents
 
+    def declare_game(self, cards_in_hand: Iterable[Card]) -> Optional[GameMode]:
+        """
+        Asks the agent whether it wants to play a game (bidding phase). Every player is asked once, starting left of the dealer.
+        :param cards_in_hand: the 8 cards which the player has been dealt.
+        :return: Optional - a suit solo or Wenz with this player as the declaring player, or None to pass.
+        """
+        return None         # Default implementation: pass
+
     def notify_trick_result(self, cards_in_trick: List[Card], rel_taker_id: int):
         """
         Notifies the agent of the result of the current trick.
@@ -53,6 +61,12 @@ class PlayerAgent(ABC):
         """
         pass                # Default implementation: do nothing
 
+    def close(self):
+        """
+        Releases the resources of the agent (e.g. worker processes). The agent is not used anymore afterwards.
+        """
+        pass                # Default implementation: do nothing
+
     def internal_card_values(self) -> Optional[Dict[Card, float]]:
         """
         Gets internal values (e.g. q-values) for each Card for display.
@@ -0,0 +1,628 @@
+import contextlib
+import time
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+try:
+    import numba
+except ImportError:
+    numba = None
+
+from simulator.card_defs import Card, CardSet, Pip, PIP_SCORES, new_deck
+from simulator.game_mode import GameMode, GameContract
+
+
+class SolverTimeout(Exception):
+    """ Raised when the solver runs past its deadline. """
+    pass
+
+
+# Size of the transposition table (number of entries, a power of 2), and the number of slots that are probed for an entry.
+_TT_BITS = 20
+_TT_PROBES = 4
+
+# Rows of the table array that the search gets (see DoubleDummySolver._build_tables()).
+_POWER = 0
+_POINTS = 1
+_TAKING = 2                 # Cards that can take a trick led by the card (GameMode._trick_taking_masks).
+_TRUE_SUIT = 3              # Cards that must be matched if the card is led (GameMode._true_suit_masks).
+_TRUMPS = 4                 # Ids of the trumps by descending power, followed by -1.
+_POINTS_MASKS = 5           # Pairs of (points, mask of the cards with these points), followed by 0.
+_RULES = 6                  # Rufsau bit, ruf-suit mask, ruf-suit mask without the Rufsau (see GameMode.legal_moves_mask()),
+                            # mask of the cards without points.
+_BEATING = 7                # Per card, the cards with more trick power (they take the trick if they are in the _TAKING mask).
+_STRONGER = 8               # 32 rows: per card, masks of the stronger cards of its "taking group", see _build_tables().
+
+# Number of masks per card in the _STRONGER rows.
+_N_LAYERS = 3
+
+# Entries of the stats array: number of searched nodes, timeout flag, generation of the transposition table.
+_N_NODES = 0
+_TIMED_OUT = 1
+_TT_GEN = 2
+
+# Compiles the search functions (cached on disk). Without Numba, the same code runs as plain Python: the results are the same
+# (the arithmetic never overflows 64-bit integers), but the search is a few hundred times slower.
+if numba is not None:
+    _jit = numba.njit(cache=True)
+    _objmode = numba.objmode
+else:
+    def _jit(func):
+        return func
+
+    def _objmode(**kwargs):
+        return contextlib.nullcontext()
+
+
+@_jit
+def _popcount(x):
+    # Number of bits set in a card mask (x < 2^32).
+    x = x - ((x >> 1) & 0x55555555)
+    x = (x & 0x33333333) + ((x >> 2) & 0x33333333)
+    x = (x + (x >> 4)) & 0x0F0F0F0F
+    return ((x * 0x01010101) & 0xFFFFFFFF) >> 24
+
+
+# Fields of the search stack (see _search()), one row per ply.
+_LEADER = 0
+_N_IN_TRICK = 1
+_LEAD_ID = 2
+_WIN_ID = 3
+_WINNER = 4
+_TRICK_POINTS = 5
+_IN_TRICK = 6
+_REMAINING = 7
+_ALPHA = 8
+_BETA = 9
+_ALPHA_ORIG = 10
+_BETA_ORIG = 11
+_GAINED = 12                # Points that the declaring side took with the move that led to this node.
+_BEST = 13
+_BEST_MOVE = 14
+_N_MOVES = 15
+_I_MOVE = 16
+_TT_SLOT = 17
+_TT_KEY = 18
+_TT_LO = 19
+_TT_HI = 20
+_POINTS_LEFT = 21           # Points of the cards in the hands.
+_N_FIELDS = 22
+
+# Marks that a node has no value yet.
+_NO_VALUE = -1000
+
+
+@_jit
+def _search(tab, tt, stack, moves, hands, is_decl, stats, deadline, leader, n_in_trick, lead_id, win_id, winner, trick_points,
+            in_trick, remaining, alpha, beta):
+    # Returns the points of the declaring side in the remaining tricks (fail-soft alpha-beta).
+    # The current trick: n_in_trick cards (mask in_trick), the first card lead_id. win_id is the currently winning card, played
+    # by the player winner. remaining is the mask of all cards in the hands. The hands (modified during the search) don't
+    # contain the cards in the trick.
+    # The search is not recursive (Numba compiles recursive functions slowly, and can't cache them reliably): stack holds the
+    # state of each node on the current path (one row per ply), moves its moves (sorted) and their sort keys.
+    tt_mask = (1 << _TT_BITS) - 1
+    gen = stats[_TT_GEN]
+
+    # The helper functions are closures over the arrays. Numba inlines them into the search, so the arrays are not passed in
+    # function calls (which costs reference counting on every call - the search would be about 2x slower).
+
+    def legal_moves(hand, lead_id):
+        # Same as GameMode.legal_moves_mask().
+        rufsau_bit = tab[_RULES, 0]
+        if lead_id < 0:
+            if hand & rufsau_bit and _popcount(hand & tab[_RULES, 1]) < 4:
+                return hand & ~tab[_RULES, 2]
+            return hand
+        matching = hand & tab[_TRUE_SUIT, lead_id]
+        if matching:
+            if hand & rufsau_bit:
+                matching &= ~tab[_RULES, 2]
+            return matching
+        if hand & rufsau_bit and hand != rufsau_bit:
+            return hand & ~rufsau_bit
+        return hand
+
+    def trick_start_value(d):
+        # Checks the bounds and the transposition table for the node at the start of a trick (ply d). Returns the value of the
+        # node if that is enough (otherwise _NO_VALUE), and narrows the window of the node. Sets up the transposition table
+        # entry of the node, and its best move from an earlier search (or -1).
+        leader, remaining, alpha, beta = stack[d, _LEADER], stack[d, _REMAINING], stack[d, _ALPHA], stack[d, _BETA]
+        stack[d, _BEST_MOVE] = -1
+        if remaining == 0:
+            return 0
+        # Upper bound: all remaining points.
+        max_points = stack[d, _POINTS_LEFT]
+        if max_points <= alpha:
+            return max_points
+        if beta <= 0:
+            return 0
+
+        lead_hand = hands[leader]
+        if lead_hand & (lead_hand - 1) == 0:
+            # Last trick: everybody has only one card left.
+            best_id = _popcount(lead_hand - 1)
+            i_win = 0
+            for i in range(1, 4):
+                c = _popcount(hands[(leader + i) & 3] - 1)
+                if (tab[_TAKING, best_id] >> c) & 1 and tab[_POWER, c] > tab[_POWER, best_id]:
+                    best_id, i_win = c, i
+            return max_points if is_decl[(leader + i_win) & 3] else 0
+
+        # Quick bounds: a trump that is stronger than all remaining trumps of the other side goes to its side, no matter when it
+        # is played (the trick is taken by it, or by an even stronger trump of the same side). This holds for the run of the
+        # strongest remaining trumps that belong to one side.
+        decl_hand = 0
+        for i in range(4):
+            if is_decl[i]:
+                decl_hand |= hands[i]
+        sure_points = 0
+        side = -1
+        i = 0
+        while tab[_TRUMPS, i] >= 0:
+            c = tab[_TRUMPS, i]
+            i += 1
+            if (remaining >> c) & 1:
+                in_decl = (decl_hand >> c) & 1
+                if side < 0:
+                    side = in_decl
+                elif in_decl != side:
+                    break
+                sure_points += tab[_POINTS, c]
+        if side == 1 and sure_points >= beta:
+            return sure_points
+        if side == 0 and max_points - sure_points <= alpha:
+            return max_points - sure_points
+
+        # Transposition table lookup (bounds of the exact value, and the best move). Only positions at the start of a trick are
+        # stored: they are determined by the remaining cards and the leading player, which fit into a small integer key.
+        key = remaining | leader << 32
+        home = (((key & tt_mask) * 0x9E3779B1) ^ (key >> 15)) & tt_mask
+        stack[d, _TT_KEY] = key
+        stack[d, _TT_SLOT] = home           # If all probed slots are taken, the first one is replaced.
+        stack[d, _TT_LO], stack[d, _TT_HI] = 0, 120
+        for i in range(_TT_PROBES):
+            slot = (home + i) & tt_mask
+            data = tt[slot, 1]
+            if data >> 24 != gen:
+                # Free slot (or an entry of an earlier deal): the position is not stored.
+                stack[d, _TT_SLOT] = slot
+                break
+            if tt[slot, 0] == key:
+                stack[d, _TT_SLOT] = slot
+                lo, hi = data & 0xFF, (data >> 8) & 0xFF
+                stack[d, _TT_LO], stack[d, _TT_HI], stack[d, _BEST_MOVE] = lo, hi, ((data >> 16) & 0xFF) - 1
+                if lo >= beta:
+                    return lo
+                if hi <= alpha or lo == hi:
+                    return hi
+                if lo > alpha:
+                    stack[d, _ALPHA] = lo
+                if hi < beta:
+                    stack[d, _BETA] = hi
+                break
+        return _NO_VALUE
+
+    def mid_trick_value(d):
+        # Bounds for a node in the middle of a trick (ply d): if none of the players who still have to play can take the trick
+        # for the other side, the side that is winning it gets its points (at least those of the cheapest cards that can be
+        # added). Returns the bound if it causes a cutoff, otherwise _NO_VALUE.
+        leader, n_in_trick, lead_id, win_id = stack[d, _LEADER], stack[d, _N_IN_TRICK], stack[d, _LEAD_ID], stack[d, _WIN_ID]
+        win_decl = is_decl[stack[d, _WINNER]]
+        # Quick check whether the bound can be enough: each card that is still to be played has at most 11 points.
+        if win_decl:
+            if stack[d, _TRICK_POINTS] + 11 * (4 - n_in_trick) < stack[d, _BETA]:
+                return _NO_VALUE
+        elif stack[d, _POINTS_LEFT] - 11 * (4 - n_in_trick) > stack[d, _ALPHA]:
+            return _NO_VALUE
+        # (Cards of the winning side may take the trick over, which only makes it harder for the other side.)
+        taking = tab[_TAKING, lead_id] & tab[_BEATING, win_id]
+        min_points = 0
+        for k in range(n_in_trick, 4):
+            i_p = (leader + k) & 3
+            legal = legal_moves(hands[i_p], lead_id)
+            if is_decl[i_p] != win_decl and legal & taking:
+                return _NO_VALUE
+            if legal & tab[_RULES, 3] == 0:
+                i = 0
+                while legal & tab[_POINTS_MASKS, i + 1] == 0:
+                    i += 2
+                min_points += tab[_POINTS_MASKS, i]
+        if win_decl:
+            value = stack[d, _TRICK_POINTS] + min_points
+            if value >= stack[d, _BETA]:
+                return value
+            return _NO_VALUE
+        value = stack[d, _POINTS_LEFT] - min_points
+        if value <= stack[d, _ALPHA]:
+            return value
+        return _NO_VALUE
+
+    def generate_moves(d, hand, maximizing, tt_move):
+        # Collects the moves of the current player (at ply d) into moves[d] (sorted), skipping equivalent cards (the strongest
+        # card of a group of equivalent cards is kept). Returns the number of moves.
+        n_in_trick, lead_id, win_id = stack[d, _N_IN_TRICK], stack[d, _LEAD_ID], stack[d, _WIN_ID]
+        legal = legal_moves(hand, lead_id)
+        present = stack[d, _REMAINING] | stack[d, _IN_TRICK]
+        partner_winning = n_in_trick > 0 and is_decl[stack[d, _WINNER]] == maximizing
+        n_moves = 0
+        rest = legal
+        while rest:
+            low = rest & -rest
+            rest ^= low
+            card_id = _popcount(low - 1)
+            # The card is equivalent to the next stronger card that is still present, if it is in the same hand and has the same
+            # points.
+            equivalent = False
+            for j in range(_N_LAYERS):
+                stronger = present & tab[_STRONGER + card_id, j]
+                if stronger:
+                    stronger &= -stronger
+                    equivalent = legal & stronger != 0 and tab[_POINTS, _popcount(stronger - 1)] == tab[_POINTS, card_id]
+                    break
+            if equivalent:
+                continue
+
+            # Move ordering: the leader plays high cards first. If the partner is winning, give them points. If an opponent is
+            # winning, take the trick as cheaply as possible, otherwise throw the cheapest card. The best move of a previous
+            # search comes first.
+            if card_id == tt_move:
+                sort_key = -100000
+            elif n_in_trick == 0:
+                sort_key = -tab[_POWER, card_id]
+            elif partner_winning:
+                sort_key = -tab[_POINTS, card_id]
+            elif (tab[_TAKING, lead_id] >> card_id) & 1 and tab[_POWER, card_id] > tab[_POWER, win_id]:
+                sort_key = tab[_POWER, card_id]
+            else:
+                sort_key = 10000 + tab[_POINTS, card_id]
+            # Insertion sort.
+            j = n_moves
+            while j > 0 and moves[d, 1, j - 1] > sort_key:
+                moves[d, 0, j] = moves[d, 0, j - 1]
+                moves[d, 1, j] = moves[d, 1, j - 1]
+                j -= 1
+            moves[d, 0, j] = card_id
+            moves[d, 1, j] = sort_key
+            n_moves += 1
+        return n_moves
+
+
+    d = 0
+    stack[0, _LEADER], stack[0, _N_IN_TRICK], stack[0, _LEAD_ID] = leader, n_in_trick, lead_id
+    stack[0, _WIN_ID], stack[0, _WINNER], stack[0, _TRICK_POINTS] = win_id, winner, trick_points
+    stack[0, _IN_TRICK], stack[0, _REMAINING], stack[0, _GAINED] = in_trick, remaining, 0
+    stack[0, _ALPHA], stack[0, _BETA] = alpha, beta
+    points_left = 0
+    i = 0
+    while tab[_POINTS_MASKS, i]:
+        points_left += tab[_POINTS_MASKS, i] * _popcount(remaining & tab[_POINTS_MASKS, i + 1])
+        i += 2
+    stack[0, _POINTS_LEFT] = points_left
+    entering = True
+    value = 0
+    while True:
+        leader, n_in_trick, remaining = stack[d, _LEADER], stack[d, _N_IN_TRICK], stack[d, _REMAINING]
+        i_p = (leader + n_in_trick) & 3
+        maximizing = is_decl[i_p]
+
+        if entering:
+            # A new node.
+            entering = False
+            value = _NO_VALUE
+            stats[_N_NODES] += 1
+            if deadline > 0 and stats[_N_NODES] & 4095 == 0:
+                with _objmode(now="float64"):
+                    now = time.monotonic()
+                if now > deadline:
+                    stats[_TIMED_OUT] = 1
+                    return 0
+
+            tt_move = -1
+            stack[d, _TT_SLOT] = -1
+            if n_in_trick == 0:
+                value = trick_start_value(d)
+                tt_move = stack[d, _BEST_MOVE]
+            else:
+                value = mid_trick_value(d)
+
+            if value == _NO_VALUE:
+                stack[d, _ALPHA_ORIG], stack[d, _BETA_ORIG] = stack[d, _ALPHA], stack[d, _BETA]
+                stack[d, _BEST] = -1 if maximizing else 999
+                stack[d, _BEST_MOVE] = -1
+                stack[d, _I_MOVE] = 0
+                stack[d, _N_MOVES] = generate_moves(d, hands[i_p], maximizing, tt_move)
+        else:
+            # value is the result of the last move of this node.
+            card_id = moves[d, 0, stack[d, _I_MOVE] - 1]
+            hands[i_p] ^= 1 << card_id
+            value += stack[d + 1, _GAINED]
+            if maximizing:
+                if value > stack[d, _BEST]:
+                    stack[d, _BEST], stack[d, _BEST_MOVE] = value, card_id
+                    if value > stack[d, _ALPHA]:
+                        stack[d, _ALPHA] = value
+            else:
+                if value < stack[d, _BEST]:
+                    stack[d, _BEST], stack[d, _BEST_MOVE] = value, card_id
+                    if value < stack[d, _BETA]:
+                        stack[d, _BETA] = value
+            value = _NO_VALUE
+
+        if value == _NO_VALUE:
+            i_move = stack[d, _I_MOVE]
+            if stack[d, _ALPHA] < stack[d, _BETA] and i_move < stack[d, _N_MOVES]:
+                # Play the next move.
+                card_id = moves[d, 0, i_move]
+                stack[d, _I_MOVE] = i_move + 1
+                bit = 1 << card_id
+                hands[i_p] ^= bit
+                e = d + 1
+                stack[e, _REMAINING] = remaining ^ bit
+                stack[e, _POINTS_LEFT] = stack[d, _POINTS_LEFT] - tab[_POINTS, card_id]
+                stack[e, _ALPHA], stack[e, _BETA], stack[e, _GAINED] = stack[d, _ALPHA], stack[d, _BETA], 0
+                stack[e, _LEADER] = leader
+                if n_in_trick == 0:
+                    stack[e, _N_IN_TRICK], stack[e, _LEAD_ID], stack[e, _WIN_ID], stack[e, _WINNER] = 1, card_id, card_id, i_p
+                    stack[e, _TRICK_POINTS], stack[e, _IN_TRICK] = tab[_POINTS, card_id], bit
+                else:
+                    lead_id, win_id, winner = stack[d, _LEAD_ID], stack[d, _WIN_ID], stack[d, _WINNER]
+                    if (tab[_TAKING, lead_id] >> card_id) & 1 and tab[_POWER, card_id] > tab[_POWER, win_id]:
+                        win_id, winner = card_id, i_p
+                    trick_points = stack[d, _TRICK_POINTS] + tab[_POINTS, card_id]
+                    if n_in_trick == 3:
+                        # Trick is complete: the winner takes the points and leads the next trick.
+                        gained = trick_points if is_decl[winner] else 0
+                        stack[e, _LEADER], stack[e, _N_IN_TRICK], stack[e, _LEAD_ID], stack[e, _WIN_ID] = winner, 0, -1, -1
+                        stack[e, _WINNER], stack[e, _TRICK_POINTS], stack[e, _IN_TRICK] = -1, 0, 0
+                        stack[e, _ALPHA] -= gained
+                        stack[e, _BETA] -= gained
+                        stack[e, _GAINED] = gained
+                    else:
+                        stack[e, _N_IN_TRICK], stack[e, _LEAD_ID], stack[e, _WIN_ID], stack[e, _WINNER] = \
+                            n_in_trick + 1, lead_id, win_id, winner
+                        stack[e, _TRICK_POINTS], stack[e, _IN_TRICK] = trick_points, stack[d, _IN_TRICK] | bit
+                d = e
+                entering = True
+                continue
+
+            # All moves are searched (or cut off).
+            value = stack[d, _BEST]
+            slot = stack[d, _TT_SLOT]
+            if slot >= 0:
+                lo, hi = stack[d, _TT_LO], stack[d, _TT_HI]
+                if value <= stack[d, _ALPHA_ORIG]:
+                    hi = min(hi, value)
+                elif value >= stack[d, _BETA_ORIG]:
+                    lo = max(lo, value)
+                else:
+                    lo = hi = value
+                tt[slot, 0] = stack[d, _TT_KEY]
+                tt[slot, 1] = lo | hi << 8 | (stack[d, _BEST_MOVE] + 1) << 16 | gen << 24
+
+        # Return the value to the parent.
+        if d == 0:
+            return value
+        d -= 1
+
+
+class DoubleDummySolver:
+    """
+    Perfect-information ("double dummy") solver: given all four hands, computes the card points that the declaring side takes
+    in the remaining tricks, assuming perfect play by both sides.
+
+    Alpha-beta search over single card plays (null-window searches that narrow down the value from above, see _solve()), with
+    - move generation on bit masks (see CardSet and GameMode.legal_moves_mask()),
+    - a transposition table for the positions at the start of a trick, keyed on the mask of all remaining cards and the leading
+      player (the hands are fully determined by these, since the deal is fixed for a solver call). It stores bounds of the
+      value and the best move, which is tried first when the position is searched again,
+    - move ordering by trick power: the leader plays high cards first, followers first try to take the trick as cheaply as
+      possible, or give points to their partner,
+    - merging of equivalent cards: cards of the same player that are adjacent in trick power (no remaining card of another
+      player in between) and have the same points lead to the same result, so only one of them needs to be searched,
+    - quick bounds at the start of a trick: all remaining points, and the points of the strongest trumps that are certain to
+      go to one side. In the middle of a trick: the points of the trick, if the other side can't take it anymore.
+
+    The search runs as compiled code (Numba), on the precomputed tables of the game mode. The first call in a process compiles it
+    (a few seconds), or loads it from Numba's cache. A full deal then takes 0.05 - 0.15 s on average for random deals, and
+    0.3 - 0.6 s for deals in which the declaring player has a good hand (see benchmark_solver.py). Single deals can take a few
+    seconds. Numba is optional: without it, the search runs as plain Python, which is only good enough for the last tricks.
+
+    The transposition table is kept between calls for the same deal (e.g. when solving all moves of a position, or successive
+    positions of a game). It is cleared automatically when the hands don't belong to the same deal anymore.
+    """
+
+    def __init__(self, game_mode: GameMode):
+        """
+        :param game_mode: the game mode that is being played.
+        """
+        self.game_mode = game_mode
+        self._deck = new_deck()
+        self._tab = self._build_tables()
+
+        # Entries of the transposition table: key, and the bounds + best move + generation (8 bits each, generation on top).
+        self._tt = np.zeros((1 << _TT_BITS, 2), dtype=np.int64)
+        self._stack = np.zeros((33, _N_FIELDS), dtype=np.int64)        # Search stack and moves, see _search().
+        self._moves = np.zeros((33, 2, 8), dtype=np.int64)
+        self._stats = np.zeros(3, dtype=np.int64)
+        self._stats[_TT_GEN] = 1
+        self._deal_key = None
+        self.n_nodes = 0
+
+    def _build_tables(self) -> np.ndarray:
+        # Collects the tables of the game mode that the search needs into one array (see the row indices at the top).
+        game_mode = self.game_mode
+        power = game_mode._card_power
+        points = [PIP_SCORES[c.pip] for c in self._deck]
+        tab = np.full((_STRONGER + 32, 33), -1, dtype=np.int64)
+        tab[_POWER, :32] = power
+        tab[_POINTS, :32] = points
+        tab[_TAKING, :32] = game_mode._trick_taking_masks
+        tab[_TRUE_SUIT, :32] = game_mode._true_suit_masks
+
+        trumps = sorted((i for i in range(32) if (game_mode._trump_mask >> i) & 1), key=lambda i: -power[i])
+        tab[_TRUMPS, :len(trumps)] = trumps
+
+        # Masks of the cards with a certain number of points (for quickly adding up the points of many cards).
+        tab[_POINTS_MASKS] = 0
+        for i, p in enumerate(sorted(set(points) - {0})):
+            tab[_POINTS_MASKS, 2 * i] = p
+            tab[_POINTS_MASKS, 2 * i + 1] = sum(1 << c for c in range(32) if points[c] == p)
+
+        tab[_RULES, :3] = [game_mode._rufsau_bit, game_mode._ruf_suit_mask, game_mode._ruf_non_sau_mask]
+        tab[_RULES, 3] = sum(1 << c for c in range(32) if points[c] == 0)
+        tab[_BEATING, :32] = [sum(1 << j for j in range(32) if power[j] > power[i]) for i in range(32)]
+
+        # For each card: the stronger cards of the same "taking group" (trumps, or non-trump cards of one suit), split into layers
+        # in which the power ascends with the card id (e.g. trumps of the trump suit, Unters, Obers). The weakest stronger card is
+        # then the lowest bit of the first layer that has any of the cards. Used for detecting equivalent cards.
+        tab[_STRONGER:] = 0
+        for i in range(32):
+            group = game_mode._true_suit_masks[i]
+            stronger = sorted((j for j in range(32) if (group >> j) & 1 and power[j] > power[i]), key=lambda j: power[j])
+            layer = 0
+            for k, j in enumerate(stronger):
+                if k > 0 and j < stronger[k - 1]:
+                    layer += 1
+                assert layer < _N_LAYERS
+                tab[_STRONGER + i, layer] |= 1 << j
+        return tab
+
+    def reset(self):
+        """ Clears the transposition table. """
+        # Entries of older generations count as free.
+        self._stats[_TT_GEN] += 1
+        if self._stats[_TT_GEN] == 1 << 30:
+            self._tt[:] = 0
+            self._stats[_TT_GEN] = 1
+        self._deal_key = None
+
+    def declaring_side(self, hands: Sequence[Iterable[Card]], partner_id: Optional[int] = None) -> List[int]:
+        """
+        Determines the players of the declaring side: the declaring player, and in a Rufspiel also the player with the Rufsau.
+        :param hands: the current hands of all 4 players.
+        :param partner_id: Optional - the partner of the declaring player (needed in a Rufspiel once the Rufsau has been played).
+        """
+        decl = self.game_mode.declaring_player_id
+        if self.game_mode.contract != GameContract.rufspiel:
+            return [decl]
+        if partner_id is None:
+            rufsau = Card(self.game_mode.ruf_suit, Pip.sau)
+            partner_id = next((i for i, h in enumerate(hands) if rufsau in h), None)
+            assert partner_id is not None, "Rufsau has already been played, need to specify the partner."
+        return sorted({decl, partner_id})
+
+    def solve(self, hands: Sequence[Iterable[Card]], leading_player: int, cards_in_trick: List[Card] = (),
+              declaring_side: Optional[Iterable[int]] = None, deadline: Optional[float] = None,
+              target: Optional[int] = None) -> int:
+        """
+        Computes the points that the declaring side takes in the remaining tricks (including the current trick).
+        :param hands: the current hands of all 4 players (absolute player ids, preferably CardSets).
+        :param leading_player: the player who leads the current trick.
+        :param cards_in_trick: the cards that have already been played in the current trick.
+        :param declaring_side: Optional - the players of the declaring side. Default: see declaring_side().
+        :param deadline: Optional - a time.monotonic() value. If the search is not finished by then, SolverTimeout is raised.
+        :param target: Optional - only decide whether the declaring side takes at least this many points. This needs a single
+                       null-window search (instead of several for the exact value), but the result is only a bound: it is
+                       >= target if the declaring side reaches the target, otherwise < target.
+        :return: the points (0-120) the declaring side takes from now on, with perfect play.
+        """
+        masks = [h.mask if isinstance(h, CardSet) else CardSet(h).mask for h in hands]
+        if declaring_side is None:
+            declaring_side = self.declaring_side(hands)
+        return self._solve(masks, leading_player, [c.id for c in cards_in_trick], declaring_side, deadline, target)
+
+    def solve_moves(self, hands: Sequence[Iterable[Card]], leading_player: int, cards_in_trick: List[Card] = (),
+                    declaring_side: Optional[Iterable[int]] = None, deadline: Optional[float] = None,
+                    target: Optional[int] = None) -> Dict[Card, int]:
+        """
+        Computes the value of each legal move of the current player (the next one to play in the current trick).
+        The parameters are the same as for solve().
+        :return: dict of card -> points that the declaring side takes from now on if that card is played (with perfect play afterwards).
+        """
+        masks = [h.mask if isinstance(h, CardSet) else CardSet(h).mask for h in hands]
+        if declaring_side is None:
+            declaring_side = self.declaring_side(hands)
+        trick = [c.id for c in cards_in_trick]
+        i_p = (leading_player + len(trick)) % 4
+        lead_id = trick[0] if trick else -1
+        legal = self.game_mode.legal_moves_mask(masks[i_p], lead_id)
+
+        values = {}
+        while legal:
+            low = legal & -legal
+            legal ^= low
+            card_id = low.bit_length() - 1
+            masks[i_p] ^= low
+            values[self._deck[card_id]] = self._solve(masks, leading_player, trick + [card_id], declaring_side, deadline, target)
+            masks[i_p] ^= low
+        return values
+
+    def _solve(self, masks: List[int], leading_player: int, trick: List[int], declaring_side: Iterable[int],
+               deadline: Optional[float], target: Optional[int]) -> int:
+        # Runs the search. masks are the hands, without the cards in the trick.
+
+        # The transposition table is only valid for one deal, i.e. the hands at the start of the current trick must not contain
+        # any card that they didn't have before (cards of earlier tricks are gone, so they don't matter).
+        trick_start_hands = list(masks)
+        for i, card_id in enumerate(trick):
+            trick_start_hands[(leading_player + i) % 4] |= 1 << card_id
+        deal_key = (tuple(trick_start_hands), tuple(sorted(declaring_side)))
+        if self._deal_key is None or deal_key[1] != self._deal_key[1] \
+                or any(m & ~old for m, old in zip(deal_key[0], self._deal_key[0])):
+            self.reset()
+        self._deal_key = deal_key
+
+        power = self._tab[_POWER]
+        points = self._tab[_POINTS]
+        taking_masks = self._tab[_TAKING]
+        is_decl = np.array([i in declaring_side for i in range(4)], dtype=np.int64)
+
+        # Set up the current trick. The cards in the trick are not part of any hand.
+        remaining = masks[0] | masks[1] | masks[2] | masks[3]
+        state = (leading_player, 0, -1, -1, -1, 0, 0)
+        gained = 0
+        for i, card_id in enumerate(trick):
+            leader, n_in_trick, lead_id, win_id, winner, trick_points, in_trick = state
+            i_p = (leading_player + i) % 4
+            if i == 0:
+                state = (leader, 1, card_id, card_id, i_p, int(points[card_id]), 1 << card_id)
+            else:
+                if (int(taking_masks[lead_id]) >> card_id) & 1 and power[card_id] > power[win_id]:
+                    win_id, winner = card_id, i_p
+                state = (leader, n_in_trick + 1, lead_id, win_id, winner, trick_points + int(points[card_id]),
+                         in_trick | 1 << card_id)
+            if i == 3:
+                # The trick is complete already.
+                winner = state[4]
+                gained = state[5] if is_decl[winner] else 0
+                state = (winner, 0, -1, -1, -1, 0, 0)
+
+        args = (self._tab, self._tt, self._stack, self._moves, np.array(masks, dtype=np.int64), is_decl, self._stats,
+                deadline if deadline is not None else 0.) + state + (remaining,)
+        stats = self._stats
+        stats[_N_NODES] = 0
+        stats[_TIMED_OUT] = 0
+
+        def test(beta: int) -> int:
+            # Null-window search: the result is >= beta if the declaring side takes at least beta points, otherwise < beta.
+            value = int(_search(*args, beta - 1, beta))
+            if stats[_TIMED_OUT]:
+                raise SolverTimeout()
+            return value
+
+        try:
+            if target is not None:
+                return gained + test(target - gained)
+            # Narrow down the exact value with null-window searches, starting from above (MTD): as long as a search fails low,
+            # it returns an upper bound of the value, which is tested next. The first search that fails high has found the
+            # value. Searches that fail low are cheap, while a search that fails high needs a proof for every move of the
+            # other side.
+            upper = 120
+            while True:
+                value = test(upper)
+                if value >= upper:
+                    return gained + upper
+                upper = value
+        finally:
+            self.n_nodes += int(stats[_N_NODES])
@@ -0,0 +1,198 @@
+from typing import Optional, Tuple
+
+import numpy as np
+
+from simulator.card_defs import new_deck, PIP_SCORES
+from simulator.controller.dealing_behavior import DealFairly
+from simulator.game_mode import GameMode
+from simulator.game_record import GAME_RECORD_DTYPE, contract_code
+
+
+class VectorGameEnv:
+    """
+    Batched simulator engine: plays N independent games in lockstep, with all state kept in NumPy arrays.
+
+    Plays the same games as a GameController with forced_game_mode: the rules and scoring are those of GameMode/GameController,
+    the player left of the dealer leads the first trick, and the dealer is shifted clockwise after every game.
+    Since every game has exactly 32 moves, all games are always at the same trick and position in the trick - only the
+    acting player differs between games (depending on who took the previous trick).
+
+    Cards are represented by their id (see Card.id). Usage:
+        legal = env.reset()
+        while not env.done:
+            legal = env.step(policy(legal))             # One card id per game, for the acting player of each game.
+        wins = env.player_wins()
+    """
+
+    def __init__(self, n_games: int, game_mode: GameMode, i_player_dealer: int = 0):
+        """
+        Creates the engine. Call reset() to deal the first games.
+        :param n_games: number of games that are played in parallel.
+        :param game_mode: the game mode that is played in all games. Must provide a specific declaring player.
+        :param i_player_dealer: the player who is the dealer in the first games.
+        """
+        assert game_mode.declaring_player_id is not None, "Must provide a specific player."
+
+        self.n_games = n_games
+        self.game_mode = game_mode
+        self._rows = np.arange(n_games)
+        self._card_points = np.array([PIP_SCORES[c.pip] for c in new_deck()], dtype=np.int32)
+
+        # Main state. hands[n, i_p, card_id] is True if player i_p holds the card in game n.
+        self.hands = np.zeros((n_games, 4, 32), dtype=bool)
+        self.i_player_dealer = np.full(n_games, i_player_dealer, dtype=np.int64)
+        self.leading_player = np.zeros(n_games, dtype=np.int64)
+        self.current_player = np.zeros(n_games, dtype=np.int64)
+
+        # Cards in the current trick, in order of playing (-1 = not yet played). Same number of cards in all games.
+        self.current_trick_cards = np.full((n_games, 4), -1, dtype=np.int64)
+        self.n_cards_in_trick = 0
+        self.i_trick = 0
+
+        # All cards in order of playing, and the players who played them.
+        self.played_cards = np.full((n_games, 32), -1, dtype=np.int64)
+        self.played_by = np.full((n_games, 32), -1, dtype=np.int64)
+
+        # Points in the scored tricks of each player.
+        self.scores = np.zeros((n_games, 4), dtype=np.int32)
+
+        self.done = True
+        self._legal = np.zeros((n_games, 32), dtype=bool)
+        self._started = False
+
+    def reset(self, hands: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Starts new games in all N slots. If games were played before, the dealer is shifted clockwise.
+        :param hands: Optional - bool array (N, 4, 32) of hands to deal, indexed by absolute player id. Default: deal fairly.
+        :return: bool array (N, 32): the legal moves of the acting player in each game.
+        """
+
+        if self._started:
+            self.i_player_dealer = (self.i_player_dealer + 1) % 4
+        self._started = True
+
+        if hands is None:
+            hands = DealFairly().deal_hands_batch(self.n_games)
+        assert hands.shape == (self.n_games, 4, 32) and np.all(hands.sum(axis=2) == 8)
+        self.hands[...] = hands
+
+        # Left of dealer leads the first trick.
+        self.leading_player[:] = (self.i_player_dealer + 1) % 4
+        self.current_player[:] = self.leading_player
+        self.current_trick_cards[:] = -1
+        self.n_cards_in_trick = 0
+        self.i_trick = 0
+        self.played_cards[:] = -1
+        self.played_by[:] = -1
+        self.scores[:] = 0
+        self.done = False
+
+        self._update_legal()
+        return self._legal
+
+    def step(self, card_ids: np.ndarray) -> np.ndarray:
+        """
+        Plays one card in every game, for the acting player of that game.
+        :param card_ids: int array (N,) with the id of the card to play in each game. Must be legal moves.
+        :return: bool array (N, 32): the legal moves of the next acting player in each game (all False once the games are done).
+        """
+
+        assert not self.done, "Games are finished. Need to call reset() first."
+        card_ids = np.asarray(card_ids)
+        if not np.all(self._legal[self._rows, card_ids]):
+            raise ValueError("Tried to play a card that is not allowed in games {}!".format(
+                np.flatnonzero(~self._legal[self._rows, card_ids])))
+
+        i_play = self.i_trick * 4 + self.n_cards_in_trick
+        self.hands[self._rows, self.current_player, card_ids] = False
+        self.current_trick_cards[:, self.n_cards_in_trick] = card_ids
+        self.played_cards[:, i_play] = card_ids
+        self.played_by[:, i_play] = self.current_player
+        self.n_cards_in_trick += 1
+
+        if self.n_cards_in_trick < 4:
+            self.current_player = (self.current_player + 1) % 4
+        else:
+            # Trick is complete. The winner scores the points and leads the next trick.
+            i_win_card = self.game_mode.get_trick_winners(self.current_trick_cards)
+            i_win_player = (self.leading_player + i_win_card) % 4
+            self.scores[self._rows, i_win_player] += self._card_points[self.current_trick_cards].sum(axis=1)
+
+            self.leading_player = i_win_player
+            self.current_player = i_win_player.copy()
+            self.current_trick_cards[:] = -1
+            self.n_cards_in_trick = 0
+            self.i_trick += 1
+            self.done = self.i_trick == 8
+
+        if self.done:
+            self._legal[:] = False
+        else:
+            self._update_legal()
+        return self._legal
+
+    def current_hands(self) -> np.ndarray:
+        """ Returns a bool array (N, 32): the hand of the acting player in each game. """
+        return self.hands[self._rows, self.current_player]
+
+    def player_wins(self) -> np.ndarray:
+        """
+        Determines the winners after all games are finished (scored like GameController: the declaring player needs more than 60).
+        :return: bool array (N, 4) indicating which player(s) won each game.
+        """
+
+        assert self.done
+        i_decl = self.game_mode.declaring_player_id
+        decl_won = self.scores[:, i_decl] > 60
+        is_decl = np.arange(4) == i_decl
+        return np.where(decl_won[:, np.newaxis], is_decl[np.newaxis, :], ~is_decl[np.newaxis, :])
+
+    def game_records(self) -> np.ndarray:
+        """
+        Converts the finished games into game records, e.g. for GameRecordWriter.write_records().
+        :return: array (N,) of GAME_RECORD_DTYPE.
+        """
+
+        assert self.done
+        gm = self.game_mode
+        records = np.zeros(self.n_games, dtype=GAME_RECORD_DTYPE)
+        # The dealt hands are exactly the cards played by each player.
+        order = np.lexsort((self.played_cards, self.played_by), axis=1)
+        records["deal"] = np.take_along_axis(self.played_cards, order, axis=1).reshape(self.n_games, 4, 8)
+        records["contract"] = contract_code(gm.contract)
+        records["trump_suit"] = -1 if gm.trump_suit is None else gm.trump_suit
+        records["ruf_suit"] = -1 if gm.ruf_suit is None else gm.ruf_suit
+        records["declaring_player"] = gm.declaring_player_id
+        records["dealer"] = self.i_player_dealer
+        records["plays"] = self.played_cards
+        records["scores"] = self.scores
+        records["player_win"] = self.player_wins()
+        return records
+
+    def _update_legal(self):
+        lead_card_ids = self.current_trick_cards[:, 0] if self.n_cards_in_trick > 0 else np.full(self.n_games, -1)
+        self._legal = self.game_mode.legal_moves_batch(self.current_hands(), lead_card_ids)
+
+
+def random_legal_moves(legal: np.ndarray) -> np.ndarray:
+    """
+    Batched policy that picks a random legal card in every game (like RandomCardAgent).
+    :param legal: bool array (N, 32), as returned by VectorGameEnv.reset() and step().
+    :return: int array (N,) of card ids.
+    """
+    return np.argmax(np.random.random(legal.shape) * legal, axis=1)
+
+
+def run_games(env: VectorGameEnv, policy=random_legal_moves, hands: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Plays one batch of games, with all players acting according to a batched policy.
+    :param env: the engine.
+    :param policy: function that maps the legal moves (N, 32) to card ids (N,). Use a closure if it needs to read the env.
+    :param hands: Optional - hands to deal, see VectorGameEnv.reset().
+    :return: the scores (N, 4) and winners (N, 4) of all games.
+    """
+
+    legal = env.reset(hands)
+    while not env.done:
+        legal = env.step(policy(legal))
+    return env.scores.copy(), env.player_wins()
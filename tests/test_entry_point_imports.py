@@ -0,0 +1,45 @@
+"""
+The entry points must start quickly if only the simple agents are used: the heavy libraries (TensorFlow, Numba, PyGame) are only
+imported by the agents or parts that need them (see agents/registry.py). The imports are checked in a fresh interpreter, since
+the test process may have imported anything.
+"""
+
+import os
+import subprocess
+import sys
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY_MODULES = ["tensorflow", "numba", "pygame"]
+
+
+def run_and_check_imports(script: str):
+    # Runs the script in a fresh interpreter, then checks that none of the heavy modules has been imported.
+    script += "\nimport sys\nimported = [m for m in {} if m in sys.modules]\nassert not imported, imported\n".format(HEAVY_MODULES)
+    env = dict(os.environ, PYTHONPATH=REPO_DIR)
+    result = subprocess.run([sys.executable, "-c", script], cwd=REPO_DIR, env=env, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+
+
+def test_eval_baseline_agent_imports():
+    run_and_check_imports("""
+import eval_baseline_agent
+from agents.registry import create_agent
+
+for name in ["rule", "static", "random"]:
+    create_agent(name, 0)
+""")
+
+
+def test_play_with_gui_imports():
+    run_and_check_imports("""
+import logging
+import play_with_gui
+
+for i, name in enumerate(["rule", "static", "random", "user"]):
+    play_with_gui.create_player(i, name, None, logging.getLogger())
+""")
+
+
+def test_eval_rl_agent_imports():
+    run_and_check_imports("import eval_rl_agent")
@@ -7,10 +7,8 @@ import os
 import shutil
 from collections import deque
 
-from agents.dummy.random_card_agent import RandomCardAgent
-from agents.reinforcment_learning.dqn_agent import DQNAgent
-from agents.rule_based.rule_based_agent import RuleBasedAgent
-from simulator.controller.dealing_behavior import DealWinnableHand
+from agents.registry import create_agent
+from simulator.controller.dealing_behavior import DealWinnableHand, DealFromCorpus
 from simulator.controller.game_controller import GameController
 from simulator.card_defs import Suit
 from simulator.game_mode import GameContract, GameMode
@@ -44,18 +42,14 @@ def main():
     os.makedirs(config["experiment_dir"], exist_ok=True)
     agent_checkpoint_paths = {i: os.path.join(experiment_dir, name) for i, name in config["training"]["agent_checkpoint_names"].items()}
 
-    # Create agents.
+    # Create agents (see agents/registry.py for the names). The DQNAgent is the one that is trained.
     agents = []
     for i in range(4):
         x = config["training"]["player_agents"][i]
         if x == "DQNAgent":
-            agent = DQNAgent(i, config=config, training=True)
-        elif x == "RandomCardAgent":
-            agent = RandomCardAgent(i)
-        elif x == "RuleBasedAgent":
-            agent = RuleBasedAgent(i)
+            agent = create_agent(x, i, config=config, training=True)
         else:
-            raise ValueError(f'Unknown agent type: "{x}"')
+            agent = create_agent(x, i)
         agents.append(agent)
 
     # Load weights for agents.
@@ -68,8 +62,15 @@ def main():
     players = [Player(f"Player {i} ({a.__class__.__name__})", agent=a) for i, a in enumerate(agents)]
 
     # Rig the game so Player 0 has the cards to play a Herz-Solo. Force them to play it.
+    # Optionally, the deals are taken (randomly) from a pre-generated deal corpus.
     game_mode = GameMode(GameContract.suit_solo, trump_suit=Suit.herz, declaring_player_id=0)
-    controller = GameController(players, dealing_behavior=DealWinnableHand(game_mode), forced_game_mode=game_mode)
+    deal_corpus = config["training"].get("deal_corpus")
+    if deal_corpus is not None:
+        logger.info(f'Dealing from corpus "{deal_corpus}".')
+        dealing_behavior = DealFromCorpus(deal_corpus, game_mode, mode="random")
+    else:
+        dealing_behavior = DealWinnableHand(game_mode)
+    controller = GameController(players, dealing_behavior=dealing_behavior, forced_game_mode=game_mode, fast=True)
 
     n_episodes = config["training"]["n_episodes"]
     logger.info(f"Will train for {n_episodes} episodes.")